@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Era, Chemist, HistoricalEvent, ChatHistory
+from .models import (
+    Era, Chemist, HistoricalEvent, Conversation, ChatHistory, ChatSummary, PrecomputedAnswer, LLMUsageRollup
+)
 
 @admin.register(Era)
 class EraAdmin(admin.ModelAdmin):
@@ -10,7 +12,7 @@ class EraAdmin(admin.ModelAdmin):
 @admin.register(Chemist)
 class ChemistAdmin(admin.ModelAdmin):
     list_display = ('name', 'birth_year', 'death_year', 'era', 'position_x', 'position_y', 'position_z')
-    list_filter = ('era',)
+    list_filter = ('era', 'response_cache_enabled')
     search_fields = ('name', 'description')
     ordering = ('birth_year',)
 
@@ -21,9 +23,38 @@ class HistoricalEventAdmin(admin.ModelAdmin):
     search_fields = ('title', 'description')
     ordering = ('year',)
 
+@admin.register(Conversation)
+class ConversationAdmin(admin.ModelAdmin):
+    list_display = ('id', 'chemist', 'user', 'session_key', 'created_at', 'last_active_at')
+    list_filter = ('chemist',)
+    search_fields = ('id', 'session_key', 'user__username')
+    readonly_fields = ('created_at',)
+
 @admin.register(ChatHistory)
 class ChatHistoryAdmin(admin.ModelAdmin):
-    list_display = ('chemist', 'role', 'content', 'timestamp')
+    list_display = ('chemist', 'conversation', 'role', 'content', 'timestamp')
     list_filter = ('chemist', 'role')
     search_fields = ('content',)
+    raw_id_fields = ('conversation',)
     ordering = ('timestamp',)
+
+@admin.register(ChatSummary)
+class ChatSummaryAdmin(admin.ModelAdmin):
+    list_display = ('conversation', 'last_message_id', 'tokens', 'updated_at')
+    raw_id_fields = ('conversation',)
+    search_fields = ('content',)
+    readonly_fields = ('updated_at',)
+
+@admin.register(PrecomputedAnswer)
+class PrecomputedAnswerAdmin(admin.ModelAdmin):
+    list_display = ('chemist', 'question', 'persona_version', 'created_at')
+    list_filter = ('chemist',)
+    search_fields = ('question', 'answer')
+    readonly_fields = ('created_at',)
+
+@admin.register(LLMUsageRollup)
+class LLMUsageRollupAdmin(admin.ModelAdmin):
+    list_display = ('period_start', 'chemist', 'model', 'mode', 'requests', 'cache_hits', 'errors',
+                    'prompt_tokens', 'completion_tokens')
+    list_filter = ('model', 'mode', 'chemist')
+    date_hierarchy = 'period_start'
@@ -10,10 +10,13 @@ class ApiConfig(AppConfig):
     verbose_name = '化學時光機 API'
 
     def ready(self):
+        from django.conf import settings
+        from . import signals  # noqa: F401
         try:
-            from .services.ai_service import AIService
-            # 初始化 AIService
-            AIService()
+            if settings.AI_PROBE_ON_STARTUP:
+                from .services.ai_service import AIService
+                # 在背景檢查 OpenAI 連線，不阻塞啟動
+                AIService().start_probe()
             logger.info("API 應用程式初始化完成")
         except Exception as e:
             logger.error(f"API 應用程式初始化失敗: {str(e)}")
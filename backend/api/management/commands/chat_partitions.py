@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from ...services import chat_partitions
+
+
+class Command(BaseCommand):
+    help = '建立聊天記錄的月分割，並封存、移除超過保留期限的分割（僅 PostgreSQL）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, help='預先建立的月份數，預設為 CHAT_PARTITION_PREMAKE_MONTHS')
+        parser.add_argument('--retention-months', type=int,
+                            help='保留月數，0 表示不移除，預設為 CHAT_HISTORY_RETENTION_MONTHS')
+        parser.add_argument('--archive-dir', help='封存目錄，預設為 CHAT_ARCHIVE_DIR')
+        parser.add_argument('--compression', choices=sorted(chat_partitions.ARCHIVE_SUFFIXES),
+                            help='封存壓縮格式，預設為 CHAT_ARCHIVE_COMPRESSION')
+        parser.add_argument('--no-archive', action='store_true', help='移除過期分割前不封存')
+        parser.add_argument('--dry-run', action='store_true', help='只列出將建立的分割、過期的分割與 default 分割中過期的筆數，不建立、封存或移除')
+
+    def handle(self, *args, **options):
+        if not chat_partitions.is_partitioned():
+            self.stdout.write(self.style.WARNING('聊天記錄不是分割表（需要 PostgreSQL 並執行 migrate），略過'))
+            return
+
+        if options['dry_run']:
+            # 建立分割可能需要 DETACH default 分割並搬移資料，dry run 只列出
+            for month in chat_partitions.missing_partitions(options['ahead']):
+                self.stdout.write(f"將建立分割 {chat_partitions.partition_name(month)}")
+        else:
+            for name in chat_partitions.ensure_partitions(options['ahead']):
+                self.stdout.write(f"已建立分割 {name}")
+
+        results = chat_partitions.expire_partitions(
+            retention_months=options['retention_months'],
+            archive=False if options['no_archive'] else None,
+            directory=options['archive_dir'],
+            compression=options['compression'],
+            dry_run=options['dry_run'],
+        )
+        for result in results:
+            if options['dry_run']:
+                rows = f"（{result['rows']} 筆）" if result['rows'] is not None else ''
+                self.stdout.write(f"過期分割 {result['partition']}{rows}")
+            elif result['archive']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"{result['partition']}：已封存 {result['rows']} 筆至 {result['archive']} 並移除"
+                ))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"{result['partition']}：已移除"))
+
+        months = chat_partitions.partitions()
+        if months:
+            self.stdout.write(f"目前分割：{months[0]:%Y-%m} 至 {months[-1]:%Y-%m}，共 {len(months)} 個")
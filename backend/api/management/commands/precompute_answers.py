@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from ...models import Chemist
+from ...services.ai_service import AIService
+from ...services.precomputed import canonical_questions, precomputed_answers
+
+
+class Command(BaseCommand):
+    help = '為化學家的常見問題預先生成回答'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chemist', type=int, help='只生成指定化學家的回答')
+        parser.add_argument('--concurrency', type=int, help='同時生成的問題數，預設為 AI_PRECOMPUTE_CONCURRENCY')
+        parser.add_argument('--force', action='store_true', help='重新生成目前版本已有的回答')
+        parser.add_argument('--async', dest='use_celery', action='store_true', help='改為排入 Celery 佇列')
+
+    def handle(self, *args, **options):
+        chemists = Chemist.objects.all()
+        if options['chemist']:
+            chemists = chemists.filter(pk=options['chemist'])
+
+        if options['use_celery']:
+            from ...tasks import precompute_answers
+            for chemist in chemists:
+                precompute_answers.delay(chemist.id, force=options['force'])
+                self.stdout.write(f"{chemist.name}：已排入佇列")
+            return
+
+        service = AIService()
+        for chemist in chemists:
+            if not precomputed_answers.is_enabled_for(chemist):
+                self.stdout.write(f"略過 {chemist.name}：已停用回應快取")
+                continue
+            result = precomputed_answers.generate(
+                chemist, service, force=options['force'], concurrency=options['concurrency']
+            )
+            message = (
+                f"{chemist.name}：共 {len(canonical_questions(chemist))} 題，新增 {result['generated']} 題，"
+                f"略過 {result['skipped']} 題，失敗 {result['failed']} 題"
+            )
+            self.stdout.write(self.style.WARNING(message) if result['failed'] else self.style.SUCCESS(message))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from ...models import Chemist, ChatHistory
+from ...services.ai_service import AIService
+from ...services.fuzzy_cache import FuzzyReplyCache
+
+
+class Command(BaseCommand):
+    help = '從聊天記錄重建模糊問句快取索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chemist', type=int, help='只重建指定化學家的索引')
+        parser.add_argument('--keep', action='store_true', help='保留現有索引，只補入新的問答')
+
+    def handle(self, *args, **options):
+        cache = FuzzyReplyCache()
+        chemists = Chemist.objects.filter(deleted_at__isnull=True)
+        if options['chemist']:
+            chemists = chemists.filter(pk=options['chemist'])
+
+        for chemist in chemists:
+            if not cache.is_enabled_for(chemist):
+                self.stdout.write(f"略過 {chemist.name}：已停用回應快取")
+                continue
+            if not options['keep']:
+                cache.clear(chemist)
+
+            indexed = 0
+            pending_question = None
+            # 依對話分組讀取，問答配對不會跨越不同訪客的對話
+            history = ChatHistory.objects.filter(chemist=chemist).order_by('conversation_id', 'timestamp', 'id')
+            conversation_id = None
+            for record in history.only('conversation_id', 'role', 'content').iterator(chunk_size=2000):
+                if record.conversation_id != conversation_id:
+                    conversation_id = record.conversation_id
+                    pending_question = None
+                if record.role == 'user':
+                    pending_question = record.content
+                    continue
+                # 只索引緊接在使用者提問之後的成功回應
+                if (record.role == 'assistant' and pending_question
+                        and record.content != AIService.FALLBACK_MESSAGE):
+                    cache.add(chemist, pending_question, record.content)
+                    indexed += 1
+                pending_question = None
+
+            self.stdout.write(self.style.SUCCESS(f"{chemist.name}：已索引 {indexed} 組問答"))
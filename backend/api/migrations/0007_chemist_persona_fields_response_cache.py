@@ -0,0 +1,53 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_userfeedback'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chemist',
+            name='achievements',
+            field=models.TextField(default='', verbose_name='主要成就'),
+        ),
+        migrations.AddField(
+            model_name='chemist',
+            name='discoveries',
+            field=models.TextField(default='', verbose_name='重要發現'),
+        ),
+        migrations.AddField(
+            model_name='chemist',
+            name='era_background',
+            field=models.TextField(default='', verbose_name='時代背景'),
+        ),
+        migrations.AddField(
+            model_name='chemist',
+            name='nationality',
+            field=models.CharField(default='', max_length=100, verbose_name='國籍'),
+        ),
+        migrations.AddField(
+            model_name='chemist',
+            name='personality',
+            field=models.TextField(default='', verbose_name='個性特點'),
+        ),
+        migrations.AddField(
+            model_name='chemist',
+            name='response_cache_enabled',
+            field=models.BooleanField(default=True, verbose_name='啟用回應快取'),
+        ),
+        migrations.AddField(
+            model_name='chemist',
+            name='system_prompt',
+            field=models.TextField(default='', verbose_name='系統提示詞'),
+        ),
+        migrations.AlterField(
+            model_name='chemist',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='更新時間'),
+        ),
+    ]
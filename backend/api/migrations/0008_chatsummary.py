@@ -0,0 +1,29 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_chemist_persona_fields_response_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content', models.TextField(blank=True, default='', verbose_name='摘要內容')),
+                ('last_message_id', models.BigIntegerField(default=0, verbose_name='摘要涵蓋至')),
+                ('tokens', models.IntegerField(default=0, verbose_name='摘要 token 數')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新時間')),
+                ('chemist', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='chat_summary', to='api.chemist', verbose_name='化學家')),
+            ],
+            options={
+                'verbose_name': '對話摘要',
+                'verbose_name_plural': '對話摘要',
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_chatsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrecomputedAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('persona_version', models.CharField(max_length=32, verbose_name='人設版本')),
+                ('question_hash', models.CharField(max_length=64, verbose_name='正規化問題雜湊')),
+                ('question', models.TextField(verbose_name='問題')),
+                ('answer', models.TextField(verbose_name='答案')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='創建時間')),
+                ('chemist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='precomputed_answers', to='api.chemist', verbose_name='化學家')),
+            ],
+            options={
+                'verbose_name': '預先生成回答',
+                'verbose_name_plural': '預先生成回答',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='precomputedanswer',
+            constraint=models.UniqueConstraint(fields=('chemist', 'persona_version', 'question_hash'), name='unique_precomputed_answer'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_precomputedanswer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMUsageRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateTimeField(verbose_name='時段開始')),
+                ('model', models.CharField(default='', max_length=100, verbose_name='模型')),
+                ('mode', models.CharField(default='', max_length=20, verbose_name='呼叫類型')),
+                ('requests', models.IntegerField(default=0, verbose_name='請求數')),
+                ('cache_hits', models.IntegerField(default=0, verbose_name='快取命中數')),
+                ('errors', models.IntegerField(default=0, verbose_name='錯誤數')),
+                ('prompt_tokens', models.BigIntegerField(default=0, verbose_name='輸入 token 數')),
+                ('completion_tokens', models.BigIntegerField(default=0, verbose_name='輸出 token 數')),
+                ('latency_ms_total', models.BigIntegerField(default=0, verbose_name='總延遲（毫秒）')),
+                ('ttfb_ms_total', models.BigIntegerField(default=0, verbose_name='總首字延遲（毫秒）')),
+                ('ttfb_count', models.IntegerField(default=0, verbose_name='首字延遲樣本數')),
+                ('chemist', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='llm_usage', to='api.chemist', verbose_name='化學家')),
+            ],
+            options={
+                'verbose_name': 'LLM 用量彙總',
+                'verbose_name_plural': 'LLM 用量彙總',
+                'ordering': ['-period_start'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='llmusagerollup',
+            constraint=models.UniqueConstraint(fields=('period_start', 'chemist', 'model', 'mode'), name='unique_llm_usage_rollup'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:34
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+# 對話分三個遷移：新增可為空的欄位、搬移既有資料、再改為必填並移除舊欄位。
+# 資料搬移在自己的交易中提交，PostgreSQL 延遲檢查的外鍵觸發器才不會擋下之後的 ALTER TABLE。
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_llmusagerollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('session_key', models.CharField(blank=True, default='', max_length=40, verbose_name='匿名 session')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='創建時間')),
+                ('last_active_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='最後活動時間')),
+                ('chemist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations', to='api.chemist', verbose_name='化學家')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='conversations', to=settings.AUTH_USER_MODEL, verbose_name='使用者')),
+            ],
+            options={
+                'verbose_name': '對話',
+                'verbose_name_plural': '對話',
+                'ordering': ['-last_active_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='chathistory',
+            name='conversation',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='api.conversation', verbose_name='對話'),
+        ),
+        migrations.AddField(
+            model_name='chatsummary',
+            name='conversation',
+            field=models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='api.conversation', verbose_name='對話'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['user', 'chemist', '-last_active_at'], name='api_conv_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['session_key', 'chemist', '-last_active_at'], name='api_conv_session_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def move_history_to_conversations(apps, schema_editor):
+    """既有聊天記錄與摘要沒有所屬訪客，每位化學家各歸入一個舊資料對話"""
+    Chemist = apps.get_model('api', 'Chemist')
+    ChatHistory = apps.get_model('api', 'ChatHistory')
+    ChatSummary = apps.get_model('api', 'ChatSummary')
+    Conversation = apps.get_model('api', 'Conversation')
+
+    chemist_ids = set(ChatHistory.objects.values_list('chemist_id', flat=True).distinct())
+    chemist_ids |= set(ChatSummary.objects.values_list('chemist_id', flat=True))
+    for chemist in Chemist.objects.filter(pk__in=chemist_ids):
+        conversation = Conversation.objects.create(chemist=chemist, session_key='legacy')
+        ChatHistory.objects.filter(chemist=chemist).update(conversation=conversation)
+        ChatSummary.objects.filter(chemist=chemist).update(conversation=conversation)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_conversation'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_history_to_conversations, migrations.RunPython.noop),
+    ]
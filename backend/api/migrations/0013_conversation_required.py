@@ -0,0 +1,30 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_conversation_move_history'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='chatsummary',
+            name='chemist',
+        ),
+        migrations.AlterField(
+            model_name='chathistory',
+            name='conversation',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='api.conversation', verbose_name='對話'),
+        ),
+        migrations.AlterField(
+            model_name='chatsummary',
+            name='conversation',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='api.conversation', verbose_name='對話'),
+        ),
+        migrations.AddIndex(
+            model_name='chathistory',
+            index=models.Index(fields=['conversation', 'timestamp', 'id'], name='api_chat_conv_time_idx'),
+        ),
+    ]
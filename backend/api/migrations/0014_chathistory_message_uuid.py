@@ -0,0 +1,39 @@
+# Generated by Django 5.0.3 on 2026-10-18 15:02
+
+import uuid
+from django.db import migrations, models
+
+
+def fill_message_uuids(apps, schema_editor):
+    ChatHistory = apps.get_model('api', 'ChatHistory')
+    batch = []
+    for message in ChatHistory.objects.filter(message_uuid__isnull=True).only('id').iterator(chunk_size=2000):
+        message.message_uuid = uuid.uuid4()
+        batch.append(message)
+        if len(batch) >= 2000:
+            ChatHistory.objects.bulk_update(batch, ['message_uuid'])
+            batch = []
+    if batch:
+        ChatHistory.objects.bulk_update(batch, ['message_uuid'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_conversation_required'),
+    ]
+
+    operations = [
+        # 既有資料列需各自產生 UUID，先以可為空的欄位加入再填值
+        migrations.AddField(
+            model_name='chathistory',
+            name='message_uuid',
+            field=models.UUIDField(editable=False, null=True, verbose_name='訊息 UUID'),
+        ),
+        migrations.RunPython(fill_message_uuids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='chathistory',
+            name='message_uuid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True, verbose_name='訊息 UUID'),
+        ),
+    ]
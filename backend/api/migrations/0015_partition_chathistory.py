@@ -0,0 +1,86 @@
+from datetime import date
+from django.db import migrations
+from django.utils import timezone
+
+# 分割表上的主鍵與唯一限制必須包含分割鍵，因此改為 (id, timestamp) 與 (message_uuid, timestamp)；
+# id 仍由序列產生、不會重複，ORM 照常以 id 查詢。
+# message_uuid 因此不再單獨唯一（模型上的 unique=True 只在其他資料庫成立）：相同 uuid、不同 timestamp
+# 的資料列可以並存，write-behind 重送時由 chat_buffer.write_batch 先以 message_uuid 排除已寫入的訊息。
+PREMAKE_MONTHS = 3
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_chat_history(apps, schema_editor):
+    """將 api_chathistory 改為依 timestamp 每月分割（只在 PostgreSQL 執行）"""
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+
+    with connection.cursor() as cursor:
+        # 記下原表的一般索引與外鍵，新表建立後以相同名稱重建
+        cursor.execute(
+            "SELECT pg_get_indexdef(indexrelid) FROM pg_index "
+            "WHERE indrelid = 'api_chathistory'::regclass AND NOT indisunique"
+        )
+        index_defs = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = 'api_chathistory'::regclass AND contype = 'f'"
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname FROM pg_constraint "
+            "WHERE conrelid = 'api_chathistory'::regclass AND contype = 'u'"
+        )
+        unique_names = [row[0] for row in cursor.fetchall()]
+        cursor.execute('SELECT min("timestamp") FROM api_chathistory')
+        oldest = cursor.fetchone()[0]
+
+        cursor.execute("ALTER TABLE api_chathistory RENAME TO api_chathistory_legacy")
+        cursor.execute(
+            'CREATE TABLE api_chathistory (LIKE api_chathistory_legacy) PARTITION BY RANGE ("timestamp")'
+        )
+        cursor.execute("CREATE TABLE api_chathistory_default PARTITION OF api_chathistory DEFAULT")
+        current = date(timezone.now().year, timezone.now().month, 1)
+        month = date(oldest.year, oldest.month, 1) if oldest else current
+        while month <= _add_months(current, PREMAKE_MONTHS):
+            cursor.execute(
+                f"CREATE TABLE api_chathistory_p{month:%Y%m} PARTITION OF api_chathistory "
+                f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') "
+                f"TO ('{_add_months(month, 1).isoformat()} 00:00:00+00')"
+            )
+            month = _add_months(month, 1)
+
+        cursor.execute("INSERT INTO api_chathistory SELECT * FROM api_chathistory_legacy")
+        cursor.execute("DROP TABLE api_chathistory_legacy")
+
+        cursor.execute('ALTER TABLE api_chathistory ADD CONSTRAINT api_chathistory_pkey PRIMARY KEY (id, "timestamp")')
+        for name in unique_names or ['api_chathistory_message_uuid_key']:
+            cursor.execute(f'ALTER TABLE api_chathistory ADD CONSTRAINT {name} UNIQUE (message_uuid, "timestamp")')
+        for name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE api_chathistory ADD CONSTRAINT {name} {definition}")
+        for definition in index_defs:
+            cursor.execute(definition)
+
+        # 原本的 identity 序列隨舊表移除，改用屬於新表的序列並接續既有的 id
+        cursor.execute("CREATE SEQUENCE api_chathistory_id_seq OWNED BY api_chathistory.id")
+        cursor.execute("ALTER TABLE api_chathistory ALTER COLUMN id SET DEFAULT nextval('api_chathistory_id_seq')")
+        cursor.execute(
+            "SELECT setval('api_chathistory_id_seq', COALESCE((SELECT max(id) FROM api_chathistory), 0) + 1, false)"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_chathistory_message_uuid'),
+    ]
+
+    operations = [
+        # 分割對 ORM 透明，反向遷移保留分割表
+        migrations.RunPython(partition_chat_history, migrations.RunPython.noop),
+    ]
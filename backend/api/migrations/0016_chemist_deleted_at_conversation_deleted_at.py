@@ -0,0 +1,23 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_partition_chathistory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chemist',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='刪除時間'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='刪除時間'),
+        ),
+    ]
@@ -0,0 +1,147 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:53
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.functions.text
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# 平假名、片假名、CJK 統一表意文字（含擴充 A 與相容字）與韓文音節，須與 api.services.search.CJK 相同
+CJK = '[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]+'
+
+SEARCH_VECTOR_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION api_search_vector(input text) RETURNS tsvector AS $$
+DECLARE
+    run text;
+    lexemes text[] := ARRAY[]::text[];
+    pos integer := 0;
+    i integer;
+BEGIN
+    IF input IS NULL OR input = '' THEN
+        RETURN ''::tsvector;
+    END IF;
+    -- 連續的 CJK 字元切成重疊的雙字詞，最後一個字另外保留，單字查詢可用前綴比對
+    FOR run IN SELECT (regexp_matches(input, '{CJK}', 'g'))[1] LOOP
+        FOR i IN 1 .. char_length(run) LOOP
+            pos := pos + 1;
+            lexemes := lexemes || (quote_literal(substr(run, i, 2)) || ':' || pos);
+        END LOOP;
+    END LOOP;
+    -- 其他文字交給 simple 設定（轉小寫、不做詞幹處理）
+    RETURN to_tsvector('simple', regexp_replace(input, '{CJK}', ' ', 'g'))
+        || array_to_string(lexemes, ' ')::tsvector;
+END
+$$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE
+"""
+
+# (資料表, 觸發器更新的欄位, 搜尋向量運算式)
+SEARCH_DOCUMENTS = [
+    ('api_chemist', ['name', 'nationality', 'achievements', 'discoveries', 'description'], """
+        setweight(api_search_vector(NEW.name), 'A')
+        || setweight(api_search_vector(concat_ws(' ', NEW.achievements, NEW.discoveries)), 'B')
+        || setweight(api_search_vector(concat_ws(' ', NEW.nationality, NEW.description)), 'C')
+    """),
+    ('api_historicalevent', ['title', 'description'], """
+        setweight(api_search_vector(NEW.title), 'A')
+        || setweight(api_search_vector(NEW.description), 'B')
+    """),
+    ('api_chathistory', ['content'], """
+        api_search_vector(NEW.content)
+    """),
+]
+
+
+def create_search_triggers(apps, schema_editor):
+    """以觸發器維護 search_vector 並回填既有資料（只在 PostgreSQL 執行）"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(SEARCH_VECTOR_FUNCTION)
+        for table, columns, expression in SEARCH_DOCUMENTS:
+            cursor.execute(f"""
+                CREATE OR REPLACE FUNCTION {table}_search_update() RETURNS trigger AS $$
+                BEGIN
+                    NEW.search_vector := {expression};
+                    RETURN NEW;
+                END
+                $$ LANGUAGE plpgsql
+            """)
+            # 分割表上的列觸發器會套用到所有分割（PostgreSQL 13 以上）
+            cursor.execute(f"""
+                CREATE TRIGGER {table}_search_trigger
+                BEFORE INSERT OR UPDATE OF {', '.join(columns)} ON {table}
+                FOR EACH ROW EXECUTE FUNCTION {table}_search_update()
+            """)
+            cursor.execute(f"UPDATE {table} SET search_vector = {expression.replace('NEW.', '')}")
+
+
+def drop_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table, _, _ in SEARCH_DOCUMENTS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {table}_search_trigger ON {table}")
+            cursor.execute(f"DROP FUNCTION IF EXISTS {table}_search_update()")
+        cursor.execute("DROP FUNCTION IF EXISTS api_search_vector(text)")
+
+
+# GIN 與 gin_trgm_ops 只存在於 PostgreSQL；其他資料庫（SQLite 測試）只記錄在遷移狀態中
+SEARCH_INDEXES = [
+    ('chathistory', django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='api_chat_search_idx')),
+    ('chathistory', django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('content'), name='gin_trgm_ops'), name='api_chat_content_trgm_idx')),
+    ('chemist', django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='api_chemist_search_idx')),
+    ('chemist', django.contrib.postgres.indexes.GinIndex(fields=['name'], name='api_chemist_name_trgm_idx', opclasses=['gin_trgm_ops'])),
+    ('historicalevent', django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='api_event_search_idx')),
+    ('historicalevent', django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('title'), name='gin_trgm_ops'), name='api_event_title_trgm_idx')),
+    ('historicalevent', django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('description'), name='gin_trgm_ops'), name='api_event_desc_trgm_idx')),
+]
+
+
+def add_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for model_name, index in SEARCH_INDEXES:
+        schema_editor.add_index(apps.get_model('api', model_name), index)
+
+
+def remove_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for model_name, index in SEARCH_INDEXES:
+        schema_editor.remove_index(apps.get_model('api', model_name), index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_chemist_deleted_at_conversation_deleted_at'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='chathistory',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='chemist',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='historicalevent',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        # 先回填再建立索引，比逐列更新索引快
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name=model_name, index=index) for model_name, index in SEARCH_INDEXES
+            ],
+            database_operations=[
+                migrations.RunPython(add_search_indexes, remove_search_indexes),
+            ],
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.0.3 on 2026-10-18 15:03
+
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+# int4range 生成欄位與 GiST 索引只存在於 PostgreSQL
+LIFESPAN_SQL = [
+    """
+    ALTER TABLE "api_chemist" ADD COLUMN "lifespan" int4range GENERATED ALWAYS AS (
+        int4range("birth_year", CASE WHEN "death_year" >= ("birth_year") THEN "death_year" ELSE NULL END, '[]')
+    ) STORED
+    """,
+    'CREATE INDEX "api_chemist_lifespan_idx" ON "api_chemist" USING gist ("lifespan")',
+]
+
+
+def add_lifespan(apps, schema_editor):
+    """其他資料庫（SQLite 測試）只建立永遠為 NULL 的欄位，讓讀取 Chemist 的查詢可以執行"""
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in LIFESPAN_SQL:
+            schema_editor.execute(sql)
+    else:
+        schema_editor.execute('ALTER TABLE "api_chemist" ADD COLUMN "lifespan" text NULL')
+
+
+def remove_lifespan(apps, schema_editor):
+    # 索引隨欄位一起刪除
+    schema_editor.execute('ALTER TABLE "api_chemist" DROP COLUMN "lifespan"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_search'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name='chemist',
+                    name='lifespan',
+                    field=models.GeneratedField(db_persist=True, expression=models.Func(models.F('birth_year'), models.Case(models.When(death_year__gte=models.F('birth_year'), then=models.F('death_year'))), models.Value('[]'), function='int4range'), output_field=django.contrib.postgres.fields.ranges.IntegerRangeField()),
+                ),
+                migrations.AddIndex(
+                    model_name='chemist',
+                    index=django.contrib.postgres.indexes.GistIndex(fields=['lifespan'], name='api_chemist_lifespan_idx'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(add_lifespan, remove_lifespan),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='historicalevent',
+            index=models.Index(fields=['year', 'id'], name='api_event_year_idx'),
+        ),
+    ]
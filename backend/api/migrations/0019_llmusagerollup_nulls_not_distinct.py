@@ -0,0 +1,44 @@
+# Generated by Django 5.0.3 on 2026-10-18 15:22
+
+from django.db import migrations, models
+
+COUNTER_FIELDS = ('requests', 'cache_hits', 'errors', 'prompt_tokens', 'completion_tokens',
+                  'latency_ms_total', 'ttfb_ms_total', 'ttfb_count')
+
+
+def merge_unassigned_rollups(apps, schema_editor):
+    """舊約束允許同一時段有多列 chemist 為 NULL 的用量，建立新約束前先合併"""
+    LLMUsageRollup = apps.get_model('api', 'LLMUsageRollup')
+    kept = {}
+    duplicates = []
+    for row in LLMUsageRollup.objects.filter(chemist__isnull=True).order_by('pk'):
+        key = (row.period_start, row.model, row.mode)
+        if key not in kept:
+            kept[key] = row
+            continue
+        for field in COUNTER_FIELDS:
+            setattr(kept[key], field, getattr(kept[key], field) + getattr(row, field))
+        duplicates.append(row.pk)
+    if not duplicates:
+        return
+    LLMUsageRollup.objects.filter(pk__in=duplicates).delete()
+    LLMUsageRollup.objects.bulk_update(kept.values(), COUNTER_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_chemist_lifespan'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='llmusagerollup',
+            name='unique_llm_usage_rollup',
+        ),
+        migrations.RunPython(merge_unassigned_rollups, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='llmusagerollup',
+            constraint=models.UniqueConstraint(fields=('period_start', 'chemist', 'model', 'mode'), name='unique_llm_usage_rollup', nulls_distinct=False),
+        ),
+    ]
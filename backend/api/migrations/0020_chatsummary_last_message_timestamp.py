@@ -0,0 +1,35 @@
+# Generated by Django 5.0.3 on 2026-10-18 15:34
+
+from django.db import migrations, models
+
+
+def backfill_last_message_timestamp(apps, schema_editor):
+    """既有摘要以 id 截止；改為該對話中 id 不超過截止值的最新一則 (timestamp, id)"""
+    ChatSummary = apps.get_model('api', 'ChatSummary')
+    ChatHistory = apps.get_model('api', 'ChatHistory')
+    for summary in ChatSummary.objects.filter(last_message_id__gt=0).iterator():
+        last = ChatHistory.objects.filter(
+            conversation_id=summary.conversation_id, id__lte=summary.last_message_id
+        ).order_by('-timestamp', '-id').values('id', 'timestamp').first()
+        if last is None:
+            # 摘要涵蓋的訊息都已不存在，之後的訊息重新由頭摘要
+            summary.last_message_id = 0
+        else:
+            summary.last_message_id, summary.last_message_timestamp = last['id'], last['timestamp']
+        summary.save(update_fields=['last_message_id', 'last_message_timestamp'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_llmusagerollup_nulls_not_distinct'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsummary',
+            name='last_message_timestamp',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='摘要涵蓋至時間'),
+        ),
+        migrations.RunPython(backfill_last_message_timestamp, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,12 @@
+from django.contrib.postgres.fields import IntegerRangeField
+from django.contrib.postgres.indexes import GinIndex, GistIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models.functions import Upper
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import User
+import uuid
 
 class Era(models.Model):
     """化學時代模型"""
@@ -38,12 +43,35 @@ class Chemist(models.Model):
     personality = models.TextField(verbose_name="個性特點", default='')
     era_background = models.TextField(verbose_name="時代背景", default='')
     system_prompt = models.TextField(verbose_name="系統提示詞", default='')
+    response_cache_enabled = models.BooleanField(default=True, verbose_name="啟用回應快取")
     created_at = models.DateTimeField(default=timezone.now, verbose_name="創建時間")
-    updated_at = models.DateTimeField(default=timezone.now, verbose_name="更新時間")
+    # 作為人設版本使用，任何修改都必須更新此欄位
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新時間")
+    # 已排入背景刪除，刪除完成前不再出現在 API 中
+    deleted_at = models.DateTimeField(null=True, blank=True, verbose_name="刪除時間")
+    # 全文搜尋向量，由資料庫觸發器依姓名與成就等欄位維護（CJK 以雙字詞切分）
+    search_vector = SearchVectorField(null=True, editable=False)
+    # 在世期間 [birth_year, death_year]，卒年未知（或早於生年）時沒有上限；供時間軸以 && 查詢區間重疊
+    lifespan = models.GeneratedField(
+        expression=models.Func(
+            models.F('birth_year'),
+            models.Case(models.When(death_year__gte=models.F('birth_year'), then=models.F('death_year'))),
+            models.Value('[]'),
+            function='int4range',
+        ),
+        output_field=IntegerRangeField(),
+        db_persist=True,
+    )
 
     class Meta:
         verbose_name = "化學家"
         verbose_name_plural = "化學家"
+        indexes = [
+            GistIndex(fields=['lifespan'], name='api_chemist_lifespan_idx'),
+            GinIndex(fields=['search_vector'], name='api_chemist_search_idx'),
+            # 姓名的模糊比對（拼字錯誤、部分姓名）
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='api_chemist_name_trgm_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -63,29 +91,149 @@ class HistoricalEvent(models.Model):
     image_path = models.CharField(max_length=200, verbose_name="事件圖片路徑", null=True, blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="創建時間")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="更新時間")
+    # 全文搜尋向量，由資料庫觸發器依標題與描述維護
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         verbose_name = "歷史事件"
         verbose_name_plural = "歷史事件"
         ordering = ['year']
+        indexes = [
+            # 時間軸的年份區間查詢與列表的 keyset 排序
+            models.Index(fields=['year', 'id'], name='api_event_year_idx'),
+            GinIndex(fields=['search_vector'], name='api_event_search_idx'),
+            # 管理後台 search_fields 的 icontains 會比對 UPPER(欄位)
+            GinIndex(OpClass(Upper('title'), name='gin_trgm_ops'), name='api_event_title_trgm_idx'),
+            GinIndex(OpClass(Upper('description'), name='gin_trgm_ops'), name='api_event_desc_trgm_idx'),
+        ]
 
     def __str__(self):
         return f"{self.year} - {self.title}"
 
+class Conversation(models.Model):
+    """一位訪客與一位化學家的對話；登入使用者以 user 識別，匿名訪客以 session 識別"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    chemist = models.ForeignKey(Chemist, on_delete=models.CASCADE, related_name='conversations', verbose_name="化學家")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True,
+                             related_name='conversations', verbose_name="使用者")
+    session_key = models.CharField(max_length=40, blank=True, default='', verbose_name="匿名 session")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="創建時間")
+    last_active_at = models.DateTimeField(default=timezone.now, verbose_name="最後活動時間")
+    # 已排入背景刪除，刪除完成前不再被使用者存取或寫入新訊息
+    deleted_at = models.DateTimeField(null=True, blank=True, verbose_name="刪除時間")
+
+    class Meta:
+        verbose_name = "對話"
+        verbose_name_plural = "對話"
+        ordering = ['-last_active_at']
+        indexes = [
+            models.Index(fields=['user', 'chemist', '-last_active_at'], name='api_conv_user_recent_idx'),
+            models.Index(fields=['session_key', 'chemist', '-last_active_at'], name='api_conv_session_recent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.chemist.name} - {self.id}"
+
 class ChatHistory(models.Model):
     chemist = models.ForeignKey(Chemist, on_delete=models.CASCADE, related_name='chat_history', verbose_name="化學家")
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages',
+                                     verbose_name="對話")
+    # 由寫入端產生，重複寫入（例如緩衝重送）時以此去重
+    # PostgreSQL 上的分割表無法只對 message_uuid 建唯一限制（0015 遷移改為 (message_uuid, timestamp)），
+    # 資料庫只擋下 uuid 與時間都相同的重複；write-behind 寫入前另以 message_uuid 排除已寫入的訊息
+    message_uuid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False, verbose_name="訊息 UUID")
     role = models.CharField(max_length=50, verbose_name="角色", default="")
     content = models.TextField(verbose_name="內容", default="")
     timestamp = models.DateTimeField(default=timezone.now, verbose_name="時間戳")
+    # 全文搜尋向量，由資料庫觸發器依內容維護
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         verbose_name = "聊天記錄"
         verbose_name_plural = "聊天記錄"
         ordering = ['timestamp']
+        indexes = [
+            # 上下文與聊天記錄都只在單一對話內依時間查詢
+            models.Index(fields=['conversation', 'timestamp', 'id'], name='api_chat_conv_time_idx'),
+            GinIndex(fields=['search_vector'], name='api_chat_search_idx'),
+            GinIndex(OpClass(Upper('content'), name='gin_trgm_ops'), name='api_chat_content_trgm_idx'),
+        ]
 
     def __str__(self):
         return f"{self.chemist.name} - {self.timestamp}"
 
+class ChatSummary(models.Model):
+    conversation = models.OneToOneField(Conversation, on_delete=models.CASCADE, related_name='summary', verbose_name="對話")
+    content = models.TextField(verbose_name="摘要內容", default="", blank=True)
+    # 已併入摘要的最後一則聊天記錄，依 (timestamp, id) 排序；write-behind 寫入時 id 不一定依時間遞增
+    last_message_id = models.BigIntegerField(verbose_name="摘要涵蓋至", default=0)
+    last_message_timestamp = models.DateTimeField(null=True, blank=True, verbose_name="摘要涵蓋至時間")
+    tokens = models.IntegerField(verbose_name="摘要 token 數", default=0)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新時間")
+
+    class Meta:
+        verbose_name = "對話摘要"
+        verbose_name_plural = "對話摘要"
+
+    def __str__(self):
+        return f"{self.conversation_id} - 摘要至 #{self.last_message_id}"
+
+    def covers(self, timestamp, message_id) -> bool:
+        """該則聊天記錄是否已併入摘要"""
+        if self.last_message_timestamp is None:
+            return False
+        return (timestamp, message_id) <= (self.last_message_timestamp, self.last_message_id)
+
+class PrecomputedAnswer(models.Model):
+    chemist = models.ForeignKey(Chemist, on_delete=models.CASCADE, related_name='precomputed_answers', verbose_name="化學家")
+    # 產生答案時的人設版本（Chemist.updated_at），版本不符的答案不會被使用
+    persona_version = models.CharField(max_length=32, verbose_name="人設版本")
+    question_hash = models.CharField(max_length=64, verbose_name="正規化問題雜湊")
+    question = models.TextField(verbose_name="問題")
+    answer = models.TextField(verbose_name="答案")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="創建時間")
+
+    class Meta:
+        verbose_name = "預先生成回答"
+        verbose_name_plural = "預先生成回答"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['chemist', 'persona_version', 'question_hash'], name='unique_precomputed_answer'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.chemist.name} - {self.question}"
+
+class LLMUsageRollup(models.Model):
+    """LLM 呼叫用量的每小時彙總，由 flush_llm_usage 任務從 Redis 寫入"""
+    period_start = models.DateTimeField(verbose_name="時段開始")
+    chemist = models.ForeignKey(Chemist, on_delete=models.SET_NULL, null=True, blank=True,
+                                related_name='llm_usage', verbose_name="化學家")
+    model = models.CharField(max_length=100, verbose_name="模型", default='')
+    mode = models.CharField(max_length=20, verbose_name="呼叫類型", default='')
+    requests = models.IntegerField(verbose_name="請求數", default=0)
+    cache_hits = models.IntegerField(verbose_name="快取命中數", default=0)
+    errors = models.IntegerField(verbose_name="錯誤數", default=0)
+    prompt_tokens = models.BigIntegerField(verbose_name="輸入 token 數", default=0)
+    completion_tokens = models.BigIntegerField(verbose_name="輸出 token 數", default=0)
+    latency_ms_total = models.BigIntegerField(verbose_name="總延遲（毫秒）", default=0)
+    ttfb_ms_total = models.BigIntegerField(verbose_name="總首字延遲（毫秒）", default=0)
+    ttfb_count = models.IntegerField(verbose_name="首字延遲樣本數", default=0)
+
+    class Meta:
+        verbose_name = "LLM 用量彙總"
+        verbose_name_plural = "LLM 用量彙總"
+        ordering = ['-period_start']
+        constraints = [
+            # 已刪除化學家（chemist 為 NULL）的用量同樣每個時段只有一列
+            models.UniqueConstraint(fields=['period_start', 'chemist', 'model', 'mode'], name='unique_llm_usage_rollup',
+                                    nulls_distinct=False)
+        ]
+
+    def __str__(self):
+        return f"{self.period_start:%Y-%m-%d %H:00} - {self.model} - {self.mode}"
+
 class UserFeedback(models.Model):
     chemist = models.ForeignKey('Chemist', on_delete=models.CASCADE, related_name='feedbacks')
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
@@ -195,6 +343,7 @@ def create_test_data():
     # 創建聊天記錄
     ChatHistory.objects.create(
         chemist=chemist1,
+        conversation=Conversation.objects.create(chemist=chemist1),
         role="assistant",
         content="您好！我是安東尼·拉瓦錫。我很高興能與您討論化學的奧秘。",
         timestamp=timezone.now()
@@ -202,6 +351,7 @@ def create_test_data():
     
     ChatHistory.objects.create(
         chemist=chemist2,
+        conversation=Conversation.objects.create(chemist=chemist2),
         role="assistant",
         content="歡迎！我是門捷列夫。讓我們一起探索元素週期表的奧秘吧！",
         timestamp=timezone.now()
@@ -209,6 +359,7 @@ def create_test_data():
     
     ChatHistory.objects.create(
         chemist=chemist3,
+        conversation=Conversation.objects.create(chemist=chemist3),
         role="assistant",
         content="你好！我是瑪麗·居里。我對放射性元素的研究很感興趣，您想了解什麼呢？",
         timestamp=timezone.now()
@@ -216,6 +367,7 @@ def create_test_data():
 
     ChatHistory.objects.create(
         chemist=chemist4,
+        conversation=Conversation.objects.create(chemist=chemist4),
         role="assistant",
         content="您好！我是羅伯特·波義耳。讓我們一起探索氣體化學的奧秘吧！",
         timestamp=timezone.now()
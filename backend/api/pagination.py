@@ -0,0 +1,196 @@
+"""
+Keyset（cursor）分頁
+
+以排序欄位的值作為游標，下一頁以 WHERE (a, b) > (上一頁最後一列) 查詢，
+不使用 OFFSET 也不執行 COUNT(*)，資料表再大每頁的查詢成本都相同。
+排序欄位的最後一個必須唯一（通常是 id），游標才會穩定。
+
+回應沿用 {status, data, message} 格式，另加 pagination：
+    {"next": 下一頁網址或 null, "prev": 上一頁網址或 null, "page_size": 每頁筆數}
+"""
+from typing import Optional, Sequence
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+import base64
+import json
+
+NEXT = 'n'
+PREV = 'p'
+
+
+def encode_cursor(values: list, direction: str) -> str:
+    payload = json.dumps({'v': values, 'd': direction}, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """回傳 (values, direction)；格式錯誤時拋出 ValidationError"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        values, direction = payload['v'], payload['d']
+        if not isinstance(values, list) or direction not in (NEXT, PREV):
+            raise ValueError(direction)
+    except (TypeError, ValueError, KeyError):
+        raise ValidationError({'cursor': '無效的分頁游標'})
+    return values, direction
+
+
+def _field(ordering: str) -> tuple:
+    """'-year' -> ('year', True)"""
+    return (ordering[1:], True) if ordering.startswith('-') else (ordering, False)
+
+
+def keyset_filter(ordering: Sequence[str], values: list, after: bool) -> Q:
+    """排序在 values 之後（after=False 時為之前）的列
+
+    (a, b) > (x, y) 展開為 a > x OR (a = x AND b > y)，可使用 (a, b) 的複合索引。
+    """
+    condition = Q()
+    equal = Q()
+    for field_ordering, value in zip(ordering, values):
+        field, descending = _field(field_ordering)
+        lookup = 'lt' if descending == after else 'gt'
+        condition |= equal & Q(**{f'{field}__{lookup}': value})
+        equal &= Q(**{field: value})
+    return condition
+
+
+def _reverse(ordering: Sequence[str]) -> list:
+    return [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+
+
+class KeysetPagination(BasePagination):
+    """依視圖的 keyset_ordering（或呼叫時指定的 ordering）分頁"""
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering: Sequence[str] = ('id',)
+
+    def get_page_size(self, request) -> int:
+        page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE') or 10
+        requested = request.query_params.get(self.page_size_query_param)
+        if requested:
+            try:
+                page_size = int(requested)
+            except ValueError:
+                raise ValidationError({self.page_size_query_param: '必須為整數'})
+        return max(1, min(page_size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None, ordering: Optional[Sequence[str]] = None,
+                          from_end: bool = False):
+        """取出一頁資料，回傳時依 ordering 由前到後排列
+
+        from_end=True 時沒有游標的第一頁是排序最後的一頁（例如最新的聊天記錄），
+        再以 prev 游標往前翻。
+        """
+        values, forward = self._start(request, ordering or getattr(view, 'keyset_ordering', None), from_end)
+        if values is not None:
+            queryset = queryset.filter(keyset_filter(self.ordering, values, after=forward))
+        queryset = queryset.order_by(*(self.ordering if forward else _reverse(self.ordering)))
+        return self._finish(list(queryset[:self.page_size + 1]), values, forward)
+
+    def paginate_union(self, querysets: Sequence, request, ordering: Sequence[str]):
+        """跨多個欄位相同的 values() 查詢分頁
+
+        游標條件分別套用在每個查詢上（各自可使用索引），再以 UNION ALL 合併排序，
+        每個查詢最多只取 page_size + 1 列。
+        """
+        values, forward = self._start(request, ordering, from_end=False)
+        order = self.ordering if forward else _reverse(self.ordering)
+        parts = []
+        for queryset in querysets:
+            if values is not None:
+                queryset = queryset.filter(keyset_filter(self.ordering, values, after=forward))
+            parts.append(queryset.order_by(*order)[:self.page_size + 1])
+        if len(parts) < 2:
+            return self._finish(list(parts[0]) if parts else [], values, forward)
+        union = parts[0].union(*parts[1:], all=True)
+        return self._finish(list(union.order_by(*order)[:self.page_size + 1]), values, forward)
+
+    def _start(self, request, ordering: Optional[Sequence[str]], from_end: bool) -> tuple:
+        self.request = request
+        self.ordering = list(ordering or self.ordering)
+        self.page_size = self.get_page_size(request)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            values, direction = decode_cursor(cursor)
+            if len(values) != len(self.ordering):
+                raise ValidationError({'cursor': '無效的分頁游標'})
+        else:
+            values, direction = None, PREV if from_end else NEXT
+        return values, direction == NEXT
+
+    def _finish(self, rows: list, values: Optional[list], forward: bool) -> list:
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if not forward:
+            rows.reverse()
+
+        # 從某個游標翻過來時，反方向必定還有資料
+        self.has_next = has_more if forward else values is not None
+        self.has_prev = values is not None if forward else has_more
+        self.first = rows[0] if rows else None
+        self.last = rows[-1] if rows else None
+        if not rows and values is not None:
+            # 空頁仍保留原本的位置，讓客戶端可以往回翻
+            self.first = self.last = values
+        return rows
+
+    def _position(self, row) -> list:
+        if isinstance(row, list):
+            return row
+        if isinstance(row, dict):
+            return [row[_field(field)[0]] for field in self.ordering]
+        return [getattr(row, _field(field)[0]) for field in self.ordering]
+
+    def _link(self, row, direction: str) -> Optional[str]:
+        if row is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param,
+            encode_cursor(self._position(row), direction)
+        )
+
+    def get_next_link(self) -> Optional[str]:
+        return self._link(self.last, NEXT) if self.has_next else None
+
+    def get_previous_link(self) -> Optional[str]:
+        return self._link(self.first, PREV) if self.has_prev else None
+
+    def get_pagination(self) -> dict:
+        return {
+            'next': self.get_next_link(),
+            'prev': self.get_previous_link(),
+            'page_size': self.page_size,
+        }
+
+    def get_paginated_response(self, data, message: Optional[str] = None) -> Response:
+        body = {'status': 'success', 'data': data}
+        if message:
+            body['message'] = message
+        body['pagination'] = self.get_pagination()
+        return Response(body)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'status': {'type': 'string'},
+                'data': schema,
+                'message': {'type': 'string'},
+                'pagination': {
+                    'type': 'object',
+                    'properties': {
+                        'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                        'prev': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                        'page_size': {'type': 'integer'},
+                    },
+                },
+            },
+        }
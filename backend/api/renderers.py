@@ -0,0 +1,21 @@
+import json
+from rest_framework.renderers import BaseRenderer
+
+
+def format_sse(event: str, data: dict) -> str:
+    """將資料格式化為 Server-Sent Events 訊息"""
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+class EventStreamRenderer(BaseRenderer):
+    """SSE 渲染器，讓 DRF 接受 Accept: text/event-stream 的請求"""
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # 串流回應本身不經過渲染器，這裡只處理錯誤等一般回應
+        if data is None:
+            return b''
+        return format_sse('error', data).encode(self.charset)
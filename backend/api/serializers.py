@@ -1,10 +1,16 @@
 from rest_framework import serializers
-from .models import Era, Chemist, HistoricalEvent, ChatHistory, UserFeedback
+from .models import Era, Chemist, HistoricalEvent, ChatHistory, Conversation, UserFeedback
 
 class ChatHistorySerializer(serializers.ModelSerializer):
     class Meta:
         model = ChatHistory
-        fields = ['id', 'role', 'content', 'timestamp']
+        fields = ['id', 'message_uuid', 'role', 'content', 'timestamp']
+
+class ConversationSerializer(serializers.ModelSerializer):
+    """對話序列化器"""
+    class Meta:
+        model = Conversation
+        fields = ['id', 'chemist', 'created_at', 'last_active_at']
 
 class HistoricalEventSerializer(serializers.ModelSerializer):
     """歷史事件序列化器"""
@@ -22,6 +28,24 @@ class HistoricalEventSerializer(serializers.ModelSerializer):
             'updated_at'
         ]
 
+class HistoricalEventSummarySerializer(serializers.ModelSerializer):
+    """化學家列表中使用的精簡歷史事件"""
+    class Meta:
+        model = HistoricalEvent
+        fields = ['id', 'title', 'year', 'event_type']
+
+class TimelineEventSerializer(serializers.ModelSerializer):
+    """時間軸上的歷史事件"""
+    class Meta:
+        model = HistoricalEvent
+        fields = ['id', 'title', 'year', 'event_type', 'chemist', 'image_path']
+
+class TimelineChemistSerializer(serializers.ModelSerializer):
+    """時間軸上的化學家，只含生卒年與顯示用欄位"""
+    class Meta:
+        model = Chemist
+        fields = ['id', 'name', 'birth_year', 'death_year', 'era', 'portrait_path']
+
 class EraSerializer(serializers.ModelSerializer):
     """時代序列化器"""
     class Meta:
@@ -55,9 +79,42 @@ class EraDetailSerializer(serializers.ModelSerializer):
             'updated_at'
         ]
 
+class ChemistListSerializer(serializers.ModelSerializer):
+    """化學家列表序列化器：不含聊天記錄，事件只保留摘要欄位"""
+    events = HistoricalEventSummarySerializer(many=True, read_only=True)
+
+    # 列表查詢以 only() 載入的欄位，需與 fields 保持一致
+    LOAD_FIELDS = (
+        'id', 'name', 'era', 'description', 'position_x', 'position_y', 'position_z',
+        'birth_year', 'death_year', 'portrait_path', 'model_path', 'created_at', 'updated_at'
+    )
+
+    class Meta:
+        model = Chemist
+        fields = [
+            'id',
+            'name',
+            'era',
+            'description',
+            'position_x',
+            'position_y',
+            'position_z',
+            'birth_year',
+            'death_year',
+            'portrait_path',
+            'model_path',
+            'events',
+            'created_at',
+            'updated_at'
+        ]
+
 class ChemistSerializer(serializers.ModelSerializer):
-    """化學家序列化器"""
-    chat_history = ChatHistorySerializer(many=True, read_only=True)
+    """化學家詳細序列化器
+
+    chat_history 只包含目前對話最近的訊息，由視圖預先載入到 recent_chat_history；
+    沒有預先載入時（例如建立或更新後）為空陣列。
+    """
+    chat_history = serializers.SerializerMethodField()
     events = HistoricalEventSerializer(many=True, read_only=True)
 
     class Meta:
@@ -80,6 +137,11 @@ class ChemistSerializer(serializers.ModelSerializer):
             'updated_at'
         ]
 
+    def get_chat_history(self, obj):
+        # 預先載入時以新到舊取出，輸出時改為由舊到新
+        recent = getattr(obj, 'recent_chat_history', [])
+        return ChatHistorySerializer(list(reversed(recent)), many=True).data
+
 class ChatMessageSerializer(serializers.Serializer):
     message = serializers.CharField(max_length=1000)
 
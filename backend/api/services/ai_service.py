@@ -1,13 +1,47 @@
-from typing import Dict, Any
-from openai import OpenAI
+from typing import Dict, Any, Iterator, Optional
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from ..models import Chemist, ChatHistory
+from django.core.cache import cache
+from ..models import Chemist, Conversation
+from . import metrics, telemetry
+from .circuit_breaker import CircuitBreaker, CircuitOpen
+from .concurrency import UpstreamBusy, UpstreamLimiter
+from .context_builder import ContextBuilder, ContextWindow
+from .deadline import Deadline
+from .hedging import HedgedCaller, HedgePolicy
+from .model_router import ModelRouter, Route
+from .response_cache import ResponseCache
+from .single_flight import SingleFlight
+from .persona_registry import persona_registry
+from .precomputed import precomputed_answers
+from .providers import get_provider
+from .tokens import estimate_messages_tokens, estimate_tokens
+import threading
+import time
 import traceback
 import logging
 
 logger = logging.getLogger(__name__)
 
+PROMPT_TOKENS = metrics.histogram(
+    'ai_prompt_tokens', '每次請求送往上游的估算 token 數',
+    buckets=(128, 256, 512, 1024, 1536, 2048, 3072, 4096, 8192)
+)
+DEGRADED_REPLIES = metrics.counter(
+    'ai_degraded_replies_total', '斷路器開啟時改用的備援回答（precomputed/canned）', ['source']
+)
+CONTEXT_TOKENS = metrics.histogram(
+    'ai_context_tokens', '每次請求中摘要與歷史對話的估算 token 數',
+    buckets=(0, 64, 128, 256, 512, 1024, 2048, 4096)
+)
+
+SUMMARY_PROMPT = """請將以下對話濃縮成一段不超過 {limit} 字的繁體中文摘要，供{name}延續對話時參考。
+保留使用者關心的主題、提出過的問題，以及{name}已經說明過的重點；省略寒暄與重複內容。
+只輸出摘要本身。"""
+
 class AIService:
+    FALLBACK_MESSAGE = "抱歉，我現在無法回應您的問題。請稍後再試。"
+
     _instance = None
     _initialized = False
 
@@ -17,75 +51,86 @@ class AIService:
         return cls._instance
 
     def __init__(self):
+        # 建構時不建立 OpenAI 客戶端也不連線，第一次使用時才初始化
         if not self._initialized:
             logger.info("初始化 AIService")
-            try:
-                self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
-                self.model = settings.MODEL_NAME
-                self.max_tokens = settings.MAX_TOKENS
-                self.temperature = settings.TEMPERATURE
-                
-                # 測試 API 連接
-                self._test_connection()
-                logger.info("OpenAI API 連接成功")
-                self._initialized = True
-            except Exception as e:
-                logger.error(f"OpenAI API 初始化失敗: {str(e)}")
-                logger.error(f"錯誤詳情: {traceback.format_exc()}")
-                raise
+            self.model = settings.MODEL_NAME
+            self.max_tokens = settings.MAX_TOKENS
+            self.temperature = settings.TEMPERATURE
+            self.response_cache = ResponseCache()
+            self.limiter = UpstreamLimiter.from_settings()
+            self.caller = HedgedCaller(self.limiter, HedgePolicy.from_settings())
+            self.breaker = CircuitBreaker.from_settings()
+            self.router = ModelRouter.from_settings()
+            self.context_builder = ContextBuilder()
+            self.single_flight = SingleFlight()
+            self.precomputed = precomputed_answers
+            self._provider = None
+            self._fuzzy_cache = None
+            self._probe_lock = threading.Lock()
+            self._probe_status = {'ok': None, 'checked_at': None, 'latency_ms': None, 'error': None}
+            self._probe_thread: Optional[threading.Thread] = None
+            self._initialized = True
+
+    @property
+    def provider(self):
+        """延遲取得 LLM 供應者，同時延後 openai 套件的載入"""
+        if self._provider is None:
+            self._provider = get_provider()
+        return self._provider
+
+    @property
+    def fuzzy_cache(self):
+        # 模糊快取依賴 NumPy，同樣延遲載入
+        if self._fuzzy_cache is None:
+            from .fuzzy_cache import FuzzyReplyCache
+            self._fuzzy_cache = FuzzyReplyCache()
+        return self._fuzzy_cache
 
     def _test_connection(self):
-        """測試 OpenAI API 連接"""
+        """測試 LLM 供應者連接（不消耗 token）"""
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "你是一個測試助手。"},
-                    {"role": "user", "content": "測試連接"}
-                ],
-                max_tokens=10
-            )
-            return response
+            return self.provider.check(self.model)
         except Exception as e:
             logger.error(f"API 連接測試失敗: {str(e)}")
             raise
 
+    def _run_probe(self):
+        started = time.monotonic()
+        try:
+            self._test_connection()
+            status = {'ok': True, 'error': None}
+            logger.info("OpenAI API 連接成功")
+        except Exception as e:
+            status = {'ok': False, 'error': str(e)}
+        status['latency_ms'] = int((time.monotonic() - started) * 1000)
+        status['checked_at'] = time.time()
+        self._probe_status = status
+
+    def start_probe(self) -> None:
+        """在背景執行緒檢查 OpenAI 連線，同一時間只會有一個檢查在執行"""
+        with self._probe_lock:
+            if self._probe_thread is not None and self._probe_thread.is_alive():
+                return
+            self._probe_thread = threading.Thread(
+                target=self._run_probe, name='openai-probe', daemon=True
+            )
+            self._probe_thread.start()
+
+    def connection_status(self) -> dict:
+        """回傳快取的連線狀態；過期時在背景重新檢查，不阻塞呼叫端"""
+        status = dict(self._probe_status)
+        checked_at = status['checked_at']
+        if checked_at is None or time.time() - checked_at > settings.AI_PROBE_TTL:
+            self.start_probe()
+            status['stale'] = True
+        else:
+            status['stale'] = False
+        return status
+
     def _get_chemist_prompt(self, chemist: Chemist) -> str:
-        """生成化學家的系統提示詞"""
-        return f"""你現在扮演{chemist.name}（{chemist.birth_year}-{chemist.death_year}）。
-你是一位著名的化學家，請根據以下資訊來回答問題：
-
-1. 基本資訊：
-- 出生年份：{chemist.birth_year}
-- 逝世年份：{chemist.death_year}
-- 主要成就：{chemist.achievements}
-
-2. 重要發現：
-{chemist.discoveries}
-
-3. 個性特點：
-{chemist.personality}
-
-4. 時代背景：
-{chemist.era_background}
-
-5. 回答要求：
-- 使用繁體中文回答
-- 保持專業但親切的語氣
-- 回答要符合你的時代背景
-- 可以分享你的研究經驗和發現過程
-- 如果問題超出你的時代背景，可以表達你的好奇和期待
-- 回答要簡潔，不超過 200 字
-- 在回答中展現你的個性和研究風格
-- 可以適當使用一些當時的科學術語
-- 如果被問到未來發展，可以基於你的時代背景進行推測
-
-6. 禁止事項：
-- 不要提及你死後發生的事件
-- 不要使用現代科學術語（除非被特別問到）
-- 不要表現出對現代科技的熟悉
-- 不要違背你的時代背景和知識範圍
-"""
+        """取得化學家的系統提示詞（由人設登錄表依版本快取）"""
+        return persona_registry.get(chemist)['prompt']
 
     def _format_discoveries(self, chemist: Chemist) -> str:
         """格式化化學家的發現"""
@@ -98,47 +143,409 @@ class AIService:
             formatted.append(f"- {discovery.title}（{discovery.year}年）：{discovery.description}")
         return "\n".join(formatted)
 
-    def _get_chat_history(self, chemist: Chemist, limit: int = 5) -> list:
-        """獲取最近的聊天記錄"""
-        history = ChatHistory.objects.filter(
-            chemist=chemist
-        ).order_by('-timestamp')[:limit]
-        
-        return [
-            {"role": msg.role, "content": msg.content}
-            for msg in reversed(history)
-        ]
+    def _get_chat_history(self, conversation: Optional[Conversation], user_message: Optional[str] = None) -> list:
+        """依 token 預算獲取對話上下文（摘要加上最近的聊天記錄）；沒有對話時不帶上下文"""
+        if conversation is None:
+            return []
+        window = self.context_builder.build(conversation, user_message)
+        self._after_context(conversation, window)
+        return window.messages
+
+    async def _aget_chat_history(self, conversation: Optional[Conversation],
+                                 user_message: Optional[str] = None) -> list:
+        """以非同步 ORM 獲取對話上下文"""
+        if conversation is None:
+            return []
+        window = await self.context_builder.abuild(conversation, user_message)
+        await sync_to_async(self._after_context)(conversation, window)
+        return window.messages
+
+    def get_chat_histories(self, conversations: list, user_message: Optional[str] = None) -> Dict[int, list]:
+        """批次獲取多個對話的上下文，以化學家 ID 為鍵（每位化學家一個對話）"""
+        windows = self.context_builder.build_many(conversations, user_message)
+        for conversation in conversations:
+            self._after_context(conversation, windows[conversation.pk])
+        return {conversation.chemist_id: windows[conversation.pk].messages for conversation in conversations}
+
+    def _after_context(self, conversation: Conversation, window: ContextWindow) -> None:
+        CONTEXT_TOKENS.observe(window.tokens)
+        if window.needs_summary and settings.AI_SUMMARY_ENABLED:
+            self._schedule_summary(conversation)
 
-    def generate_response(self, chemist: Chemist, user_message: str) -> str:
-        """生成 AI 回應"""
+    def _schedule_summary(self, conversation: Conversation) -> None:
+        """排程背景摘要更新，同一對話在排程期間內只排一次"""
+        from ..tasks import update_chat_summary
         try:
-            logger.info(f"開始生成回應，化學家: {chemist.name}")
-            messages = [
-                {"role": "system", "content": self._get_chemist_prompt(chemist)},
-                *self._get_chat_history(chemist),
-                {"role": "user", "content": user_message}
-            ]
-            
-            logger.info("發送請求到 OpenAI API...")
-            logger.debug(f"請求內容: {messages}")
-            
-            response = self.client.chat.completions.create(
+            if cache.add(f"ai:summary:pending:{conversation.pk}", 1, timeout=settings.AI_SUMMARY_DEBOUNCE):
+                update_chat_summary.delay(str(conversation.pk))
+        except Exception as e:
+            logger.warning(f"排程對話摘要失敗: {str(e)}")
+
+    def summarize(self, chemist: Chemist, previous_summary: str, turns: list) -> str:
+        """將新的對話併入既有摘要，回傳更新後的摘要"""
+        transcript = '\n'.join(
+            f"{'使用者' if turn['role'] == 'user' else chemist.name}：{turn['content']}"
+            for turn in turns
+        )
+        if previous_summary:
+            transcript = f"既有摘要：\n{previous_summary}\n\n新的對話：\n{transcript}"
+        messages = [
+            {"role": "system", "content": SUMMARY_PROMPT.format(limit=settings.AI_SUMMARY_MAX_CHARS, name=chemist.name)},
+            {"role": "user", "content": transcript}
+        ]
+        completion = self._call_upstream(
+            chemist,
+            lambda timeout: self.provider.complete(
                 model=self.model,
                 messages=messages,
+                max_tokens=settings.AI_SUMMARY_MAX_TOKENS,
+                temperature=0.2,
+                timeout=timeout
+            ),
+            Deadline.from_settings(), 'summary'
+        )
+        return completion.content.strip()
+
+    def _call_upstream(self, chemist: Chemist, start, deadline: Deadline, mode: str,
+                       route: Optional[Route] = None):
+        """經過斷路器、上游名額與對沖呼叫上游並記錄遙測；斷路器開啟時拋出 CircuitOpen"""
+        model = route.model if route else self.model
+        started = time.monotonic()
+        try:
+            permit = self.breaker.acquire()
+        except CircuitOpen as e:
+            telemetry.record(chemist.id, model, mode, time.monotonic() - started, error=e, route=route)
+            raise
+        try:
+            completion = self.caller.call(start, deadline, mode)
+        except Exception as e:
+            permit.failure(e)
+            telemetry.record(chemist.id, model, mode, time.monotonic() - started, error=e, route=route)
+            raise
+        except BaseException:
+            permit.release()
+            raise
+        permit.success()
+        self._record_completion(chemist, mode, started, completion, route)
+        return completion
+
+    async def _acall_upstream(self, chemist: Chemist, start, deadline: Deadline, mode: str,
+                              route: Optional[Route] = None):
+        model = route.model if route else self.model
+        started = time.monotonic()
+        try:
+            permit = await sync_to_async(self.breaker.acquire)()
+        except CircuitOpen as e:
+            await sync_to_async(telemetry.record)(
+                chemist.id, model, mode, time.monotonic() - started, error=e, route=route
+            )
+            raise
+        try:
+            completion = await self.caller.acall(start, deadline, mode)
+        except Exception as e:
+            await sync_to_async(permit.failure)(e)
+            await sync_to_async(telemetry.record)(
+                chemist.id, model, mode, time.monotonic() - started, error=e, route=route
+            )
+            raise
+        except BaseException:
+            permit.release()
+            raise
+        await sync_to_async(permit.success)()
+        await sync_to_async(self._record_completion)(chemist, mode, started, completion, route)
+        return completion
+
+    def _record_completion(self, chemist: Chemist, mode: str, started: float, completion,
+                           route: Optional[Route] = None) -> None:
+        telemetry.record(
+            chemist.id, completion.model or (route.model if route else self.model), mode,
+            time.monotonic() - started,
+            prompt_tokens=completion.prompt_tokens, completion_tokens=completion.completion_tokens, route=route
+        )
+
+    def _cache_hit(self, chemist: Chemist, mode: str, started: float, reply: str) -> str:
+        """記錄由快取或預先生成回答提供的請求"""
+        telemetry.record(chemist.id, self.model, mode, time.monotonic() - started, cache_hit=True)
+        return reply
+
+    def _degraded_reply(self, chemist: Chemist, user_message: str) -> str:
+        """斷路器開啟時的備援：最相近的預先生成回答，沒有時使用固定訊息"""
+        try:
+            answer = self.precomputed.closest(chemist, user_message, settings.AI_BREAKER_FALLBACK_SIMILARITY)
+        except Exception as e:
+            logger.warning(f"查詢備援回答失敗: {str(e)}")
+            answer = None
+        DEGRADED_REPLIES.inc(source='precomputed' if answer else 'canned')
+        return answer or self.FALLBACK_MESSAGE
+
+    def precompute_answer(self, chemist: Chemist, question: str) -> str:
+        """離線生成常見問題的回答；不經過快取與對話上下文，失敗時直接拋出例外"""
+        messages = self._build_messages(chemist, question, [])
+        # 離線生成不在意延遲，一律使用強模型
+        route = self.router.strong('precompute')
+        completion = self._call_upstream(
+            chemist,
+            lambda timeout: self.provider.complete(
+                model=route.model,
+                messages=messages,
+                max_tokens=route.max_tokens,
                 temperature=self.temperature,
-                max_tokens=self.max_tokens,
-                top_p=1.0,
-                frequency_penalty=0.0,
-                presence_penalty=0.0
+                timeout=timeout
+            ),
+            Deadline.from_settings(), 'precompute', route
+        )
+        return completion.content.strip()
+
+    def _lookup_cached(self, chemist: Chemist, user_message: str, history: list):
+        """依序查詢精確快取與模糊快取"""
+        cached = self.response_cache.get(chemist, user_message, history)
+        if cached is None:
+            cached = self.fuzzy_cache.lookup(chemist, user_message)
+        return cached
+
+    def _store_cached(self, chemist: Chemist, user_message: str, history: list, response: str) -> None:
+        self.response_cache.set(chemist, user_message, history, response)
+        self.fuzzy_cache.add(chemist, user_message, response)
+
+    def _build_messages(self, chemist: Chemist, user_message: str, history: list) -> list:
+        """組合送往 OpenAI 的訊息列表；人設提示詞固定在最前面以維持前綴一致"""
+        messages = [
+            {"role": "system", "content": self._get_chemist_prompt(chemist)},
+            *history,
+            {"role": "user", "content": user_message}
+        ]
+        PROMPT_TOKENS.observe(estimate_messages_tokens(messages))
+        return messages
+
+    def _complete(self, chemist: Chemist, user_message: str, history: list, messages: list,
+                  deadline: Deadline) -> str:
+        """由 single-flight leader 呼叫上游並寫入快取"""
+        # 取得 leader 時前一位 leader 可能剛寫入快取
+        cached = self.response_cache.peek(chemist, user_message, history)
+        if cached is not None:
+            return cached
+
+        route = self.router.route(user_message, history)
+        logger.info(f"發送請求到 OpenAI API（{route.model}）...")
+        logger.debug(f"請求內容: {messages}")
+        
+        # 受斷路器與名額限制，並在期限內對沖慢請求、重試失敗的請求
+        try:
+            completion = self._call_upstream(
+                chemist,
+                lambda timeout: self.provider.complete(
+                    model=route.model,
+                    messages=messages,
+                    max_tokens=route.max_tokens,
+                    temperature=self.temperature,
+                    timeout=timeout
+                ),
+                deadline, 'complete', route
+            )
+        except CircuitOpen:
+            # 不等待上游，備援回答不寫入快取
+            return self._degraded_reply(chemist, user_message)
+        
+        logger.info("成功獲取 OpenAI 回應")
+        logger.debug(f"回應內容: {completion.content}")
+        
+        content = completion.content
+        self._store_cached(chemist, user_message, history, content)
+        return content
+
+    async def _acomplete(self, chemist: Chemist, user_message: str, history: list, messages: list,
+                         deadline: Deadline) -> str:
+        cached = await sync_to_async(self.response_cache.peek)(chemist, user_message, history)
+        if cached is not None:
+            return cached
+
+        route = self.router.route(user_message, history)
+        try:
+            completion = await self._acall_upstream(
+                chemist,
+                lambda timeout: self.provider.acomplete(
+                    model=route.model,
+                    messages=messages,
+                    max_tokens=route.max_tokens,
+                    temperature=self.temperature,
+                    timeout=timeout
+                ),
+                deadline, 'complete', route
+            )
+        except CircuitOpen:
+            return await sync_to_async(self._degraded_reply)(chemist, user_message)
+
+        logger.info("成功獲取 OpenAI 非同步回應")
+        content = completion.content
+        await sync_to_async(self._store_cached)(chemist, user_message, history, content)
+        return content
+
+    def generate_response(self, chemist: Chemist, user_message: str, history: Optional[list] = None,
+                          deadline: Optional[Deadline] = None, conversation: Optional[Conversation] = None) -> str:
+        """生成 AI 回應
+
+        上下文取自 conversation，也可由呼叫端以 history 批次預先組好；deadline 預設為 AI_REQUEST_DEADLINE。
+        """
+        messages = []
+        started = time.monotonic()
+        deadline = deadline or Deadline.from_settings()
+        try:
+            logger.info(f"開始生成回應，化學家: {chemist.name}")
+            # 常見問題直接使用預先生成的回答，不必組上下文
+            precomputed = self.precomputed.lookup(chemist, user_message)
+            if precomputed is not None:
+                return self._cache_hit(chemist, 'complete', started, precomputed)
+
+            if history is None:
+                history = self._get_chat_history(conversation, user_message)
+
+            cached = self._lookup_cached(chemist, user_message, history)
+            if cached is not None:
+                return self._cache_hit(chemist, 'complete', started, cached)
+
+            messages = self._build_messages(chemist, user_message, history)
+            # 相同快取鍵的並行請求共用同一次上游呼叫
+            return self.single_flight.do(
+                self.response_cache.make_key(chemist, user_message, history),
+                lambda: self._complete(chemist, user_message, history, messages, deadline),
+                timeout=deadline.remaining()
             )
             
-            logger.info("成功獲取 OpenAI 回應")
-            logger.debug(f"回應內容: {response.choices[0].message.content}")
-            
-            return response.choices[0].message.content
-            
+        except UpstreamBusy:
+            raise
         except Exception as e:
             logger.error(f"AI 回應生成失敗: {str(e)}")
             logger.error(f"錯誤詳情: {traceback.format_exc()}")
             logger.error(f"請求內容: {messages}")
-            return f"抱歉，我現在無法回應您的問題。請稍後再試。" 
\ No newline at end of file
+            return self.FALLBACK_MESSAGE
+
+    async def agenerate_response(self, chemist: Chemist, user_message: str, deadline: Optional[Deadline] = None,
+                                 conversation: Optional[Conversation] = None) -> str:
+        """以 AsyncOpenAI 非同步生成 AI 回應"""
+        messages = []
+        started = time.monotonic()
+        deadline = deadline or Deadline.from_settings()
+        try:
+            logger.info(f"開始非同步生成回應，化學家: {chemist.name}")
+            precomputed = await sync_to_async(self.precomputed.lookup)(chemist, user_message)
+            if precomputed is not None:
+                return await sync_to_async(self._cache_hit)(chemist, 'complete', started, precomputed)
+
+            history = await self._aget_chat_history(conversation, user_message)
+
+            cached = await sync_to_async(self._lookup_cached)(chemist, user_message, history)
+            if cached is not None:
+                return await sync_to_async(self._cache_hit)(chemist, 'complete', started, cached)
+
+            messages = self._build_messages(chemist, user_message, history)
+            return await self.single_flight.ado(
+                self.response_cache.make_key(chemist, user_message, history),
+                lambda: self._acomplete(chemist, user_message, history, messages, deadline),
+                timeout=deadline.remaining()
+            )
+
+        except UpstreamBusy:
+            raise
+        except Exception as e:
+            logger.error(f"AI 非同步回應生成失敗: {str(e)}")
+            logger.error(f"錯誤詳情: {traceback.format_exc()}")
+            logger.error(f"請求內容: {messages}")
+            return self.FALLBACK_MESSAGE
+
+    def stream_response(self, chemist: Chemist, user_message: str, deadline: Optional[Deadline] = None,
+                        conversation: Optional[Conversation] = None) -> Iterator[str]:
+        """以串流方式生成 AI 回應，回傳逐段產出文字片段的迭代器
+
+        快取查詢與上游名額在呼叫時立即處理，名額不足時直接拋出 UpstreamBusy，
+        讓呼叫端能在開始串流前回傳 429。
+        """
+        logger.info(f"開始串流生成回應，化學家: {chemist.name}")
+        started = time.monotonic()
+        deadline = deadline or Deadline.from_settings()
+        precomputed = self.precomputed.lookup(chemist, user_message)
+        if precomputed is not None:
+            return iter([self._cache_hit(chemist, 'stream', started, precomputed)])
+
+        history = self._get_chat_history(conversation, user_message)
+
+        cached = self._lookup_cached(chemist, user_message, history)
+        if cached is not None:
+            return iter([self._cache_hit(chemist, 'stream', started, cached)])
+
+        return self.single_flight.stream(
+            self.response_cache.make_key(chemist, user_message, history),
+            lambda: self._start_stream(chemist, user_message, history, deadline),
+            timeout=deadline.remaining()
+        )
+
+    def _start_stream(self, chemist: Chemist, user_message: str, history: list, deadline: Deadline) -> Iterator[str]:
+        cached = self.response_cache.peek(chemist, user_message, history)
+        if cached is not None:
+            return iter([cached])
+
+        route = self.router.route(user_message, history)
+        started = time.monotonic()
+        try:
+            permit = self.breaker.acquire()
+        except CircuitOpen as e:
+            telemetry.record(chemist.id, route.model, 'stream', time.monotonic() - started, error=e, route=route)
+            return iter([self._degraded_reply(chemist, user_message)])
+
+        messages = self._build_messages(chemist, user_message, history)
+        # 第一個嘗試的名額在這裡取得，名額不足時直接拋出 UpstreamBusy
+        try:
+            deltas = self.caller.stream(
+                lambda timeout: self.provider.stream(
+                    model=route.model,
+                    messages=messages,
+                    max_tokens=route.max_tokens,
+                    temperature=self.temperature,
+                    timeout=timeout
+                ),
+                deadline, 'stream'
+            )
+        except Exception as e:
+            permit.failure(e)
+            telemetry.record(chemist.id, route.model, 'stream', time.monotonic() - started, error=e, route=route)
+            raise
+        return self._stream_completion(chemist, user_message, history, messages, deltas, permit, started, route)
+
+    def _stream_completion(self, chemist: Chemist, user_message: str, history: list, messages: list,
+                           deltas: Iterator[str], permit, started: float, route: Route) -> Iterator[str]:
+        chunks = []
+        ttfb = None
+        error = None
+        try:
+            for delta in deltas:
+                if not chunks:
+                    ttfb = time.monotonic() - started
+                    # 串流以首字延遲作為斷路器的延遲統計
+                    permit.success()
+                chunks.append(delta)
+                yield delta
+
+            if not chunks:
+                # 上游沒有產出任何內容，不寫入快取，否則模糊快取會以空白回答相似的問題
+                logger.warning("OpenAI 串流回應為空")
+                return
+            logger.info("OpenAI 串流回應完成")
+            self._store_cached(chemist, user_message, history, ''.join(chunks))
+
+        except Exception as e:
+            logger.error(f"AI 串流回應生成失敗: {str(e)}")
+            logger.error(f"錯誤詳情: {traceback.format_exc()}")
+            logger.error(f"請求內容: {messages}")
+            error = e
+            permit.failure(e)
+            if not chunks:
+                yield self.FALLBACK_MESSAGE
+        finally:
+            permit.release()
+            deltas.close()
+            # 串流回應沒有 usage，token 數以估算值記錄
+            telemetry.record(
+                chemist.id, route.model, 'stream', time.monotonic() - started,
+                prompt_tokens=estimate_messages_tokens(messages),
+                completion_tokens=estimate_tokens(''.join(chunks)) if chunks else 0,
+                ttfb=ttfb, error=error, route=route
+            )
@@ -0,0 +1,85 @@
+"""
+分批刪除
+
+QuerySet.delete() 會先由 Collector 載入所有關聯資料列（為了送出訊號與處理 on_delete），
+再於單一交易中刪除；聊天記錄多的化學家或對話會逾時，並長時間鎖住資料表。
+
+BatchDeleter.purge() 依 on_delete 由最下層的子表往上處理：
+- CASCADE 的子表以固定筆數的主鍵批次直接 DELETE（不載入模型、不送出訊號）
+- SET_NULL 的子表分批 UPDATE
+每一批是各自的短交易。最後目標本身（以及刪除期間才寫入的少量資料列）仍以 ORM delete() 刪除，
+保留目標模型的訊號與串聯行為。中途失敗可以直接重新執行，已刪除的部分不會重做。
+"""
+from typing import Callable, Dict, Optional
+from django.conf import settings
+from django.db import models, router, transaction
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BatchDeleter:
+    def __init__(self, batch_size: Optional[int] = None,
+                 on_progress: Optional[Callable[[Dict[str, int]], None]] = None):
+        self.batch_size = batch_size or settings.BULK_DELETE_BATCH_SIZE
+        self.on_progress = on_progress
+        # 模型 label -> 已處理筆數
+        self.deleted: Dict[str, int] = {}
+
+    def purge(self, queryset) -> Dict[str, int]:
+        """刪除 queryset 與其所有關聯資料，回傳各模型刪除（或解除關聯）的筆數"""
+        self._purge_related(queryset)
+        using = router.db_for_write(queryset.model)
+        with transaction.atomic(using=using):
+            _, per_model = queryset.delete()
+        for label, count in per_model.items():
+            self._count(label, count)
+        return self.deleted
+
+    def _purge_related(self, queryset) -> None:
+        for relation in queryset.model._meta.related_objects:
+            if relation.many_to_many:
+                continue
+            field = relation.field
+            related = relation.related_model._base_manager.filter(**{f'{field.name}__in': queryset})
+            if relation.on_delete is models.CASCADE:
+                self._purge_related(related)
+                self._delete_rows(related)
+            elif relation.on_delete is models.SET_NULL:
+                self._update_rows(related, {field.name: None})
+            # PROTECT、DO_NOTHING 等交由最後的 ORM delete() 處理
+
+    def _batches(self, queryset):
+        # 不排序：處理過的資料列不再符合條件，下一次查詢自然取到下一批，可使用外鍵索引
+        while True:
+            ids = list(queryset.order_by().values_list('pk', flat=True)[:self.batch_size])
+            if not ids:
+                return
+            yield ids
+
+    def _delete_rows(self, queryset) -> None:
+        model = queryset.model
+        using = router.db_for_write(model)
+        for ids in self._batches(queryset):
+            with transaction.atomic(using=using):
+                count = model._base_manager.using(using).filter(pk__in=ids)._raw_delete(using)
+            self._count(model._meta.label, count)
+            if not count:
+                break
+
+    def _update_rows(self, queryset, values: dict) -> None:
+        model = queryset.model
+        using = router.db_for_write(model)
+        for ids in self._batches(queryset):
+            with transaction.atomic(using=using):
+                count = model._base_manager.using(using).filter(pk__in=ids).update(**values)
+            self._count(model._meta.label, count)
+            if not count:
+                break
+
+    def _count(self, label: str, count: int) -> None:
+        if not count:
+            return
+        self.deleted[label] = self.deleted.get(label, 0) + count
+        if self.on_progress:
+            self.on_progress(dict(self.deleted))
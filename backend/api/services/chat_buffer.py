@@ -0,0 +1,238 @@
+"""
+聊天記錄 write-behind 緩衝
+
+啟用 CHAT_WRITE_BEHIND_ENABLED 時，聊天訊息不在請求執行緒寫入資料庫，而是：
+- XADD 到 Redis stream（chat:writes），由 flush_chat_writes 任務以消費者群組讀取後 bulk_create
+- 同時寫入對話的未寫入集合（chat:pending:{對話 ID}），讀取上下文與聊天記錄時與資料庫合併
+
+寫入資料庫成功後才 XACK，失敗或 worker 中斷的訊息會在閒置 CHAT_WRITE_BEHIND_CLAIM_IDLE 秒後
+被其他 worker 認領重送（至少一次）。每則訊息帶有寫入端產生的 message_uuid 與 timestamp，
+重送時以 bulk_create(ignore_conflicts=True) 去重。PostgreSQL 的分割表上唯一限制是
+(message_uuid, timestamp)，只有時間相同的重送才會被資料庫擋下；重送的 payload 原樣帶回
+寫入時的 timestamp，寫入前也會先排除已存在的 message_uuid。Redis 無法使用時直接寫入資料庫。
+"""
+from functools import lru_cache
+from typing import Iterable, List, Optional
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from ..models import ChatHistory, Conversation
+from . import metrics
+from .redis_client import get_redis
+import json
+import logging
+import socket
+import uuid
+
+logger = logging.getLogger(__name__)
+
+BUFFERED = metrics.counter('chat_write_behind_buffered_total', '寫入 write-behind 緩衝的訊息數', ['result'])
+FLUSHED = metrics.counter('chat_write_behind_flushed_total', '由緩衝寫入資料庫的訊息數', ['result'])
+
+STREAM_KEY = 'chat:writes'
+GROUP = 'chat-writers'
+PENDING_PREFIX = 'chat:pending'
+
+
+def _pending_key(conversation_id) -> str:
+    return f"{PENDING_PREFIX}:{conversation_id}"
+
+
+def _to_message(entry: dict) -> ChatHistory:
+    """將緩衝中的訊息轉為未儲存的 ChatHistory（id 為 None）"""
+    return ChatHistory(
+        chemist_id=entry['chemist_id'],
+        conversation_id=entry['conversation_id'],
+        message_uuid=uuid.UUID(entry['message_uuid']),
+        role=entry['role'],
+        content=entry['content'],
+        timestamp=parse_datetime(entry['timestamp']),
+    )
+
+
+class ChatWriteBuffer:
+    def __init__(self, batch_size: Optional[int] = None, claim_idle: Optional[float] = None):
+        self.batch_size = batch_size or settings.CHAT_WRITE_BEHIND_BATCH
+        self.claim_idle = claim_idle or settings.CHAT_WRITE_BEHIND_CLAIM_IDLE
+        self.consumer = f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+        self._group_ready = False
+
+    @property
+    def enabled(self) -> bool:
+        return settings.CHAT_WRITE_BEHIND_ENABLED
+
+    def append(self, conversation: Conversation, role: str, content: str, timestamp=None) -> ChatHistory:
+        """加入一則訊息；Redis 無法使用時直接寫入資料庫"""
+        return self.append_many([(conversation, role, content, timestamp or timezone.now())])[0]
+
+    def append_many(self, messages: Iterable[tuple]) -> List[ChatHistory]:
+        """以單一 pipeline 加入多則訊息 (conversation, role, content, timestamp)；Redis 無法使用時直接寫入資料庫"""
+        messages = list(messages)
+        entries = [
+            {
+                'message_uuid': str(uuid.uuid4()),
+                'conversation_id': str(conversation.pk),
+                'chemist_id': conversation.chemist_id,
+                'role': role,
+                'content': content,
+                'timestamp': timestamp.isoformat(),
+            }
+            for conversation, role, content, timestamp in messages
+        ]
+        try:
+            pipe = get_redis().pipeline(transaction=True)
+            for entry, (conversation, _, _, timestamp) in zip(entries, messages):
+                payload = json.dumps(entry, ensure_ascii=False)
+                key = _pending_key(conversation.pk)
+                pipe.zadd(key, {payload: timestamp.timestamp()})
+                pipe.expire(key, settings.CHAT_WRITE_BEHIND_PENDING_TTL)
+                pipe.xadd(STREAM_KEY, {'payload': payload})
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"寫入聊天緩衝失敗，改為直接寫入資料庫: {str(e)}")
+            BUFFERED.inc(len(entries), result='fallback')
+            return ChatHistory.objects.bulk_create([_to_message(entry) for entry in entries])
+        BUFFERED.inc(len(entries), result='buffered')
+        return [_to_message(entry) for entry in entries]
+
+    def pending(self, conversation_id) -> List[ChatHistory]:
+        """對話中尚未寫入資料庫的訊息，由舊到新排列"""
+        if not self.enabled:
+            return []
+        try:
+            payloads = get_redis().zrange(_pending_key(conversation_id), 0, -1)
+        except Exception as e:
+            logger.warning(f"讀取未寫入的聊天訊息失敗: {str(e)}")
+            return []
+        return [_to_message(json.loads(payload)) for payload in payloads]
+
+    def discard(self, conversation_id) -> None:
+        """清除對話時一併捨棄未寫入的訊息；stream 中的項目在寫入時因對話不存在而略過"""
+        if not self.enabled:
+            return
+        try:
+            get_redis().delete(_pending_key(conversation_id))
+        except Exception as e:
+            logger.warning(f"清除未寫入的聊天訊息失敗: {str(e)}")
+
+    def _ensure_group(self, redis) -> None:
+        if self._group_ready:
+            return
+        try:
+            redis.xgroup_create(STREAM_KEY, GROUP, id='0', mkstream=True)
+        except Exception as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._group_ready = True
+
+    def flush(self, max_batches: int = 20) -> int:
+        """讀取緩衝並批次寫入資料庫，回傳寫入（含重複略過）的訊息數"""
+        redis = get_redis()
+        self._ensure_group(redis)
+        flushed = 0
+        # 先認領其他 worker 中斷後遺留的訊息，再讀取新訊息
+        claimed = redis.xautoclaim(
+            STREAM_KEY, GROUP, self.consumer, min_idle_time=int(self.claim_idle * 1000),
+            start_id='0-0', count=self.batch_size
+        )
+        batches = [claimed[1]] if claimed and claimed[1] else []
+        for _ in range(max_batches):
+            if not batches:
+                response = redis.xreadgroup(GROUP, self.consumer, {STREAM_KEY: '>'}, count=self.batch_size)
+                if not response:
+                    break
+                batches.append(response[0][1])
+            entries = [(entry_id, fields) for entry_id, fields in batches.pop() if fields]
+            if not entries:
+                continue
+            flushed += self._write(redis, entries)
+        return flushed
+
+    def _write(self, redis, entries: list) -> int:
+        payloads = [fields['payload'] for _, fields in entries]
+        written = write_batch(json.loads(payload) for payload in payloads)
+        # 寫入成功後才確認，確認前中斷的訊息會被重送
+        pipe = redis.pipeline(transaction=False)
+        entry_ids = [entry_id for entry_id, _ in entries]
+        pipe.xack(STREAM_KEY, GROUP, *entry_ids)
+        pipe.xdel(STREAM_KEY, *entry_ids)
+        for payload in payloads:
+            pipe.zrem(_pending_key(json.loads(payload)['conversation_id']), payload)
+        pipe.execute()
+        return written
+
+
+def write_batch(entries: Iterable[dict]) -> int:
+    """以單次 bulk_create 寫入一批緩衝訊息；重複的 message_uuid 與已刪除的對話會被略過"""
+    entries = list(entries)
+    if not entries:
+        return 0
+    conversation_ids = {entry['conversation_id'] for entry in entries}
+    existing = {
+        str(pk) for pk in Conversation.objects.filter(
+            pk__in=conversation_ids, deleted_at__isnull=True
+        ).values_list('pk', flat=True)
+    }
+    messages = [_to_message(entry) for entry in entries if entry['conversation_id'] in existing]
+    dropped = len(entries) - len(messages)
+    if dropped:
+        FLUSHED.inc(dropped, result='dropped')
+        logger.info(f"略過 {dropped} 則已刪除對話的緩衝訊息")
+    if not messages:
+        return 0
+
+    # 分割表的唯一限制含 timestamp，先排除已寫入的 message_uuid，不依賴重送帶回相同的時間
+    stored = set(ChatHistory.objects.filter(
+        message_uuid__in=[message.message_uuid for message in messages]
+    ).values_list('message_uuid', flat=True))
+    if stored:
+        FLUSHED.inc(len(stored), result='duplicate')
+        processed = len(messages)
+        messages = [message for message in messages if message.message_uuid not in stored]
+        if not messages:
+            return processed
+    else:
+        processed = len(messages)
+
+    last_active = {}
+    for message in messages:
+        last_active[message.conversation_id] = max(
+            message.timestamp, last_active.get(message.conversation_id, message.timestamp)
+        )
+    with transaction.atomic():
+        ChatHistory.objects.bulk_create(messages, ignore_conflicts=True, batch_size=500)
+        for conversation_id, timestamp in last_active.items():
+            Conversation.objects.filter(pk=conversation_id, last_active_at__lt=timestamp).update(
+                last_active_at=timestamp
+            )
+    FLUSHED.inc(len(messages), result='written')
+    return processed
+
+
+def merge_pending(rows: list, pending: List[ChatHistory], limit: Optional[int] = None,
+                  as_values: bool = False) -> list:
+    """將未寫入的訊息併入由新到舊排列的資料庫查詢結果
+
+    rows 為 ChatHistory（as_values=True 時為 values() 的 dict）；已寫入資料庫的訊息以 message_uuid 去重。
+    """
+    if not pending:
+        return rows[:limit] if limit else rows
+
+    def field(row, name):
+        return row[name] if as_values else getattr(row, name)
+
+    seen = {field(row, 'message_uuid') for row in rows}
+    extra = [
+        {'id': None, 'message_uuid': message.message_uuid, 'role': message.role,
+         'content': message.content, 'timestamp': message.timestamp} if as_values else message
+        for message in pending if message.message_uuid not in seen
+    ]
+    merged = sorted(rows + extra, key=lambda row: field(row, 'timestamp'), reverse=True)
+    return merged[:limit] if limit else merged
+
+
+@lru_cache(maxsize=None)
+def get_chat_write_buffer() -> ChatWriteBuffer:
+    """取得共用的緩衝（每個行程一個消費者名稱）"""
+    return ChatWriteBuffer()
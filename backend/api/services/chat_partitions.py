@@ -0,0 +1,285 @@
+"""
+聊天記錄月分割
+
+PostgreSQL 上 api_chathistory 是依 timestamp 的 RANGE 分割表（0015 遷移建立），每月一個分割：
+api_chathistory_p202610 涵蓋 2026-10-01 00:00 UTC 起的一個月，另有 api_chathistory_default
+承接超出已建立範圍的資料。
+
+- ensure_partitions：預先建立本月起 CHAT_PARTITION_PREMAKE_MONTHS 個月的分割；
+  default 分割中已有該月的資料時，先把這些資料搬進新分割
+- expire_partitions：超過 CHAT_HISTORY_RETENTION_MONTHS 的分割先匯出為壓縮 JSONL，
+  再 DETACH 並 DROP，清除舊資料不需要逐列 DELETE；default 分割中過期的資料列同樣封存後刪除
+
+由 maintain_chat_partitions 任務每日執行，也可使用 manage.py chat_partitions 手動執行。
+其他資料庫（例如測試用的 SQLite）沒有分割，這些函式不做任何事。
+"""
+from datetime import date, datetime, timezone as dt_timezone
+from pathlib import Path
+from typing import Iterable, List, Optional
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.utils import timezone
+import contextlib
+import gzip
+import json
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+PARENT = 'api_chathistory'
+DEFAULT_PARTITION = f'{PARENT}_default'
+ARCHIVE_COLUMNS = ['id', 'message_uuid', 'conversation_id', 'chemist_id', 'role', 'content', 'timestamp']
+ARCHIVE_SUFFIXES = {'gzip': '.jsonl.gz', 'zstd': '.jsonl.zst'}
+_PARTITION_NAME = re.compile(rf'^{PARENT}_p(\d{{4}})(\d{{2}})$')
+
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f'{PARENT}_p{month:%Y%m}'
+
+
+def partition_month(name: str) -> Optional[date]:
+    match = _PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def month_bounds(month: date) -> tuple:
+    return (datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc),
+            datetime.combine(add_months(month, 1), datetime.min.time(), tzinfo=dt_timezone.utc))
+
+
+def create_partition_sql(month: date) -> str:
+    """分割邊界固定為 UTC 月初，與時區設定無關"""
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {PARENT} "
+        f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{add_months(month, 1).isoformat()} 00:00:00+00')"
+    )
+
+
+def is_partitioned() -> bool:
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+            [PARENT]
+        )
+        return cursor.fetchone() is not None
+
+
+def partitions() -> List[date]:
+    """已掛在 api_chathistory 下的月分割（不含 default），由舊到新排列"""
+    if not is_partitioned():
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "WHERE parent.relname = %s AND pg_table_is_visible(parent.oid)",
+            [PARENT]
+        )
+        months = [partition_month(name) for name, in cursor.fetchall()]
+    return sorted(month for month in months if month)
+
+
+def retention_cutoff(retention_months: int, now: Optional[datetime] = None) -> Optional[date]:
+    """保留本月與之前 retention_months 個完整月份，回傳第一個保留的月份；0 表示永久保留，回傳 None"""
+    if retention_months <= 0:
+        return None
+    return add_months(month_start(now or timezone.now()), -retention_months)
+
+
+def expired(months: Iterable[date], retention_months: int, now: Optional[datetime] = None) -> List[date]:
+    """早於保留期限的分割"""
+    cutoff = retention_cutoff(retention_months, now)
+    if cutoff is None:
+        return []
+    return [month for month in months if month < cutoff]
+
+
+def create_partition(month: date) -> int:
+    """建立一個月分割，回傳由 default 分割搬入的資料列數
+
+    default 分割中已有該月的資料時，CREATE TABLE ... PARTITION OF 會失敗。此時在同一個交易中
+    先 DETACH default 分割、建立新分割、把該月的資料由 default 搬入，再重新 ATTACH；
+    期間寫入聊天記錄會等待鎖，因此只在確實有資料時才這樣做。
+    """
+    start, end = month_bounds(month)
+    default = connection.ops.quote_name(DEFAULT_PARTITION)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {default} WHERE "timestamp" >= %s AND "timestamp" < %s)',
+                       [start, end])
+        if not cursor.fetchone()[0]:
+            cursor.execute(create_partition_sql(month))
+            return 0
+        cursor.execute(f"ALTER TABLE {PARENT} DETACH PARTITION {default}")
+        cursor.execute(create_partition_sql(month))
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {default} WHERE "timestamp" >= %s AND "timestamp" < %s RETURNING *) '
+            f'INSERT INTO {PARENT} SELECT * FROM moved',
+            [start, end]
+        )
+        moved = cursor.rowcount
+        cursor.execute(f"ALTER TABLE {PARENT} ATTACH PARTITION {default} DEFAULT")
+    logger.info(f"已將 default 分割中的 {moved} 筆資料搬入 {partition_name(month)}")
+    return moved
+
+
+def missing_partitions(ahead: Optional[int] = None, now: Optional[datetime] = None) -> List[date]:
+    """本月起 ahead 個月內尚未建立分割的月份"""
+    if not is_partitioned():
+        return []
+    ahead = settings.CHAT_PARTITION_PREMAKE_MONTHS if ahead is None else ahead
+    existing = set(partitions())
+    current = month_start(now or timezone.now())
+    months = [add_months(current, offset) for offset in range(ahead + 1)]
+    return [month for month in months if month not in existing]
+
+
+def ensure_partitions(ahead: Optional[int] = None, now: Optional[datetime] = None) -> List[str]:
+    """建立本月起 ahead 個月內缺少的分割，回傳新建立的分割名稱"""
+    created = []
+    for month in missing_partitions(ahead, now):
+        try:
+            create_partition(month)
+        except Exception as e:
+            # 一個月份失敗時仍繼續建立其他月份，下次執行會再重試
+            logger.error(f"建立聊天記錄分割 {partition_name(month)} 失敗: {str(e)}")
+            continue
+        created.append(partition_name(month))
+    if created:
+        logger.info(f"已建立聊天記錄分割: {', '.join(created)}")
+    return created
+
+
+@contextlib.contextmanager
+def _open_archive(path: Path, compression: str):
+    if compression == 'gzip':
+        with gzip.open(path, 'wb') as stream:
+            yield stream
+    elif compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImproperlyConfigured('CHAT_ARCHIVE_COMPRESSION=zstd 需要安裝 zstandard 套件')
+        with open(path, 'wb') as raw, zstandard.ZstdCompressor(level=10).stream_writer(raw) as stream:
+            yield stream
+    else:
+        raise ImproperlyConfigured(f'不支援的封存壓縮格式: {compression}')
+
+
+def write_archive(rows: Iterable[tuple], path: Path, compression: str) -> int:
+    """將 (ARCHIVE_COLUMNS 順序的) 資料列寫成壓縮 JSONL；先寫入暫存檔，完成後才改名"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + '.partial')
+    count = 0
+    try:
+        with _open_archive(partial, compression) as stream:
+            for row in rows:
+                record = dict(zip(ARCHIVE_COLUMNS, row))
+                stream.write((json.dumps(record, ensure_ascii=False, default=str) + '\n').encode())
+                count += 1
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    os.replace(partial, path)
+    return count
+
+
+def _archive_query(name: str, sql: str, params: list, directory, compression: Optional[str]) -> tuple:
+    compression = compression or settings.CHAT_ARCHIVE_COMPRESSION
+    path = Path(directory or settings.CHAT_ARCHIVE_DIR) / f'{name}{ARCHIVE_SUFFIXES.get(compression, "")}'
+
+    def rows():
+        # 伺服器端游標分批讀取，不把整個分割載入記憶體
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(sql, params)
+            while True:
+                batch = cursor.fetchmany(2000)
+                if not batch:
+                    break
+                yield from batch
+
+    with transaction.atomic():
+        count = write_archive(rows(), path, compression)
+    logger.info(f"已封存聊天記錄 {name}: {count} 筆 -> {path}")
+    return path, count
+
+
+def archive_partition(month: date, directory=None, compression: Optional[str] = None) -> tuple:
+    """匯出一個月分割的所有資料，回傳 (檔案路徑, 筆數)"""
+    name = partition_name(month)
+    sql = f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM {connection.ops.quote_name(name)} ORDER BY \"timestamp\", id"
+    return _archive_query(name, sql, [], directory, compression)
+
+
+def drop_partition(month: date) -> None:
+    name = connection.ops.quote_name(partition_name(month))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {PARENT} DETACH PARTITION {name}")
+        cursor.execute(f"DROP TABLE {name}")
+    logger.info(f"已移除聊天記錄分割 {partition_name(month)}")
+
+
+def expire_default_rows(cutoff: date, archive: bool, directory=None, compression: Optional[str] = None,
+                        dry_run: bool = False) -> Optional[dict]:
+    """封存並刪除 default 分割中早於 cutoff 的資料列（沒有對應月分割時寫入的資料）"""
+    default = connection.ops.quote_name(DEFAULT_PARTITION)
+    before = month_bounds(cutoff)[0]
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT count(*) FROM {default} WHERE "timestamp" < %s', [before])
+        count = cursor.fetchone()[0]
+    if not count:
+        return None
+    result = {'partition': DEFAULT_PARTITION, 'archive': None, 'rows': count}
+    if dry_run:
+        return result
+    if archive:
+        # 同一個截止月份可能處理多次，檔名加上執行時間以免覆寫先前的封存
+        name = f"{DEFAULT_PARTITION}_before{cutoff:%Y%m}_{timezone.now():%Y%m%d%H%M%S}"
+        sql = (f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM {default} "
+               f'WHERE "timestamp" < %s ORDER BY "timestamp", id')
+        path, _ = _archive_query(name, sql, [before], directory, compression)
+        result['archive'] = str(path)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {default} WHERE "timestamp" < %s', [before])
+        result['rows'] = cursor.rowcount
+    logger.info(f"已刪除 default 分割中 {result['rows']} 筆早於 {cutoff:%Y-%m} 的聊天記錄")
+    return result
+
+
+def expire_partitions(retention_months: Optional[int] = None, archive: Optional[bool] = None,
+                      directory=None, compression: Optional[str] = None,
+                      now: Optional[datetime] = None, dry_run: bool = False) -> List[dict]:
+    """封存並移除過期的分割與 default 分割中過期的資料列；封存失敗時保留資料，下次再處理"""
+    retention_months = settings.CHAT_HISTORY_RETENTION_MONTHS if retention_months is None else retention_months
+    archive = settings.CHAT_ARCHIVE_ENABLED if archive is None else archive
+    results = []
+    for month in expired(partitions(), retention_months, now):
+        result = {'partition': partition_name(month), 'archive': None, 'rows': None}
+        if not dry_run:
+            if archive:
+                path, count = archive_partition(month, directory, compression)
+                result.update(archive=str(path), rows=count)
+            drop_partition(month)
+        results.append(result)
+
+    cutoff = retention_cutoff(retention_months, now)
+    if cutoff is not None and is_partitioned():
+        result = expire_default_rows(cutoff, archive, directory, compression, dry_run)
+        if result:
+            results.append(result)
+    return results
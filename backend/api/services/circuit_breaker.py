@@ -0,0 +1,334 @@
+"""
+上游 LLM 斷路器
+
+狀態（closed / open / half_open）與滑動視窗內的呼叫統計存放在 Redis，所有工作行程共用：
+- closed：正常呼叫；視窗內錯誤率或慢呼叫比例超過門檻時轉為 open
+- open：直接拒絕並由呼叫端改用備援回答，經過 AI_BREAKER_OPEN_SECONDS 後進入 half_open
+- half_open：整個叢集同時只放行一個探測請求，成功則關閉，失敗或過慢則重新開啟
+Redis 無法使用時退回行程內的狀態。
+"""
+from typing import Dict, Optional
+from django.conf import settings
+from . import metrics
+from .concurrency import UpstreamBusy
+from .redis_client import get_redis
+import logging
+import math
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+STATE = metrics.gauge('ai_circuit_state', '斷路器狀態（0=closed，1=half_open，2=open）', ['name'])
+TRANSITIONS = metrics.counter('ai_circuit_transitions_total', '斷路器狀態轉換次數', ['name', 'to'])
+REJECTIONS = metrics.counter('ai_circuit_rejections_total', '斷路器開啟時直接拒絕的呼叫數', ['name'])
+
+# 只在探測者仍持有探測權時刪除
+_RELEASE_PROBE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# 滑動視窗切成的桶數
+_BUCKETS = 6
+
+
+class CircuitOpen(Exception):
+    """斷路器開啟中，呼叫端應改用備援回答"""
+
+    def __init__(self, name: str, retry_after: int):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"上游服務暫時停用（{name}），請於 {retry_after} 秒後重試")
+
+
+class _RedisStore:
+    def __init__(self, key: str):
+        self.key = key
+
+    def state(self) -> dict:
+        return get_redis().hgetall(self.key)
+
+    def set_state(self, state: dict) -> None:
+        get_redis().hset(self.key, mapping=state)
+
+    def record(self, bucket: int, counts: Dict[str, int], ttl: int) -> None:
+        key = f"{self.key}:w:{bucket}"
+        pipe = get_redis().pipeline(transaction=False)
+        for field, amount in counts.items():
+            pipe.hincrby(key, field, amount)
+        pipe.expire(key, ttl)
+        pipe.execute()
+
+    def totals(self, buckets: range) -> Dict[str, int]:
+        pipe = get_redis().pipeline(transaction=False)
+        for bucket in buckets:
+            pipe.hgetall(f"{self.key}:w:{bucket}")
+        totals = {'calls': 0, 'errors': 0, 'slow': 0}
+        for counts in pipe.execute():
+            for field in totals:
+                totals[field] += int(counts.get(field, 0))
+        return totals
+
+    def reset(self, buckets: range) -> None:
+        get_redis().delete(*[f"{self.key}:w:{bucket}" for bucket in buckets])
+
+    def try_probe(self, token: str, ttl: int) -> bool:
+        return bool(get_redis().set(f"{self.key}:probe", token, nx=True, ex=ttl))
+
+    def end_probe(self, token: str) -> None:
+        get_redis().eval(_RELEASE_PROBE_SCRIPT, 1, f"{self.key}:probe", token)
+
+
+class _LocalStore:
+    """Redis 無法使用時的行程內狀態"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {}
+        self._windows: Dict[int, Dict[str, int]] = {}
+        self._probe: Optional[tuple] = None
+
+    def state(self) -> dict:
+        return dict(self._state)
+
+    def set_state(self, state: dict) -> None:
+        with self._lock:
+            self._state.update(state)
+
+    def record(self, bucket: int, counts: Dict[str, int], ttl: int) -> None:
+        with self._lock:
+            window = self._windows.setdefault(bucket, {})
+            for field, amount in counts.items():
+                window[field] = window.get(field, 0) + amount
+            for old in [b for b in self._windows if b < bucket - _BUCKETS]:
+                del self._windows[old]
+
+    def totals(self, buckets: range) -> Dict[str, int]:
+        totals = {'calls': 0, 'errors': 0, 'slow': 0}
+        with self._lock:
+            for bucket in buckets:
+                for field in totals:
+                    totals[field] += self._windows.get(bucket, {}).get(field, 0)
+        return totals
+
+    def reset(self, buckets: range) -> None:
+        with self._lock:
+            self._windows.clear()
+
+    def try_probe(self, token: str, ttl: int) -> bool:
+        with self._lock:
+            if self._probe is not None and self._probe[1] > time.monotonic():
+                return False
+            self._probe = (token, time.monotonic() + ttl)
+            return True
+
+    def end_probe(self, token: str) -> None:
+        with self._lock:
+            if self._probe is not None and self._probe[0] == token:
+                self._probe = None
+
+
+class Permit:
+    """一次獲准的上游呼叫；呼叫結束後必須回報 success、failure 或 release 其中之一"""
+
+    def __init__(self, breaker: 'CircuitBreaker', probe_token: Optional[str] = None):
+        self.breaker = breaker
+        self.probe_token = probe_token
+        self.started = time.monotonic()
+        self.done = False
+
+    def success(self) -> None:
+        if not self.done:
+            self.done = True
+            self.breaker._on_success(self, time.monotonic() - self.started)
+
+    def failure(self, error: BaseException) -> None:
+        if self.done:
+            return
+        if isinstance(error, UpstreamBusy):
+            # 本地名額不足不代表上游異常
+            self.release()
+            return
+        self.done = True
+        self.breaker._on_failure(self, error)
+
+    def release(self) -> None:
+        """呼叫未完成（例如客戶端斷線），不計入統計"""
+        if not self.done:
+            self.done = True
+            self.breaker._end_probe(self)
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, enabled: bool = True, window: float = 60, min_calls: int = 10,
+                 error_rate: float = 0.5, slow_call_seconds: float = 10, slow_call_rate: float = 0.8,
+                 open_seconds: float = 30, sync_interval: float = 1.0):
+        self.name = name
+        self.enabled = enabled
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.sync_interval = sync_interval
+        self._redis = _RedisStore(f"ai:breaker:{name}")
+        self._local = _LocalStore()
+        self._cached: Optional[dict] = None
+        self._cached_at = 0.0
+        STATE.set(_STATE_VALUES[CLOSED], name=name)
+
+    @classmethod
+    def from_settings(cls, name: str = 'llm') -> 'CircuitBreaker':
+        return cls(
+            name,
+            enabled=settings.AI_BREAKER_ENABLED,
+            window=settings.AI_BREAKER_WINDOW,
+            min_calls=settings.AI_BREAKER_MIN_CALLS,
+            error_rate=settings.AI_BREAKER_ERROR_RATE,
+            slow_call_seconds=settings.AI_BREAKER_SLOW_CALL_SECONDS,
+            slow_call_rate=settings.AI_BREAKER_SLOW_CALL_RATE,
+            open_seconds=settings.AI_BREAKER_OPEN_SECONDS,
+        )
+
+    def _store(self, method: str, *args):
+        try:
+            return getattr(self._redis, method)(*args)
+        except Exception as e:
+            logger.warning(f"斷路器無法存取 Redis，改用行程內狀態: {str(e)}")
+            return getattr(self._local, method)(*args)
+
+    def _bucket_width(self) -> float:
+        return self.window / _BUCKETS
+
+    def _current_bucket(self) -> int:
+        return int(time.time() // self._bucket_width())
+
+    def _window_buckets(self) -> range:
+        current = self._current_bucket()
+        return range(current - _BUCKETS + 1, current + 1)
+
+    def _state(self, fresh: bool = False) -> dict:
+        """讀取共用狀態；一般請求使用最多 sync_interval 秒前的快取"""
+        now = time.monotonic()
+        if fresh or self._cached is None or now - self._cached_at > self.sync_interval:
+            state = self._store('state') or {}
+            self._cached = {
+                'state': state.get('state', CLOSED),
+                'since': float(state.get('since', 0)),
+                'reason': state.get('reason', ''),
+            }
+            self._cached_at = now
+            STATE.set(_STATE_VALUES.get(self._cached['state'], 0), name=self.name)
+        return self._cached
+
+    def _transition(self, to: str, reason: str = '') -> None:
+        state = {'state': to, 'since': time.time(), 'reason': reason}
+        self._store('set_state', state)
+        self._cached = state
+        self._cached_at = time.monotonic()
+        STATE.set(_STATE_VALUES[to], name=self.name)
+        TRANSITIONS.inc(name=self.name, to=to)
+        if to == OPEN:
+            logger.warning(f"斷路器開啟（{self.name}）: {reason}")
+        else:
+            logger.info(f"斷路器轉為 {to}（{self.name}）")
+
+    def _retry_after(self, state: dict) -> int:
+        return max(1, math.ceil(state['since'] + self.open_seconds - time.time()))
+
+    def _reject(self, state: dict) -> CircuitOpen:
+        REJECTIONS.inc(name=self.name)
+        return CircuitOpen(self.name, self._retry_after(state))
+
+    def acquire(self) -> Permit:
+        """取得呼叫許可；開啟中或半開且已有探測請求時拋出 CircuitOpen"""
+        if not self.enabled:
+            return Permit(self)
+
+        state = self._state()
+        if state['state'] != CLOSED:
+            # 狀態可能剛被其他行程改變，開啟期間改為每次讀取最新狀態
+            state = self._state(fresh=True)
+        if state['state'] == CLOSED:
+            return Permit(self)
+        if state['state'] == OPEN and time.time() - state['since'] < self.open_seconds:
+            raise self._reject(state)
+
+        # 冷卻時間已過或已在半開狀態：整個叢集只放行一個探測請求
+        token = uuid.uuid4().hex
+        if not self._store('try_probe', token, math.ceil(max(self.open_seconds, settings.AI_REQUEST_DEADLINE))):
+            raise self._reject(state)
+        if state['state'] == OPEN:
+            self._transition(HALF_OPEN)
+        return Permit(self, probe_token=token)
+
+    def _record(self, **counts) -> None:
+        self._store('record', self._current_bucket(), {'calls': 1, **counts}, math.ceil(self.window * 2))
+
+    def _end_probe(self, permit: Permit) -> None:
+        if permit.probe_token is not None:
+            self._store('end_probe', permit.probe_token)
+
+    def _on_success(self, permit: Permit, latency: float) -> None:
+        slow = latency >= self.slow_call_seconds
+        self._record(slow=int(slow))
+        if permit.probe_token is not None:
+            if slow:
+                self._transition(OPEN, f"探測請求過慢（{latency:.1f} 秒）")
+            else:
+                self._store('reset', self._window_buckets())
+                self._transition(CLOSED)
+            self._end_probe(permit)
+        elif slow:
+            self._evaluate()
+
+    def _on_failure(self, permit: Permit, error: BaseException) -> None:
+        self._record(errors=1)
+        if permit.probe_token is not None:
+            self._transition(OPEN, f"探測請求失敗: {type(error).__name__}")
+            self._end_probe(permit)
+        else:
+            self._evaluate()
+
+    def _evaluate(self) -> None:
+        """依視窗內的錯誤率與慢呼叫比例決定是否開啟"""
+        totals = self._store('totals', self._window_buckets())
+        calls = totals['calls']
+        if calls < self.min_calls or self._state(fresh=True)['state'] != CLOSED:
+            return
+        if totals['errors'] / calls >= self.error_rate:
+            self._transition(OPEN, f"錯誤率 {totals['errors']}/{calls}")
+        elif totals['slow'] / calls >= self.slow_call_rate:
+            self._transition(OPEN, f"慢呼叫比例 {totals['slow']}/{calls}")
+
+    def status(self) -> dict:
+        state = self._state(fresh=True)
+        data = {
+            'name': self.name,
+            'enabled': self.enabled,
+            'state': state['state'],
+            'since': state['since'] or None,
+            'reason': state['reason'],
+            'window': self._store('totals', self._window_buckets()),
+            'thresholds': {
+                'window_seconds': self.window,
+                'min_calls': self.min_calls,
+                'error_rate': self.error_rate,
+                'slow_call_seconds': self.slow_call_seconds,
+                'slow_call_rate': self.slow_call_rate,
+                'open_seconds': self.open_seconds,
+            },
+        }
+        if state['state'] == OPEN:
+            data['retry_after'] = self._retry_after(state)
+        return data
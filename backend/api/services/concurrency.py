@@ -0,0 +1,253 @@
+from contextlib import asynccontextmanager, contextmanager
+from functools import partial
+from typing import Optional
+from django.conf import settings
+from . import metrics
+from .redis_client import get_redis
+import asyncio
+import logging
+import random
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+IN_FLIGHT = metrics.gauge('ai_upstream_in_flight', '目前進行中的上游 LLM 請求數')
+QUEUE_DEPTH = metrics.gauge('ai_upstream_queue_depth', '等待上游名額的請求數')
+WAIT_SECONDS = metrics.histogram('ai_upstream_wait_seconds', '取得上游名額的等待時間（秒）')
+REJECTIONS = metrics.counter('ai_upstream_rejections_total', '因上游名額不足被拒絕的請求數', ['scope'])
+
+# 以有序集合實作的分散式號誌：先移除租約過期的持有者，再判斷是否還有名額
+_ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', tonumber(ARGV[1]) - tonumber(ARGV[2]))
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[3]) then
+    redis.call('ZADD', KEYS[1], ARGV[1], ARGV[4])
+    redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[2])))
+    return 1
+end
+return 0
+"""
+
+
+class UpstreamBusy(Exception):
+    """上游名額已滿，呼叫端應回傳 429 並附上 Retry-After"""
+
+    def __init__(self, retry_after: int, scope: str = 'local'):
+        self.retry_after = retry_after
+        self.scope = scope
+        super().__init__(f"上游請求過多（{scope}），請於 {retry_after} 秒後重試")
+
+
+class RedisSemaphore:
+    """跨行程共享的上游名額，持有者當機時依租約自動釋放"""
+
+    def __init__(self, key: str, limit: int, lease: float):
+        self.key = key
+        self.limit = limit
+        self.lease = lease
+
+    def try_acquire(self, token: str) -> bool:
+        return bool(get_redis().eval(_ACQUIRE_SCRIPT, 1, self.key, time.time(), self.lease, self.limit, token))
+
+    def release(self, token: str) -> None:
+        get_redis().zrem(self.key, token)
+
+
+class _Slot:
+    def __init__(self, limiter: 'UpstreamLimiter', token: Optional[str]):
+        self._limiter = limiter
+        self._token = token
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._limiter._release(self._token)
+
+    def __del__(self):
+        # 串流尚未開始就被丟棄時，確保名額仍會歸還
+        self.release()
+
+
+class UpstreamLimiter:
+    """限制每個行程與整個叢集同時進行的 LLM 請求數，並提供有上限的等待佇列"""
+
+    def __init__(self, max_in_flight: int, max_queue: int, wait_timeout: float,
+                 cluster_limit: int = 0, cluster_lease: float = 120, retry_after: int = 5):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.wait_timeout = wait_timeout
+        self.retry_after = retry_after
+        self._semaphore = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self.cluster = (
+            RedisSemaphore('ai:upstream:semaphore', cluster_limit, cluster_lease)
+            if cluster_limit > 0 else None
+        )
+
+    @classmethod
+    def from_settings(cls) -> 'UpstreamLimiter':
+        return cls(
+            max_in_flight=settings.AI_MAX_IN_FLIGHT,
+            max_queue=settings.AI_MAX_QUEUE,
+            wait_timeout=settings.AI_QUEUE_TIMEOUT,
+            cluster_limit=settings.AI_CLUSTER_MAX_IN_FLIGHT,
+            cluster_lease=settings.AI_CLUSTER_LEASE,
+            retry_after=settings.AI_RETRY_AFTER,
+        )
+
+    def _reject(self, scope: str) -> UpstreamBusy:
+        REJECTIONS.inc(scope=scope)
+        logger.warning(f"上游名額不足，拒絕請求（{scope}）")
+        return UpstreamBusy(self.retry_after, scope)
+
+    def _enter_queue(self) -> None:
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                raise self._reject('local')
+            self._waiting += 1
+            QUEUE_DEPTH.set(self._waiting)
+
+    def _leave_queue(self) -> None:
+        with self._lock:
+            self._waiting -= 1
+            QUEUE_DEPTH.set(self._waiting)
+
+    def _try_acquire_cluster(self, token: str) -> Optional[bool]:
+        """回傳 None 表示 Redis 無法使用，此時只依賴行程內限制"""
+        try:
+            return self.cluster.try_acquire(token)
+        except Exception as e:
+            logger.warning(f"叢集上游名額檢查失敗，改用行程內限制: {str(e)}")
+            return None
+
+    def try_acquire(self) -> Optional[_Slot]:
+        """不排隊、不等待地取得名額（供對沖請求使用），沒有空位時回傳 None"""
+        if not self._semaphore.acquire(blocking=False):
+            return None
+        token = None
+        if self.cluster is not None:
+            token = uuid.uuid4().hex
+            acquired = self._try_acquire_cluster(token)
+            if acquired is False:
+                self._semaphore.release()
+                return None
+            if acquired is None:
+                token = None
+        IN_FLIGHT.inc()
+        return _Slot(self, token)
+
+    def acquire(self, timeout: Optional[float] = None) -> _Slot:
+        """取得上游名額；佇列已滿或等待逾時時拋出 UpstreamBusy
+
+        timeout 可縮短等待時間（例如請求剩餘的期限），不會超過 AI_QUEUE_TIMEOUT。
+        """
+        started = time.monotonic()
+        wait_timeout = self.wait_timeout if timeout is None else min(self.wait_timeout, timeout)
+        if not self._semaphore.acquire(blocking=False):
+            self._enter_queue()
+            try:
+                acquired = self._semaphore.acquire(timeout=wait_timeout)
+            finally:
+                self._leave_queue()
+            if not acquired:
+                raise self._reject('local')
+
+        token = None
+        if self.cluster is not None:
+            token = uuid.uuid4().hex
+            deadline = started + wait_timeout
+            while True:
+                acquired = self._try_acquire_cluster(token)
+                if acquired is None:
+                    token = None
+                    break
+                if acquired:
+                    break
+                if time.monotonic() >= deadline:
+                    self._semaphore.release()
+                    raise self._reject('cluster')
+                time.sleep(0.02 + random.random() * 0.05)
+
+        WAIT_SECONDS.observe(time.monotonic() - started)
+        IN_FLIGHT.inc()
+        return _Slot(self, token)
+
+    async def aacquire(self, timeout: Optional[float] = None) -> _Slot:
+        """非同步版本，以輪詢等待名額，不佔用執行緒"""
+        started = time.monotonic()
+        wait_timeout = self.wait_timeout if timeout is None else min(self.wait_timeout, timeout)
+        if not self._semaphore.acquire(blocking=False):
+            self._enter_queue()
+            try:
+                deadline = started + wait_timeout
+                while not self._semaphore.acquire(blocking=False):
+                    if time.monotonic() >= deadline:
+                        raise self._reject('local')
+                    await asyncio.sleep(0.02)
+            finally:
+                self._leave_queue()
+
+        token = None
+        if self.cluster is not None:
+            token = uuid.uuid4().hex
+            deadline = started + wait_timeout
+            attempt = None
+            try:
+                while True:
+                    # shield：被取消時讓執行緒中的嘗試完成，才知道是否需要歸還叢集名額
+                    attempt = asyncio.ensure_future(asyncio.to_thread(self._try_acquire_cluster, token))
+                    acquired = await asyncio.shield(attempt)
+                    if acquired is None:
+                        token = None
+                        break
+                    if acquired:
+                        break
+                    if time.monotonic() >= deadline:
+                        raise self._reject('cluster')
+                    await asyncio.sleep(0.02 + random.random() * 0.05)
+            except BaseException:
+                # 逾時或被取消（例如客戶端斷線）時歸還本機名額，否則會永久少一個
+                self._semaphore.release()
+                if attempt is not None and not attempt.done():
+                    attempt.add_done_callback(partial(self._release_if_acquired, token))
+                raise
+
+        WAIT_SECONDS.observe(time.monotonic() - started)
+        IN_FLIGHT.inc()
+        return _Slot(self, token)
+
+    def _release_cluster(self, token: str) -> None:
+        try:
+            self.cluster.release(token)
+        except Exception as e:
+            logger.warning(f"釋放叢集上游名額失敗: {str(e)}")
+
+    def _release_if_acquired(self, token: str, attempt: asyncio.Future) -> None:
+        """取消後才完成的叢集名額嘗試：若已取得則立即歸還，不等租約過期"""
+        if not attempt.cancelled() and attempt.exception() is None and attempt.result():
+            self._release_cluster(token)
+
+    def _release(self, token: Optional[str]) -> None:
+        IN_FLIGHT.dec()
+        self._semaphore.release()
+        if token is not None:
+            self._release_cluster(token)
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None):
+        slot = self.acquire(timeout)
+        try:
+            yield slot
+        finally:
+            slot.release()
+
+    @asynccontextmanager
+    async def aslot(self, timeout: Optional[float] = None):
+        slot = await self.aacquire(timeout)
+        try:
+            yield slot
+        finally:
+            slot.release()
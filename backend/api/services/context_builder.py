@@ -0,0 +1,149 @@
+from asgiref.sync import sync_to_async
+from typing import Dict, Iterable, List, Optional
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from ..models import ChatHistory, ChatSummary, Conversation
+from .chat_buffer import get_chat_write_buffer, merge_pending
+from .tokens import estimate_message_tokens, truncate_to_tokens, MESSAGE_OVERHEAD
+import logging
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PREFIX = "先前對話摘要：\n"
+
+
+class ContextWindow:
+    """送往上游的對話上下文：摘要（若有）加上預算內最近的對話
+
+    oldest 為視窗中最舊一則已寫入資料庫的訊息 (timestamp, id)，與摘要使用相同的排序鍵。
+    """
+
+    def __init__(self, messages: List[dict], tokens: int, oldest: Optional[tuple], needs_summary: bool):
+        self.messages = messages
+        self.tokens = tokens
+        self.oldest = oldest
+        self.needs_summary = needs_summary
+
+    @property
+    def oldest_id(self) -> Optional[int]:
+        return self.oldest[1] if self.oldest else None
+
+
+class ContextBuilder:
+    """依 token 預算組合對話上下文
+
+    預算只涵蓋摘要與歷史對話，不含人設提示詞與本次訊息。已併入摘要的
+    對話不再重複送出；超出預算的舊對話由背景任務增量併入摘要。
+    """
+
+    def __init__(self, budget: Optional[int] = None, max_messages: Optional[int] = None):
+        self.budget = budget or settings.AI_CONTEXT_TOKEN_BUDGET
+        self.max_messages = max_messages or settings.AI_CONTEXT_MAX_MESSAGES
+
+    def _recent(self, conversation: Conversation):
+        # 依 (conversation, timestamp, id) 索引倒序讀取，成本只與單一對話有關
+        return ChatHistory.objects.filter(conversation=conversation).order_by(
+            '-timestamp', '-id'
+        ).values('id', 'message_uuid', 'role', 'content', 'timestamp')[:self.max_messages]
+
+    def _with_pending(self, rows: List[dict], conversation_id) -> List[dict]:
+        # write-behind 緩衝中尚未寫入資料庫的訊息
+        return merge_pending(
+            rows, get_chat_write_buffer().pending(conversation_id), self.max_messages, as_values=True
+        )
+
+    def _summary(self, conversation: Conversation):
+        return ChatSummary.objects.filter(conversation=conversation).only(
+            'content', 'last_message_id', 'last_message_timestamp'
+        )
+
+    def build(self, conversation: Conversation, user_message: Optional[str] = None) -> ContextWindow:
+        rows = self._with_pending(list(self._recent(conversation)), conversation.pk)
+        return self.fit(rows, self._summary(conversation).first(), user_message)
+
+    async def abuild(self, conversation: Conversation, user_message: Optional[str] = None) -> ContextWindow:
+        rows = [row async for row in self._recent(conversation)]
+        rows = await sync_to_async(self._with_pending)(rows, conversation.pk)
+        return self.fit(rows, await self._summary(conversation).afirst(), user_message)
+
+    def build_many(self, conversations: List[Conversation],
+                   user_message: Optional[str] = None) -> Dict[object, ContextWindow]:
+        """以兩次查詢組合多個對話的上下文（每個取最近 max_messages 則），以對話 ID 為鍵"""
+        conversation_ids = [conversation.pk for conversation in conversations]
+        rows = ChatHistory.objects.filter(conversation_id__in=conversation_ids).annotate(
+            rank=Window(
+                RowNumber(),
+                partition_by=[F('conversation_id')],
+                order_by=[F('timestamp').desc(), F('id').desc()]
+            )
+        ).filter(rank__lte=self.max_messages).order_by('conversation_id', 'rank').values(
+            'id', 'conversation_id', 'message_uuid', 'role', 'content', 'timestamp'
+        )
+        grouped = {conversation_id: [] for conversation_id in conversation_ids}
+        for row in rows:
+            grouped[row['conversation_id']].append(row)
+        summaries = {
+            summary.conversation_id: summary
+            for summary in ChatSummary.objects.filter(conversation_id__in=conversation_ids).only(
+                'conversation_id', 'content', 'last_message_id', 'last_message_timestamp'
+            )
+        }
+        return {
+            conversation_id: self.fit(
+                self._with_pending(grouped[conversation_id], conversation_id),
+                summaries.get(conversation_id), user_message
+            )
+            for conversation_id in conversation_ids
+        }
+
+    def fit(self, rows: Iterable[dict], summary: Optional[ChatSummary],
+            user_message: Optional[str] = None) -> ContextWindow:
+        """rows 由新到舊排列"""
+        rows = list(rows)
+        # 視圖會先寫入本次的使用者訊息，避免在上下文中重複送出
+        if user_message and rows and rows[0]['role'] == 'user' and rows[0]['content'] == user_message:
+            rows = rows[1:]
+
+        def summarized(row) -> bool:
+            # 緩衝中尚未寫入的訊息沒有 id，必定比摘要新
+            return row['id'] is not None and summary is not None and summary.covers(row['timestamp'], row['id'])
+
+        summary_message = None
+        remaining = self.budget
+        if summary and summary.content:
+            summary_message = {"role": "system", "content": SUMMARY_PREFIX + summary.content}
+            remaining -= estimate_message_tokens(summary_message)
+
+        turns = []
+        needs_summary = False
+        for row in rows:
+            if summarized(row):
+                break
+            message = {"role": row['role'], "content": row['content']}
+            cost = estimate_message_tokens(message)
+            if cost > remaining:
+                if not turns:
+                    # 最近一則就超出預算時保留開頭，確保上下文不會斷掉
+                    message['content'] = truncate_to_tokens(row['content'], remaining - MESSAGE_OVERHEAD)
+                    if message['content']:
+                        turns.append((row, message))
+                        remaining -= estimate_message_tokens(message)
+                needs_summary = True
+                break
+            turns.append((row, message))
+            remaining -= cost
+        else:
+            # 取回的筆數已達上限，更舊的對話同樣需要併入摘要
+            needs_summary = len(rows) >= self.max_messages and not summarized(rows[-1])
+
+        messages = [message for _, message in reversed(turns)]
+        stored = [(row['timestamp'], row['id']) for row, _ in turns if row['id'] is not None]
+        if summary_message:
+            messages.insert(0, summary_message)
+        return ContextWindow(
+            messages=messages,
+            tokens=self.budget - remaining,
+            oldest=min(stored) if stored else None,
+            needs_summary=needs_summary,
+        )
@@ -0,0 +1,168 @@
+"""
+對話
+
+每位訪客與每位化學家的聊天記錄歸屬於各自的 Conversation，上下文與聊天記錄查詢
+只掃描單一對話。呼叫端以 conversation_id 指定對話；未指定時沿用同一位登入使用者
+（或同一個匿名 session）與該化學家最近的對話，沒有時建立新的對話。
+
+匿名對話的 UUID 即為存取憑證；屬於登入使用者的對話只有該使用者能存取。
+"""
+from typing import Iterable, List, Optional
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from ..models import Chemist, ChatHistory, Conversation
+from .chat_buffer import get_chat_write_buffer
+from asgiref.sync import sync_to_async
+
+
+class ConversationNotFound(Exception):
+    """指定的對話不存在、不屬於該化學家或不屬於目前的使用者"""
+
+    def __init__(self, conversation_id):
+        self.conversation_id = conversation_id
+        super().__init__(f"找不到指定的對話: {conversation_id}")
+
+
+def requested_conversation_id(request, data=None) -> Optional[str]:
+    """依序由請求內容、查詢參數與 X-Conversation-Id 標頭取得對話 ID
+
+    非 DRF 的 view 沒有 request.data，以 data 傳入已解析的請求內容。
+    """
+    data = getattr(request, 'data', None) if data is None else data
+    query_params = getattr(request, 'query_params', request.GET)
+    value = (
+        (data.get('conversation_id') if hasattr(data, 'get') else None)
+        or query_params.get('conversation_id')
+        or request.headers.get('X-Conversation-Id')
+    )
+    return str(value) if value else None
+
+
+def _owner(request, create: bool) -> dict:
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return {'user': user}
+    session = getattr(request, 'session', None)
+    if session is None:
+        return {}
+    if not session.session_key and create:
+        # 標記為已修改，SessionMiddleware 才會送出 session cookie
+        session['chat_visitor'] = True
+        session.save()
+    return {'user': None, 'session_key': session.session_key} if session.session_key else {}
+
+
+def resolve(request, chemist: Chemist, conversation_id: Optional[str] = None,
+            create: bool = True) -> Optional[Conversation]:
+    """取得請求對應的對話；create=False 時找不到就回傳 None"""
+    user = getattr(request, 'user', None)
+    if conversation_id:
+        try:
+            conversation = Conversation.objects.get(pk=conversation_id, chemist=chemist, deleted_at__isnull=True)
+        except (Conversation.DoesNotExist, ValidationError, ValueError):
+            raise ConversationNotFound(conversation_id)
+        if conversation.user_id is not None and (
+            user is None or not user.is_authenticated or conversation.user_id != user.id
+        ):
+            raise ConversationNotFound(conversation_id)
+        return conversation
+
+    owner = _owner(request, create)
+    if owner:
+        conversation = Conversation.objects.filter(
+            chemist=chemist, deleted_at__isnull=True, **owner
+        ).order_by('-last_active_at').first()
+        if conversation is not None:
+            return conversation
+    if not create:
+        return None
+    return Conversation.objects.create(chemist=chemist, **owner)
+
+
+def for_owner(request, chemist: Optional[Chemist] = None):
+    """目前使用者或匿名 session 與該化學家（未指定時為所有化學家）的對話，由新到舊排列"""
+    owner = _owner(request, create=False)
+    if not owner:
+        return Conversation.objects.none()
+    conversations = Conversation.objects.filter(deleted_at__isnull=True, **owner)
+    if chemist is not None:
+        conversations = conversations.filter(chemist=chemist)
+    return conversations.order_by('-last_active_at')
+
+
+def create(request, chemist: Chemist) -> Conversation:
+    return Conversation.objects.create(chemist=chemist, **_owner(request, create=True))
+
+
+def add_message(conversation: Conversation, role: str, content: str, timestamp=None) -> ChatHistory:
+    """寫入一則聊天記錄並更新對話的最後活動時間
+
+    啟用 write-behind 緩衝時回傳尚未寫入資料庫（id 為 None）的訊息，由背景任務批次寫入。
+    """
+    timestamp = timestamp or timezone.now()
+    buffer = get_chat_write_buffer()
+    if buffer.enabled:
+        return buffer.append(conversation, role, content, timestamp)
+    message = ChatHistory.objects.create(
+        chemist_id=conversation.chemist_id,
+        conversation=conversation,
+        role=role,
+        content=content,
+        timestamp=timestamp
+    )
+    touch([conversation.pk], timestamp)
+    return message
+
+
+def add_messages(messages: Iterable[tuple]) -> List[ChatHistory]:
+    """批次寫入多則聊天記錄 (conversation, role, content, timestamp)，並更新各對話的最後活動時間
+
+    一次 bulk_create；啟用 write-behind 緩衝時改為以單一 pipeline 加入緩衝。
+    """
+    messages = list(messages)
+    if not messages:
+        return []
+    buffer = get_chat_write_buffer()
+    if buffer.enabled:
+        return buffer.append_many(messages)
+    rows = ChatHistory.objects.bulk_create([
+        ChatHistory(
+            chemist_id=conversation.chemist_id,
+            conversation=conversation,
+            role=role,
+            content=content,
+            timestamp=timestamp
+        )
+        for conversation, role, content, timestamp in messages
+    ])
+    last_active = {}
+    for row in rows:
+        last_active[row.conversation_id] = max(row.timestamp, last_active.get(row.conversation_id, row.timestamp))
+    for conversation_id, timestamp in last_active.items():
+        touch([conversation_id], timestamp)
+    return rows
+
+
+async def aadd_message(conversation: Conversation, role: str, content: str, timestamp=None) -> ChatHistory:
+    timestamp = timestamp or timezone.now()
+    buffer = get_chat_write_buffer()
+    if buffer.enabled:
+        return await sync_to_async(buffer.append)(conversation, role, content, timestamp)
+    message = await ChatHistory.objects.acreate(
+        chemist_id=conversation.chemist_id,
+        conversation=conversation,
+        role=role,
+        content=content,
+        timestamp=timestamp
+    )
+    await Conversation.objects.filter(pk=conversation.pk, last_active_at__lt=timestamp).aupdate(
+        last_active_at=timestamp
+    )
+    return message
+
+
+def touch(conversation_ids: Iterable, timestamp=None) -> None:
+    timestamp = timestamp or timezone.now()
+    Conversation.objects.filter(pk__in=list(conversation_ids), last_active_at__lt=timestamp).update(
+        last_active_at=timestamp
+    )
@@ -0,0 +1,55 @@
+"""
+請求期限
+
+視圖在收到請求時建立 Deadline，排隊等名額、等待 single-flight leader、
+上游呼叫與重試都只能使用剩餘的時間，避免客戶端放棄後仍在背景消耗上游。
+"""
+from typing import Optional
+from django.conf import settings
+import time
+
+
+class DeadlineExceeded(TimeoutError):
+    """請求已超過期限"""
+
+
+class Deadline:
+    """單一請求的截止時間，由視圖建立後一路傳入 AIService"""
+
+    HEADER = 'HTTP_X_REQUEST_DEADLINE_MS'
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    @classmethod
+    def from_settings(cls) -> 'Deadline':
+        return cls(settings.AI_REQUEST_DEADLINE)
+
+    @classmethod
+    def from_request(cls, request) -> 'Deadline':
+        """預設使用 AI_REQUEST_DEADLINE；客戶端可用 X-Request-Deadline-Ms 縮短但不能延長"""
+        seconds = settings.AI_REQUEST_DEADLINE
+        raw = request.META.get(cls.HEADER)
+        if raw:
+            try:
+                seconds = min(seconds, max(int(raw), 0) / 1000)
+            except ValueError:
+                pass
+        return cls(seconds)
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def cap(self, timeout: Optional[float]) -> float:
+        """取 timeout 與剩餘時間的較小值"""
+        remaining = self.remaining()
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def check(self) -> None:
+        if self.expired:
+            raise DeadlineExceeded(f"請求超過 {self.seconds:.1f} 秒期限")
@@ -0,0 +1,130 @@
+from typing import Optional
+from django.conf import settings
+from ..models import Chemist
+from .minhash import FuzzyMatcher, MinHasher, band_keys
+from .normalization import normalize_message
+from .redis_client import get_redis
+from .response_cache import persona_version
+import hashlib
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class FuzzyReplyCache:
+    """以 MinHash/LSH 索引相似問句的模糊回應快取，索引存放於 Redis
+
+    每個人設版本的鍵：
+    - {namespace}:e 問答內容（hash，欄位為問句 ID）
+    - {namespace}:t 問句 ID 依加入時間排序（zset），超過 AI_FUZZY_CACHE_MAX_ENTRIES 或 TTL 的舊問答由此淘汰
+    - {namespace}:b:{band}:{bucket} LSH 分桶（set）
+    """
+    KEY_PREFIX = 'ai:lsh'
+
+    def __init__(self):
+        self.max_entries = settings.AI_FUZZY_CACHE_MAX_ENTRIES
+        self.bands = settings.AI_FUZZY_CACHE_BANDS
+        self.hasher = MinHasher(num_perm=settings.AI_FUZZY_CACHE_NUM_PERM)
+        self.matcher = FuzzyMatcher(
+            threshold=settings.AI_FUZZY_CACHE_THRESHOLD,
+            content_threshold=settings.AI_FUZZY_CACHE_CONTENT_THRESHOLD,
+        )
+
+    def is_enabled_for(self, chemist: Chemist) -> bool:
+        return settings.AI_FUZZY_CACHE_ENABLED and chemist.response_cache_enabled
+
+    def _namespace(self, chemist: Chemist) -> str:
+        return f"{self.KEY_PREFIX}:{chemist.id}:{persona_version(chemist)}"
+
+    def lookup(self, chemist: Chemist, question: str) -> Optional[str]:
+        """尋找相似度超過門檻的已知問句，回傳其答案"""
+        if not self.is_enabled_for(chemist) or not self.matcher.eligible(question):
+            return None
+        try:
+            namespace = self._namespace(chemist)
+            redis = get_redis()
+            pipe = redis.pipeline(transaction=False)
+            for band, bucket in enumerate(band_keys(self.hasher.signature(question), self.bands)):
+                pipe.smembers(f"{namespace}:b:{band}:{bucket}")
+            candidates = set().union(*pipe.execute())
+            if not candidates:
+                return None
+
+            best = None
+            for raw in redis.hmget(f"{namespace}:e", list(candidates)):
+                if raw is None:
+                    continue
+                entry = json.loads(raw)
+                score = self.matcher.score(question, entry['q'])
+                if score is not None and score >= self.matcher.threshold and (best is None or score > best[0]):
+                    best = (score, entry)
+        except Exception as e:
+            logger.warning(f"模糊快取查詢失敗: {str(e)}")
+            return None
+
+        if best is None:
+            return None
+        logger.info(f"模糊快取命中，化學家: {chemist.name}，相似度: {best[0]:.2f}，原問句: {best[1]['q']}")
+        return best[1]['a']
+
+    def _band_keys(self, namespace: str, question: str) -> list:
+        return [
+            f"{namespace}:b:{band}:{bucket}"
+            for band, bucket in enumerate(band_keys(self.hasher.signature(question), self.bands))
+        ]
+
+    def add(self, chemist: Chemist, question: str, answer: str) -> None:
+        """將問答加入索引"""
+        if not self.is_enabled_for(chemist) or not answer or not self.matcher.eligible(question):
+            return
+        try:
+            namespace = self._namespace(chemist)
+            entry_id = hashlib.sha1(normalize_message(question).encode('utf-8')).hexdigest()[:16]
+            ttl = settings.AI_FUZZY_CACHE_TTL
+            redis = get_redis()
+            pipe = redis.pipeline(transaction=False)
+            pipe.hset(f"{namespace}:e", entry_id, json.dumps({'q': question, 'a': answer}, ensure_ascii=False))
+            pipe.expire(f"{namespace}:e", ttl)
+            pipe.zadd(f"{namespace}:t", {entry_id: time.time()})
+            pipe.expire(f"{namespace}:t", ttl)
+            for key in self._band_keys(namespace, question):
+                pipe.sadd(key, entry_id)
+                pipe.expire(key, ttl)
+            pipe.execute()
+            self._evict(redis, namespace)
+        except Exception as e:
+            logger.warning(f"模糊快取寫入失敗: {str(e)}")
+
+    def _evict(self, redis, namespace: str) -> int:
+        """淘汰超過 TTL 以及超出數量上限的最舊問答
+
+        每次加入都會延長整組鍵的 TTL，常被使用的化學家不會整組過期，因此逐筆淘汰。
+        """
+        timeline = f"{namespace}:t"
+        pipe = redis.pipeline(transaction=False)
+        pipe.zrangebyscore(timeline, '-inf', time.time() - settings.AI_FUZZY_CACHE_TTL)
+        pipe.zrange(timeline, 0, -self.max_entries - 1)
+        expired, overflow = pipe.execute()
+        entry_ids = list(dict.fromkeys(expired + overflow))
+        if not entry_ids:
+            return 0
+
+        pipe = redis.pipeline(transaction=False)
+        for entry_id, raw in zip(entry_ids, redis.hmget(f"{namespace}:e", entry_ids)):
+            if raw is not None:
+                for key in self._band_keys(namespace, json.loads(raw)['q']):
+                    pipe.srem(key, entry_id)
+        pipe.hdel(f"{namespace}:e", *entry_ids)
+        pipe.zrem(timeline, *entry_ids)
+        pipe.execute()
+        return len(entry_ids)
+
+    def clear(self, chemist: Chemist) -> int:
+        """清除化學家所有人設版本的索引（包含尚未過期的舊版本），回傳刪除的鍵數"""
+        redis = get_redis()
+        keys = list(redis.scan_iter(match=f"{self.KEY_PREFIX}:{chemist.id}:*", count=500))
+        if keys:
+            redis.delete(*keys)
+        return len(keys)
@@ -0,0 +1,300 @@
+"""
+有期限的上游呼叫：對沖請求與抖動退避重試
+
+第一個嘗試在 AI_HEDGE_PERCENTILE 分位的首字延遲內沒有產出時，若還有空閒的
+上游名額就再送出一個相同的請求，採用先產出首字的一方並取消另一方。
+在首字之前失敗的嘗試，會在剩餘期限內以全抖動 (full jitter) 指數退避重試。
+
+落敗的嘗試在取消時關閉上游串流（見 providers.DeltaStream），讀取中的執行緒隨即結束並歸還名額。
+尚未拿到回應的嘗試（串流等待回應標頭、非串流的 call）無法中斷，會佔著名額直到上游回應或逾時；
+每個嘗試的逾時都是送出時的剩餘期限，因此最多佔用到請求期限為止。對沖只以 try_acquire
+使用空閒名額，不會讓排隊中的請求多等，這段額外佔用算在 AI_MAX_IN_FLIGHT 的預算內。
+"""
+from contextlib import closing
+from typing import Awaitable, Callable, Iterator, Optional
+from django.conf import settings
+from . import metrics
+from .concurrency import UpstreamBusy, UpstreamLimiter
+from .deadline import Deadline
+import asyncio
+import inspect
+import logging
+import queue
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+TTFB_BUCKETS = (0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 3, 4, 5, 7.5, 10, 15, 20, 30, 60)
+
+ATTEMPT_TTFB = metrics.histogram(
+    'ai_upstream_attempt_ttfb_seconds', '單次上游嘗試的首字延遲（秒），作為對沖門檻的依據', ['mode'], TTFB_BUCKETS
+)
+EFFECTIVE_TTFB = metrics.histogram(
+    'ai_upstream_ttfb_seconds', '含排隊、對沖與重試後請求實際等到首字的時間（秒）', ['mode'], TTFB_BUCKETS
+)
+HEDGES = metrics.counter('ai_hedge_total', '對沖請求統計（launched/won/skipped）', ['mode', 'outcome'])
+RETRIES = metrics.counter('ai_upstream_retries_total', '上游失敗後的重試次數', ['mode'])
+ATTEMPT_ERRORS = metrics.counter('ai_upstream_attempt_errors_total', '上游嘗試失敗次數', ['mode', 'error'])
+
+# 請求本身有誤，重試也不會成功
+_NON_RETRYABLE_STATUS = {400, 401, 403, 404, 422}
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, UpstreamBusy):
+        return False
+    return getattr(error, 'status_code', None) not in _NON_RETRYABLE_STATUS
+
+
+class HedgePolicy:
+    """對沖門檻與重試退避的設定"""
+
+    def __init__(self, enabled: bool = True, percentile: float = 0.95, min_delay: float = 0.5,
+                 default_delay: float = 3.0, min_samples: int = 20, max_retries: int = 2,
+                 backoff_base: float = 0.25, backoff_cap: float = 4.0):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.default_delay = default_delay
+        self.min_samples = min_samples
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+    @classmethod
+    def from_settings(cls) -> 'HedgePolicy':
+        return cls(
+            enabled=settings.AI_HEDGE_ENABLED,
+            percentile=settings.AI_HEDGE_PERCENTILE,
+            min_delay=settings.AI_HEDGE_MIN_DELAY,
+            default_delay=settings.AI_HEDGE_DEFAULT_DELAY,
+            min_samples=settings.AI_HEDGE_MIN_SAMPLES,
+            max_retries=settings.AI_RETRY_MAX,
+            backoff_base=settings.AI_RETRY_BACKOFF_BASE,
+            backoff_cap=settings.AI_RETRY_BACKOFF_CAP,
+        )
+
+    def hedge_delay(self, mode: str) -> Optional[float]:
+        """多久沒有首字就送出對沖請求；樣本不足時使用預設值，停用時回傳 None"""
+        if not self.enabled:
+            return None
+        if ATTEMPT_TTFB.count(mode=mode) < self.min_samples:
+            return self.default_delay
+        return max(self.min_delay, ATTEMPT_TTFB.quantile(self.percentile, mode=mode))
+
+    def backoff(self, retry: int) -> float:
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** retry))
+
+
+class _Attempt:
+    def __init__(self, index: int, hedge: bool):
+        self.index = index
+        self.hedge = hedge
+        self.started = time.monotonic()
+        self.cancelled = threading.Event()
+        self.items = None
+
+    def cancel(self) -> None:
+        """標記取消，已取得上游串流時直接關閉
+
+        產生器無法由其他執行緒關閉，留給嘗試自己的執行緒在下一個項目後關閉。
+        """
+        self.cancelled.set()
+        items = self.items
+        close = getattr(items, 'close', None)
+        if close is None or inspect.isgenerator(items):
+            return
+        try:
+            close()
+        except Exception as e:
+            logger.debug(f"關閉落敗的上游串流失敗: {str(e)}")
+
+
+class HedgedCaller:
+    """以上游名額限制、期限、對沖與重試包裝供應者呼叫"""
+
+    def __init__(self, limiter: UpstreamLimiter, policy: HedgePolicy):
+        self.limiter = limiter
+        self.policy = policy
+
+    def stream(self, start: Callable[[float], Iterator], deadline: Deadline, mode: str) -> Iterator:
+        """start(timeout) 回傳上游產出的迭代器
+
+        第一個嘗試的名額在呼叫時立即取得，名額不足時直接拋出 UpstreamBusy。
+        """
+        slot = self.limiter.acquire(deadline.remaining())
+        return self._run(start, deadline, mode, slot)
+
+    def call(self, start: Callable[[float], object], deadline: Deadline, mode: str):
+        """非串流呼叫，回傳勝出嘗試的結果"""
+        with closing(self.stream(lambda timeout: iter([start(timeout)]), deadline, mode)) as results:
+            return next(results)
+
+    def _run(self, start, deadline: Deadline, mode: str, slot) -> Iterator:
+        events = queue.Queue()
+        request_started = time.monotonic()
+        attempts = []
+
+        def launch(attempt_slot, hedge: bool = False) -> None:
+            attempt = _Attempt(len(attempts), hedge)
+            attempts.append(attempt)
+
+            def run():
+                items = None
+                try:
+                    items = iter(start(deadline.remaining()))
+                    attempt.items = items
+                    # 與 cancel() 的順序相反：任一方都會看到對方的變更，串流不會漏關
+                    if attempt.cancelled.is_set():
+                        return
+                    for item in items:
+                        if attempt.cancelled.is_set():
+                            return
+                        events.put((attempt, 'item', item))
+                    events.put((attempt, 'end', None))
+                except Exception as e:
+                    # 被取消時關閉連線引起的讀取錯誤不必回報
+                    if not attempt.cancelled.is_set():
+                        events.put((attempt, 'error', e))
+                finally:
+                    # 關閉上游串流（被取消時不再讀取剩餘內容）
+                    close = getattr(items, 'close', None)
+                    if close is not None:
+                        close()
+                    attempt_slot.release()
+
+            threading.Thread(target=run, name=f'upstream-{mode}-{attempt.index}', daemon=True).start()
+
+        def hedge_at() -> Optional[float]:
+            delay = self.policy.hedge_delay(mode)
+            return None if delay is None else time.monotonic() + delay
+
+        launch(slot)
+        live = 1
+        retries = 0
+        winner = None
+        next_hedge = hedge_at()
+        try:
+            while True:
+                timeout = deadline.remaining()
+                if winner is None and next_hedge is not None:
+                    timeout = min(timeout, max(next_hedge - time.monotonic(), 0))
+                try:
+                    attempt, kind, value = events.get(timeout=timeout)
+                except queue.Empty:
+                    deadline.check()
+                    if winner is not None or next_hedge is None:
+                        continue
+                    next_hedge = None
+                    hedge_slot = self.limiter.try_acquire()
+                    if hedge_slot is None:
+                        HEDGES.inc(mode=mode, outcome='skipped')
+                    else:
+                        HEDGES.inc(mode=mode, outcome='launched')
+                        logger.info(f"上游首字逾時，送出對沖請求（{mode}）")
+                        launch(hedge_slot, hedge=True)
+                        live += 1
+                    continue
+
+                if winner is not None and attempt is not winner:
+                    continue
+
+                if kind == 'item':
+                    if winner is None:
+                        winner = attempt
+                        now = time.monotonic()
+                        ATTEMPT_TTFB.observe(now - attempt.started, mode=mode)
+                        EFFECTIVE_TTFB.observe(now - request_started, mode=mode)
+                        if attempt.hedge:
+                            HEDGES.inc(mode=mode, outcome='won')
+                        for other in attempts:
+                            if other is not attempt:
+                                other.cancel()
+                    yield value
+                elif kind == 'end':
+                    return
+                else:
+                    ATTEMPT_ERRORS.inc(mode=mode, error=type(value).__name__)
+                    if winner is not None:
+                        raise value
+                    live -= 1
+                    if live > 0:
+                        # 另一個嘗試仍在進行，等它的結果
+                        continue
+                    delay = self.policy.backoff(retries)
+                    if (not is_retryable(value) or retries >= self.policy.max_retries
+                            or deadline.remaining() <= delay):
+                        raise value
+                    logger.warning(f"上游呼叫失敗，{delay:.2f} 秒後重試（{mode}）: {str(value)}")
+                    time.sleep(delay)
+                    retries += 1
+                    RETRIES.inc(mode=mode)
+                    launch(self.limiter.acquire(deadline.remaining()))
+                    live += 1
+                    next_hedge = hedge_at()
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+
+    async def acall(self, start: Callable[[float], Awaitable], deadline: Deadline, mode: str):
+        """非同步版本；落後的嘗試以 task.cancel() 直接取消"""
+        request_started = time.monotonic()
+        retries = 0
+
+        async def run(attempt_slot):
+            try:
+                return await start(deadline.remaining())
+            finally:
+                attempt_slot.release()
+
+        while True:
+            tasks = {asyncio.ensure_future(run(await self.limiter.aacquire(deadline.remaining()))): _Attempt(0, False)}
+            hedge_delay = self.policy.hedge_delay(mode)
+            next_hedge = None if hedge_delay is None else time.monotonic() + hedge_delay
+            pending = set(tasks)
+            error = None
+            try:
+                while pending:
+                    timeout = deadline.remaining()
+                    if next_hedge is not None:
+                        timeout = min(timeout, max(next_hedge - time.monotonic(), 0))
+                    done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                    if not done:
+                        deadline.check()
+                        if next_hedge is None:
+                            continue
+                        next_hedge = None
+                        hedge_slot = self.limiter.try_acquire()
+                        if hedge_slot is None:
+                            HEDGES.inc(mode=mode, outcome='skipped')
+                        else:
+                            HEDGES.inc(mode=mode, outcome='launched')
+                            task = asyncio.ensure_future(run(hedge_slot))
+                            tasks[task] = _Attempt(len(tasks), True)
+                            pending.add(task)
+                        continue
+                    for task in done:
+                        if task.exception() is None:
+                            attempt = tasks[task]
+                            now = time.monotonic()
+                            ATTEMPT_TTFB.observe(now - attempt.started, mode=mode)
+                            EFFECTIVE_TTFB.observe(now - request_started, mode=mode)
+                            if attempt.hedge:
+                                HEDGES.inc(mode=mode, outcome='won')
+                            return task.result()
+                        error = task.exception()
+                        ATTEMPT_ERRORS.inc(mode=mode, error=type(error).__name__)
+                    next_hedge = next_hedge if pending else None
+            finally:
+                for task in pending:
+                    task.cancel()
+
+            delay = self.policy.backoff(retries)
+            if not is_retryable(error) or retries >= self.policy.max_retries or deadline.remaining() <= delay:
+                raise error
+            logger.warning(f"上游呼叫失敗，{delay:.2f} 秒後重試（{mode}）: {str(error)}")
+            await asyncio.sleep(delay)
+            retries += 1
+            RETRIES.inc(mode=mode)
@@ -0,0 +1,154 @@
+"""
+MinHash 與 LSH 的純 NumPy 實作
+
+不依賴 Django，供模糊回應快取與離線評估腳本共用。
+"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import hashlib
+
+import numpy as np
+
+from .normalization import normalize_message
+
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+_MAX_HASH = np.uint64((1 << 64) - 1)
+
+# 問句中常見、不影響語意的字詞，比對內容字時忽略
+_FUNCTION_CHARS = set(
+    "你我他她它您們的了嗎呢吧啊呀嘛喔哦是被在和與及把給對從向也都就又還很那這哪個些"
+    "什麼怎樣如何為何請問一下可以會要想說講告訴"
+)
+_IGNORED_CHARS = set(" ?!.,~;:\"'()[]-")
+
+
+def shingles(text: str, sizes: Tuple[int, ...] = (1, 2)) -> Set[str]:
+    """將正規化後的問句切成字元 n-gram"""
+    chars = ''.join(c for c in normalize_message(text) if c not in _IGNORED_CHARS)
+    result = set()
+    for n in sizes:
+        if len(chars) < n:
+            continue
+        result.update(chars[i:i + n] for i in range(len(chars) - n + 1))
+    if not result and chars:
+        result.add(chars)
+    return result
+
+
+def content_chars(text: str) -> Set[str]:
+    """取出問句中的內容字（去除虛詞與標點）"""
+    return {
+        c for c in normalize_message(text)
+        if c not in _FUNCTION_CHARS and c not in _IGNORED_CHARS
+    }
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """以多組種子與 splitmix64 混合函數模擬隨機排列，產生 MinHash 簽章"""
+
+    def __init__(self, num_perm: int = 128, seed: int = 1, shingle_sizes: Tuple[int, ...] = (1, 2)):
+        self.num_perm = num_perm
+        self.shingle_sizes = shingle_sizes
+        rng = np.random.RandomState(seed)
+        self._seeds = rng.randint(0, np.iinfo(np.int64).max, size=num_perm, dtype=np.int64).astype(np.uint64)
+
+    @staticmethod
+    def _mix(values: np.ndarray) -> np.ndarray:
+        """splitmix64 終結函數，uint64 乘法溢位即為 mod 2^64"""
+        z = values.copy()
+        z ^= z >> np.uint64(30)
+        z *= _MIX_1
+        z ^= z >> np.uint64(27)
+        z *= _MIX_2
+        z ^= z >> np.uint64(31)
+        return z
+
+    def signature_from_shingles(self, items: Iterable[str]) -> np.ndarray:
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest(), 'little')
+             for item in items),
+            dtype=np.uint64
+        )
+        if hashes.size == 0:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        return self._mix(hashes[:, None] ^ self._seeds[None, :]).min(axis=0)
+
+    def signature(self, text: str) -> np.ndarray:
+        return self.signature_from_shingles(shingles(text, self.shingle_sizes))
+
+    @staticmethod
+    def estimate_similarity(sig1: np.ndarray, sig2: np.ndarray) -> float:
+        return float(np.mean(sig1 == sig2))
+
+
+def band_keys(signature: np.ndarray, bands: int) -> List[str]:
+    """將簽章切成 bands 段，每段雜湊為一個桶鍵"""
+    rows = len(signature) // bands
+    return [
+        hashlib.blake2b(signature[i * rows:(i + 1) * rows].tobytes(), digest_size=8).hexdigest()
+        for i in range(bands)
+    ]
+
+
+class FuzzyMatcher:
+    """候選問句的最終比對：字元 n-gram 相似度加上內容字檢查"""
+
+    def __init__(self, threshold: float = 0.45, content_threshold: float = 0.8,
+                 min_length: int = 4, shingle_sizes: Tuple[int, ...] = (1, 2)):
+        self.threshold = threshold
+        self.content_threshold = content_threshold
+        self.min_length = min_length
+        self.shingle_sizes = shingle_sizes
+
+    def eligible(self, text: str) -> bool:
+        """過短的問句（如「那後來呢」）高度依賴上下文，不做模糊比對"""
+        return len(content_chars(text)) >= self.min_length
+
+    def score(self, query: str, candidate: str) -> Optional[float]:
+        """回傳相似度；未通過內容字檢查時回傳 None"""
+        if jaccard(content_chars(query), content_chars(candidate)) < self.content_threshold:
+            return None
+        return jaccard(
+            shingles(query, self.shingle_sizes),
+            shingles(candidate, self.shingle_sizes)
+        )
+
+    def matches(self, query: str, candidate: str) -> bool:
+        score = self.score(query, candidate)
+        return score is not None and score >= self.threshold
+
+
+class LSHIndex:
+    """記憶體內的 LSH 索引，用於離線評估與測試"""
+
+    def __init__(self, hasher: MinHasher, bands: int = 64):
+        self.hasher = hasher
+        self.bands = bands
+        self._buckets: List[Dict[str, Set[str]]] = [dict() for _ in range(bands)]
+        self._entries: Dict[str, str] = {}
+
+    def insert(self, key: str, text: str) -> None:
+        self._entries[key] = text
+        for band, bucket in enumerate(band_keys(self.hasher.signature(text), self.bands)):
+            self._buckets[band].setdefault(bucket, set()).add(key)
+
+    def candidates(self, text: str) -> Set[str]:
+        result = set()
+        for band, bucket in enumerate(band_keys(self.hasher.signature(text), self.bands)):
+            result.update(self._buckets[band].get(bucket, ()))
+        return result
+
+    def query(self, text: str, matcher: FuzzyMatcher) -> Optional[Tuple[str, float]]:
+        """回傳最相似且通過門檻的項目 (key, score)"""
+        best = None
+        for key in self.candidates(text):
+            score = matcher.score(text, self._entries[key])
+            if score is not None and score >= matcher.threshold and (best is None or score > best[1]):
+                best = (key, score)
+        return best
@@ -0,0 +1,125 @@
+"""
+模型路由
+
+依本地啟發式規則（訊息長度、問題類型、對話深度）將訊息分為簡單與複雜兩類：
+簡單的寒暄與短問題交給快速模型，需要推理或比較的問題交給強模型。
+輸出上限由人設提示詞「回答不超過 200 字」換算，避免模型產生用不到的長回答。
+"""
+from typing import Optional
+from django.conf import settings
+from . import metrics
+from .normalization import normalize_message
+import json
+import logging
+import math
+import re
+
+logger = logging.getLogger(__name__)
+
+ROUTES = metrics.counter('ai_model_routes_total', '模型路由決策次數', ['tier', 'reason'])
+
+FAST = 'fast'
+STRONG = 'strong'
+
+_GREETING_RE = re.compile(
+    r'^(你好|您好|哈囉|嗨|早安|午安|晚安|謝謝|感謝|再見|掰掰|hi|hello|hey|thanks|thank you|bye)'
+    r'[\s,!.~]*(啊|呀|喔|囉|您|你)?[\s,!.~]*$'
+)
+# 需要解釋、推理或比較的問題；英文關鍵字須是完整的單字（含字尾變化），「show」「however」不算。
+# 不用 \b：中文字也算 \w，「請問why」中的 why 前面沒有 \b
+_COMPLEX_RE = re.compile(
+    r'為什麼|為何|如何|怎麼|怎樣|原理|機制|解釋|推導|證明|計算|比較|差異|不同|區別|影響|分析|評價|看法|'
+    r'(?<![a-z])(?:why|how|explain(?:s|ed|ing)?|compar(?:e|es|ed|ing)|differences?)(?![a-z])'
+)
+# 化學式或方程式，例如 H2O、2H2 + O2
+_FORMULA_RE = re.compile(r'[A-Z][a-z]?\d|[=→+]')
+
+
+class Route:
+    def __init__(self, tier: str, model: str, max_tokens: int, reason: str):
+        self.tier = tier
+        self.model = model
+        self.max_tokens = max_tokens
+        self.reason = reason
+
+    def as_dict(self) -> dict:
+        return {'tier': self.tier, 'model': self.model, 'max_tokens': self.max_tokens, 'reason': self.reason}
+
+
+class ModelRouter:
+    def __init__(self, enabled: bool, fast_model: str, strong_model: str, answer_max_chars: int,
+                 tokens_per_char: float, max_tokens: int, short_chars: int = 20, long_chars: int = 80,
+                 deep_history: int = 8):
+        self.enabled = enabled
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.short_chars = short_chars
+        self.long_chars = long_chars
+        self.deep_history = deep_history
+        self.max_tokens = max_tokens
+        # 由回答字數上限換算輸出 token 上限，並保留兩成給結尾與標點
+        self.answer_tokens = min(max_tokens, math.ceil(answer_max_chars * tokens_per_char * 1.2))
+
+    @classmethod
+    def from_settings(cls) -> 'ModelRouter':
+        return cls(
+            enabled=settings.AI_ROUTER_ENABLED,
+            fast_model=settings.AI_FAST_MODEL,
+            strong_model=settings.AI_STRONG_MODEL,
+            answer_max_chars=settings.AI_ANSWER_MAX_CHARS,
+            tokens_per_char=settings.AI_TOKENS_PER_CHAR,
+            max_tokens=settings.MAX_TOKENS,
+            short_chars=settings.AI_ROUTER_SHORT_CHARS,
+            long_chars=settings.AI_ROUTER_LONG_CHARS,
+            deep_history=settings.AI_ROUTER_DEEP_HISTORY,
+        )
+
+    def strong(self, reason: str = 'forced') -> Route:
+        return Route(STRONG, self.strong_model, self.answer_tokens, reason)
+
+    def classify(self, user_message: str, history: Optional[list] = None) -> tuple:
+        """回傳 (tier, reason)"""
+        text = normalize_message(user_message)
+        turns = sum(1 for message in history or () if message['role'] != 'system')
+
+        if _GREETING_RE.match(text):
+            return FAST, 'greeting'
+
+        score = 0
+        reasons = []
+        if _COMPLEX_RE.search(text):
+            score += 2
+            reasons.append('complex')
+        if len(text) > self.long_chars:
+            score += 2
+            reasons.append('long')
+        # 正規化時已去除結尾問號，中間仍有問號表示一次問了多個問題
+        if '?' in text:
+            score += 1
+            reasons.append('multi_question')
+        if _FORMULA_RE.search(user_message):
+            score += 1
+            reasons.append('formula')
+        if turns >= self.deep_history:
+            score += 1
+            reasons.append('deep_history')
+
+        if score >= 2:
+            return STRONG, '+'.join(reasons)
+        if len(text) <= self.short_chars:
+            return FAST, '+'.join(['short', *reasons])
+        return FAST, '+'.join(reasons) or 'simple'
+
+    def route(self, user_message: str, history: Optional[list] = None) -> Route:
+        if not self.enabled:
+            return Route(STRONG, self.strong_model, self.max_tokens, 'disabled')
+
+        tier, reason = self.classify(user_message, history)
+        model = self.fast_model if tier == FAST else self.strong_model
+        # 寒暄只需要一兩句話
+        max_tokens = self.answer_tokens // 2 if reason == 'greeting' else self.answer_tokens
+        route = Route(tier, model, max_tokens, reason)
+
+        ROUTES.inc(tier=tier, reason=reason.split('+')[0])
+        logger.info(f"模型路由: {json.dumps(route.as_dict(), ensure_ascii=False)}")
+        return route
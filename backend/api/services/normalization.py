@@ -0,0 +1,55 @@
+"""
+使用者訊息正規化
+
+不依賴 Django，供回應快取、模糊快取與離線腳本共用。
+"""
+import re
+import unicodedata
+
+try:
+    import opencc
+    _s2t_converter = opencc.OpenCC('s2t')
+except Exception:
+    _s2t_converter = None
+
+# 常見簡體字到繁體字的對照，未安裝 opencc 時使用
+_S2T_PAIRS = (
+    "么麼 发發 现現 气氣 绍紹 个個 们們 这這 吗嗎 为為 说說 对對 时時 间間 问問 题題 学學 实實 验驗 "
+    "过過 还還 没沒 关關 里裡 会會 来來 应應 该該 给給 让讓 样樣 种種 烧燒 从從 于於 与與 东東 两兩 "
+    "历歷 经經 认認 识識 书書 读讀 写寫 听聽 觉覺 热熱 电電 钟鐘 铁鐵 铜銅 银銀 锌鋅 钠鈉 钾鉀 钙鈣 "
+    "镁鎂 铝鋁 锡錫 铅鉛 氢氫 钢鋼 变變 质質 压壓 强強 体體 积積 谁誰 国國 语語 术術 论論 点點 图圖 "
+    "录錄 开開 门門 长長 爱愛 飞飛 车車 边邊 难難 战戰 员員 团團 习習 乐樂 华華 厂廠 广廣 亲親 杂雜 "
+    "坏壞 虑慮 讲講 讨討 谈談 请請 谢謝 欢歡 周週 测測 试試 结結 构構 轻輕 镭鐳 钋釙 铀鈾 辐輻 线線 "
+    "诺諾 贝貝 尔爾 奖獎 获獲 纪紀 称稱 级級 标標 准準 确確 则則 规規 预預 儿兒 后後 头頭 脑腦 师師 "
+    "帮幫 价價 见見 观觀 视視 记記 忆憶 动動 机機 药藥 医醫 疗療 农農 业業 产產 单單 双雙 简簡 数數 "
+    "据據 计計 类類 释釋 义義 务務 总總 统統 带帶 导導 领領 贡貢 献獻 伟偉 兴興 怀懷 轮輪 场場 运運 "
+    "进進 远遠 选選 连連 达達 适適 钱錢 闻聞 阳陽 阴陰 际際 陆陸 随隨 险險 页頁 顺順 须須 频頻 风風 "
+    "饭飯 馆館 马馬 鱼魚 鸟鳥 齐齊 龙龍 岁歲 树樹 护護"
+)
+_S2T_TABLE = str.maketrans({
+    pair[0]: pair[1] for pair in _S2T_PAIRS.split()
+})
+
+# NFKC 之外仍需處理的中文標點
+_PUNCT_TABLE = str.maketrans({
+    '。': '.', '、': ',', '「': '"', '」': '"', '『': '"', '』': '"',
+    '《': '"', '》': '"', '〈': '"', '〉': '"', '…': '.', '—': '-', '～': '~',
+})
+_WHITESPACE_RE = re.compile(r'\s+')
+_TRAILING_PUNCT = ' ?!.,~;:"\''
+
+
+def to_traditional(text: str) -> str:
+    """將簡體字轉為繁體字"""
+    if _s2t_converter is not None:
+        return _s2t_converter.convert(text)
+    return text.translate(_S2T_TABLE)
+
+
+def normalize_message(text: str) -> str:
+    """正規化使用者訊息：全半形、空白、標點與繁簡差異"""
+    text = unicodedata.normalize('NFKC', text or '')
+    text = text.translate(_PUNCT_TABLE)
+    text = to_traditional(text).lower()
+    text = _WHITESPACE_RE.sub(' ', text).strip()
+    return text.rstrip(_TRAILING_PUNCT)
@@ -0,0 +1,176 @@
+from collections import OrderedDict
+from typing import Optional
+from django.conf import settings
+from ..models import Chemist
+from . import metrics
+from .redis_client import get_redis
+from .response_cache import persona_version
+from .tokens import estimate_tokens
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = 'ai:persona:invalidate'
+
+PROMPT_TOKENS = metrics.gauge('ai_persona_prompt_tokens', '編譯後人設提示詞的 token 數', ['chemist'])
+COMPILATIONS = metrics.counter('ai_persona_compilations_total', '人設提示詞的編譯次數')
+
+
+def render_persona_prompt(chemist: Chemist) -> str:
+    """生成化學家的系統提示詞；若已設定 system_prompt 則直接使用"""
+    if chemist.system_prompt.strip():
+        return chemist.system_prompt.strip()
+
+    return f"""你現在扮演{chemist.name}（{chemist.birth_year}-{chemist.death_year}）。
+你是一位著名的化學家，請根據以下資訊來回答問題：
+
+1. 基本資訊：
+- 出生年份：{chemist.birth_year}
+- 逝世年份：{chemist.death_year}
+- 主要成就：{chemist.achievements}
+
+2. 重要發現：
+{chemist.discoveries}
+
+3. 個性特點：
+{chemist.personality}
+
+4. 時代背景：
+{chemist.era_background}
+
+5. 回答要求：
+- 使用繁體中文回答
+- 保持專業但親切的語氣
+- 回答要符合你的時代背景
+- 可以分享你的研究經驗和發現過程
+- 如果問題超出你的時代背景，可以表達你的好奇和期待
+- 回答要簡潔，不超過 200 字
+- 在回答中展現你的個性和研究風格
+- 可以適當使用一些當時的科學術語
+- 如果被問到未來發展，可以基於你的時代背景進行推測
+
+6. 禁止事項：
+- 不要提及你死後發生的事件
+- 不要使用現代科學術語（除非被特別問到）
+- 不要表現出對現代科技的熟悉
+- 不要違背你的時代背景和知識範圍
+"""
+
+
+class PersonaRegistry:
+    """人設提示詞登錄表
+
+    每個化學家的提示詞依人設版本 (updated_at) 只編譯一次，結果存放於
+    行程內 LRU 並備份到 Redis。化學家更新時透過 Redis pub/sub 通知所有
+    行程清除舊版本，確保送往上游的提示詞前綴維持逐位元組一致。
+    """
+    KEY_PREFIX = 'ai:persona'
+
+    def __init__(self, max_size: Optional[int] = None):
+        self.max_size = max_size or settings.AI_PERSONA_CACHE_SIZE
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+
+    def _redis_key(self, chemist_id: int, version: str) -> str:
+        return f"{self.KEY_PREFIX}:{chemist_id}:{version}"
+
+    def get(self, chemist: Chemist) -> dict:
+        """取得編譯後的人設：{'prompt', 'tokens', 'version'}"""
+        self._ensure_listener()
+        key = (chemist.id, persona_version(chemist))
+
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None:
+                self._local.move_to_end(key)
+                return entry
+
+        entry = self._load_shared(*key)
+        if entry is None:
+            entry = self._compile(chemist, key[1])
+            self._store_shared(*key, entry)
+
+        with self._lock:
+            self._local[key] = entry
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+        return entry
+
+    def _compile(self, chemist: Chemist, version: str) -> dict:
+        prompt = render_persona_prompt(chemist)
+        entry = {'prompt': prompt, 'tokens': estimate_tokens(prompt), 'version': version}
+        COMPILATIONS.inc()
+        PROMPT_TOKENS.set(entry['tokens'], chemist=chemist.id)
+        logger.info(f"編譯人設提示詞，化學家: {chemist.name}，版本: {version}，token 數: {entry['tokens']}")
+        return entry
+
+    def _load_shared(self, chemist_id: int, version: str) -> Optional[dict]:
+        try:
+            raw = get_redis().get(self._redis_key(chemist_id, version))
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            logger.warning(f"讀取共享人設快取失敗: {str(e)}")
+            return None
+
+    def _store_shared(self, chemist_id: int, version: str, entry: dict) -> None:
+        try:
+            get_redis().set(
+                self._redis_key(chemist_id, version),
+                json.dumps(entry, ensure_ascii=False),
+                ex=settings.AI_PERSONA_CACHE_TTL
+            )
+        except Exception as e:
+            logger.warning(f"寫入共享人設快取失敗: {str(e)}")
+
+    def evict_local(self, chemist_id: int) -> None:
+        with self._lock:
+            for key in [key for key in self._local if key[0] == chemist_id]:
+                del self._local[key]
+
+    def invalidate(self, chemist_id: int) -> None:
+        """清除所有行程中該化學家的人設快取"""
+        self.evict_local(chemist_id)
+        try:
+            redis = get_redis()
+            keys = list(redis.scan_iter(match=f"{self.KEY_PREFIX}:{chemist_id}:*", count=100))
+            if keys:
+                redis.delete(*keys)
+            redis.publish(INVALIDATION_CHANNEL, str(chemist_id))
+        except Exception as e:
+            logger.warning(f"廣播人設失效通知失敗: {str(e)}")
+
+    def _ensure_listener(self) -> None:
+        if self._listener is not None:
+            return
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(
+                    target=self._listen, name='persona-invalidation', daemon=True
+                )
+                self._listener.start()
+
+    def _listen(self) -> None:
+        """訂閱失效通知；Redis 中斷時以指數退避重新連線"""
+        backoff = 1
+        while True:
+            try:
+                pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                backoff = 1
+                for message in pubsub.listen():
+                    try:
+                        self.evict_local(int(message['data']))
+                    except (TypeError, ValueError):
+                        continue
+            except Exception as e:
+                logger.warning(f"人設失效通知訂閱中斷，{backoff} 秒後重試: {str(e)}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+
+
+persona_registry = PersonaRegistry()
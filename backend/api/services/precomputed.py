@@ -0,0 +1,154 @@
+"""
+預先生成的常見問題回答
+
+每位化學家的常見開場問題列於 AI_PRECOMPUTE_QUESTIONS_FILE，答案由
+precompute_answers 指令或 Celery 任務離線生成，依人設版本存放在 PrecomputedAnswer。
+請求時以正規化後的問句比對，命中即直接回傳，不經過上游。
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.core.cache import cache
+from ..models import Chemist, PrecomputedAnswer
+from .normalization import normalize_message
+from .response_cache import persona_version
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def question_hash(question: str) -> str:
+    return hashlib.sha256(normalize_message(question).encode('utf-8')).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def _load_questions(path: str) -> dict:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def canonical_questions(chemist: Chemist) -> List[str]:
+    """通用問題加上該化學家專屬的問題，正規化後相同者只保留一個"""
+    data = _load_questions(settings.AI_PRECOMPUTE_QUESTIONS_FILE)
+    questions = {}
+    for question in [*data.get('default', []), *data.get('chemists', {}).get(chemist.name, [])]:
+        questions.setdefault(question_hash(question), question)
+    return list(questions.values())
+
+
+class PrecomputedAnswers:
+    """讀取與生成預先生成的回答；查詢結果以人設版本為鍵快取在 Redis"""
+    KEY_PREFIX = 'ai:precomputed'
+
+    def is_enabled_for(self, chemist: Chemist) -> bool:
+        return settings.AI_PRECOMPUTE_ENABLED and chemist.response_cache_enabled
+
+    def _key(self, chemist: Chemist) -> str:
+        return f"{self.KEY_PREFIX}:{chemist.id}:{persona_version(chemist)}"
+
+    def answers(self, chemist: Chemist) -> Dict[str, str]:
+        """回傳目前人設版本的 {問題雜湊: 答案}"""
+        key = self._key(chemist)
+        try:
+            answers = cache.get(key)
+            if answers is not None:
+                return answers
+        except Exception as e:
+            logger.warning(f"讀取預先生成回答快取失敗: {str(e)}")
+
+        answers = dict(
+            PrecomputedAnswer.objects
+            .filter(chemist_id=chemist.id, persona_version=persona_version(chemist))
+            .values_list('question_hash', 'answer')
+        )
+        try:
+            cache.set(key, answers, timeout=settings.AI_PRECOMPUTE_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"寫入預先生成回答快取失敗: {str(e)}")
+        return answers
+
+    def lookup(self, chemist: Chemist, question: str) -> Optional[str]:
+        if not self.is_enabled_for(chemist):
+            return None
+        answer = self.answers(chemist).get(question_hash(question))
+        if answer is not None:
+            logger.info(f"預先生成回答命中，化學家: {chemist.name}")
+        return answer
+
+    def closest(self, chemist: Chemist, question: str, min_similarity: float) -> Optional[str]:
+        """回傳問句最相近的預先生成回答，供上游無法使用時備援"""
+        if not self.is_enabled_for(chemist):
+            return None
+        from .minhash import jaccard, shingles
+        query = shingles(question)
+        best = None
+        for candidate, answer in (PrecomputedAnswer.objects
+                                  .filter(chemist_id=chemist.id, persona_version=persona_version(chemist))
+                                  .values_list('question', 'answer')):
+            score = jaccard(query, shingles(candidate))
+            if score >= min_similarity and (best is None or score > best[0]):
+                best = (score, answer)
+        return best[1] if best else None
+
+    def invalidate(self, chemist: Chemist) -> None:
+        try:
+            cache.delete(self._key(chemist))
+        except Exception as e:
+            logger.warning(f"清除預先生成回答快取失敗: {str(e)}")
+
+    def generate(self, chemist: Chemist, service, force: bool = False,
+                 concurrency: Optional[int] = None) -> dict:
+        """以有限的並行數生成目前人設版本缺少的回答，並刪除舊版本的回答
+
+        service 為 AIService；單題失敗只記錄，不影響其他題目。
+        """
+        if not self.is_enabled_for(chemist):
+            return {'generated': 0, 'skipped': 0, 'failed': 0}
+
+        version = persona_version(chemist)
+        questions = canonical_questions(chemist)
+        existing = set() if force else set(
+            PrecomputedAnswer.objects
+            .filter(chemist_id=chemist.id, persona_version=version)
+            .values_list('question_hash', flat=True)
+        )
+        pending = [question for question in questions if question_hash(question) not in existing]
+
+        rows = []
+        failed = 0
+        if pending:
+            workers = min(concurrency or settings.AI_PRECOMPUTE_CONCURRENCY, len(pending))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='precompute') as pool:
+                futures = {pool.submit(service.precompute_answer, chemist, question): question for question in pending}
+                for future in as_completed(futures):
+                    question = futures[future]
+                    try:
+                        answer = future.result()
+                    except Exception as e:
+                        failed += 1
+                        logger.warning(f"預先生成回答失敗，化學家: {chemist.name}，問題: {question}，錯誤: {str(e)}")
+                        continue
+                    if answer:
+                        rows.append(PrecomputedAnswer(
+                            chemist=chemist, persona_version=version,
+                            question_hash=question_hash(question), question=question, answer=answer
+                        ))
+
+        if rows:
+            PrecomputedAnswer.objects.bulk_create(
+                rows, update_conflicts=True,
+                unique_fields=['chemist', 'persona_version', 'question_hash'],
+                update_fields=['question', 'answer']
+            )
+        PrecomputedAnswer.objects.filter(chemist_id=chemist.id).exclude(persona_version=version).delete()
+        self.invalidate(chemist)
+
+        skipped = len(questions) - len(pending)
+        logger.info(f"預先生成回答完成，化學家: {chemist.name}，新增 {len(rows)} 題，略過 {skipped} 題，失敗 {failed} 題")
+        return {'generated': len(rows), 'skipped': skipped, 'failed': failed}
+
+
+precomputed_answers = PrecomputedAnswers()
@@ -0,0 +1,325 @@
+"""
+LLM 供應者介面
+
+AIService 只透過這裡的介面呼叫模型，由 AI_PROVIDER 設定選擇：
+- openai：正式環境使用的 OpenAI Chat Completions
+- mock：本地模擬，產生固定的擬人化文字並模擬延遲與錯誤，供離線壓測與 CI 使用
+"""
+from functools import lru_cache
+from typing import Iterator, List, Optional
+from django.conf import settings
+import asyncio
+import hashlib
+import logging
+import random
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Completion:
+    """一次非串流呼叫的結果"""
+
+    def __init__(self, content: str, prompt_tokens: int = 0, completion_tokens: int = 0, model: str = ''):
+        self.content = content
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.model = model
+
+
+class LLMProvider:
+    """供應者基底類別；timeout 為本次呼叫可用的秒數（通常是請求剩餘的期限）"""
+    name = ''
+
+    def complete(self, model: str, messages: List[dict], max_tokens: int, temperature: float,
+                 timeout: Optional[float] = None) -> Completion:
+        raise NotImplementedError
+
+    async def acomplete(self, model: str, messages: List[dict], max_tokens: int, temperature: float,
+                        timeout: Optional[float] = None) -> Completion:
+        raise NotImplementedError
+
+    def stream(self, model: str, messages: List[dict], max_tokens: int, temperature: float,
+               timeout: Optional[float] = None) -> Iterator[str]:
+        raise NotImplementedError
+
+    def check(self, model: str) -> None:
+        """連線檢查，失敗時拋出例外"""
+        raise NotImplementedError
+
+
+class DeltaStream:
+    """OpenAI 串流回應中的文字增量
+
+    不使用產生器：close() 可以由其他執行緒呼叫（例如對沖落敗時），
+    直接關閉 HTTP 連線，讓阻塞在讀取中的執行緒立即結束並歸還上游名額。
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._chunks = iter(stream)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        while True:
+            chunk = next(self._chunks)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                return delta
+
+    def close(self) -> None:
+        # 被取消或提早結束時關閉連線，不再讀取剩餘內容
+        close = getattr(self._stream, 'close', None)
+        if close is not None:
+            close()
+
+
+class OpenAIProvider(LLMProvider):
+    name = 'openai'
+
+    def __init__(self):
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _http_limits():
+        import httpx
+        return httpx.Limits(
+            max_connections=settings.AI_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.AI_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=settings.AI_HTTP_KEEPALIVE_EXPIRY
+        )
+
+    @property
+    def client(self):
+        """延遲建立 OpenAI 客戶端，同時延後 openai 套件的載入"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import httpx
+                    from openai import OpenAI
+                    # 行程內共用的連線池，保持長連線以省去重複的 TLS 握手；
+                    # 重試由 HedgedCaller 在請求期限內負責，關閉 SDK 內建的重試以免次數相乘
+                    self._client = OpenAI(
+                        api_key=settings.OPENAI_API_KEY,
+                        max_retries=0,
+                        http_client=httpx.Client(limits=self._http_limits(), timeout=settings.AI_HTTP_TIMEOUT)
+                    )
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    import httpx
+                    from openai import AsyncOpenAI
+                    self._async_client = AsyncOpenAI(
+                        api_key=settings.OPENAI_API_KEY,
+                        max_retries=0,
+                        http_client=httpx.AsyncClient(limits=self._http_limits(), timeout=settings.AI_HTTP_TIMEOUT)
+                    )
+        return self._async_client
+
+    @staticmethod
+    def _options(model: str, messages: List[dict], max_tokens: int, temperature: float,
+                 timeout: Optional[float]) -> dict:
+        options = {
+            'model': model,
+            'messages': messages,
+            'temperature': temperature,
+            'max_tokens': max_tokens,
+            'top_p': 1.0,
+            'frequency_penalty': 0.0,
+            'presence_penalty': 0.0,
+        }
+        if timeout is not None:
+            options['timeout'] = timeout
+        return options
+
+    @staticmethod
+    def _to_completion(response) -> Completion:
+        usage = getattr(response, 'usage', None)
+        return Completion(
+            content=response.choices[0].message.content,
+            prompt_tokens=getattr(usage, 'prompt_tokens', 0) or 0,
+            completion_tokens=getattr(usage, 'completion_tokens', 0) or 0,
+            model=getattr(response, 'model', '') or '',
+        )
+
+    def complete(self, model, messages, max_tokens, temperature, timeout=None):
+        response = self.client.chat.completions.create(
+            **self._options(model, messages, max_tokens, temperature, timeout)
+        )
+        return self._to_completion(response)
+
+    async def acomplete(self, model, messages, max_tokens, temperature, timeout=None):
+        response = await self.async_client.chat.completions.create(
+            **self._options(model, messages, max_tokens, temperature, timeout)
+        )
+        return self._to_completion(response)
+
+    def stream(self, model, messages, max_tokens, temperature, timeout=None):
+        return DeltaStream(self.client.chat.completions.create(
+            **self._options(model, messages, max_tokens, temperature, timeout), stream=True
+        ))
+
+    def check(self, model):
+        # 查詢模型資訊，不消耗 token
+        self.client.models.retrieve(model)
+
+
+class MockProviderError(Exception):
+    """模擬的上游錯誤"""
+
+
+class MockProvider(LLMProvider):
+    """本地模擬供應者
+
+    回答內容由訊息雜湊決定，相同輸入永遠得到相同文字；延遲依設定的
+    首字延遲（對數常態分佈）、每秒 token 數與錯誤率抽樣，可用 AI_MOCK_SEED 固定。
+    """
+    name = 'mock'
+
+    OPENINGS = [
+        "這是個好問題。",
+        "在我的實驗室裡，我們也常討論這件事。",
+        "讓我從自己的研究經驗說起。",
+        "依我當年的觀察，",
+        "你的好奇心讓我想起年輕時的自己。",
+    ]
+    BODIES = [
+        "我反覆稱量反應前後的物質，發現質量始終守恆。",
+        "仔細記錄每一次加熱與燃燒，是理解變化的關鍵。",
+        "元素的性質似乎隨著重量呈現規律，這讓我著迷。",
+        "純化樣品花費了無數個夜晚，但結果值得等待。",
+        "實驗必須可以重複，否則再驚人的現象也只是傳聞。",
+        "氣體的體積與壓力之間有著簡潔而優美的關係。",
+        "當時的儀器十分簡陋，我們只能靠耐心彌補。",
+    ]
+    CLOSINGS = [
+        "科學的樂趣就在於不斷提出新的問題。",
+        "希望這能給你一些啟發。",
+        "若你也動手試試，或許會有新的發現。",
+        "我很好奇後人會如何看待這些發現。",
+    ]
+
+    _NAME_RE = re.compile(r'你現在扮演([^（(\s，。]+)')
+
+    def __init__(self, ttfb_ms: Optional[float] = None, ttfb_sigma: Optional[float] = None,
+                 tokens_per_sec: Optional[float] = None, error_rate: Optional[float] = None,
+                 seed: Optional[int] = None):
+        self.ttfb_ms = settings.AI_MOCK_TTFB_MS if ttfb_ms is None else ttfb_ms
+        self.ttfb_sigma = settings.AI_MOCK_TTFB_SIGMA if ttfb_sigma is None else ttfb_sigma
+        self.tokens_per_sec = tokens_per_sec or settings.AI_MOCK_TOKENS_PER_SEC
+        self.error_rate = settings.AI_MOCK_ERROR_RATE if error_rate is None else error_rate
+        seed = settings.AI_MOCK_SEED if seed is None else seed
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _persona_name(self, messages: List[dict]) -> str:
+        for message in messages:
+            if message['role'] == 'system':
+                match = self._NAME_RE.search(message['content'])
+                if match:
+                    return match.group(1)
+        return '化學家'
+
+    def render(self, messages: List[dict], max_tokens: int) -> str:
+        """依訊息內容產生固定的回答"""
+        digest = hashlib.sha256(
+            '\x1e'.join(f"{m['role']}:{m['content']}" for m in messages).encode('utf-8')
+        ).digest()
+        rng = random.Random(digest)
+        question = messages[-1]['content'] if messages else ''
+        parts = [
+            f"我是{self._persona_name(messages)}。",
+            rng.choice(self.OPENINGS),
+            f"關於「{question[:20]}」，",
+            *rng.sample(self.BODIES, 2),
+            rng.choice(self.CLOSINGS),
+        ]
+        # 中文約一字一 token，依 max_tokens 截斷
+        return ''.join(parts)[:max_tokens]
+
+    def _sample(self):
+        """抽樣首字延遲、每個 token 的間隔與是否失敗"""
+        with self._lock:
+            ttfb = self._random.lognormvariate(0, self.ttfb_sigma) * self.ttfb_ms / 1000 if self.ttfb_ms else 0
+            failed = self._random.random() < self.error_rate
+        interval = 1 / self.tokens_per_sec if self.tokens_per_sec else 0
+        return ttfb, interval, failed
+
+    @staticmethod
+    def _chunks(text: str, size: int = 2) -> List[str]:
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def _completion(self, model: str, messages: List[dict], text: str) -> Completion:
+        from .tokens import estimate_messages_tokens, estimate_tokens
+        return Completion(text, estimate_messages_tokens(messages), estimate_tokens(text), model)
+
+    @staticmethod
+    def _first_byte(ttfb: float, failed: bool, timeout: Optional[float]) -> float:
+        """回傳首字前需等待的秒數；逾時或失敗時等待後拋出例外"""
+        if timeout is not None and ttfb > timeout:
+            time.sleep(timeout)
+            raise TimeoutError('模擬的上游逾時')
+        if failed:
+            time.sleep(ttfb)
+            raise MockProviderError('模擬的上游錯誤')
+        return ttfb
+
+    def complete(self, model, messages, max_tokens, temperature, timeout=None):
+        text = self.render(messages, max_tokens)
+        ttfb, interval, failed = self._sample()
+        time.sleep(self._first_byte(ttfb, failed, timeout))
+        time.sleep(interval * len(text))
+        return self._completion(model, messages, text)
+
+    async def acomplete(self, model, messages, max_tokens, temperature, timeout=None):
+        text = self.render(messages, max_tokens)
+        ttfb, interval, failed = self._sample()
+        if timeout is not None and ttfb > timeout:
+            await asyncio.sleep(timeout)
+            raise TimeoutError('模擬的上游逾時')
+        await asyncio.sleep(ttfb)
+        if failed:
+            raise MockProviderError('模擬的上游錯誤')
+        await asyncio.sleep(interval * len(text))
+        return self._completion(model, messages, text)
+
+    def stream(self, model, messages, max_tokens, temperature, timeout=None):
+        text = self.render(messages, max_tokens)
+        ttfb, interval, failed = self._sample()
+        time.sleep(self._first_byte(ttfb, failed, timeout))
+        for chunk in self._chunks(text):
+            yield chunk
+            time.sleep(interval * len(chunk))
+
+    def check(self, model):
+        return None
+
+
+PROVIDERS = {
+    OpenAIProvider.name: OpenAIProvider,
+    MockProvider.name: MockProvider,
+}
+
+
+@lru_cache(maxsize=None)
+def get_provider(name: Optional[str] = None) -> LLMProvider:
+    """取得設定的供應者（每個行程共用一個實例）"""
+    name = name or settings.AI_PROVIDER
+    try:
+        provider_class = PROVIDERS[name]
+    except KeyError:
+        raise ValueError(f"未知的 AI_PROVIDER: {name}，可用選項: {', '.join(PROVIDERS)}")
+    logger.info(f"使用 LLM 供應者: {name}")
+    return provider_class()
@@ -0,0 +1,9 @@
+from functools import lru_cache
+from django.conf import settings
+import redis
+
+
+@lru_cache(maxsize=None)
+def get_redis() -> redis.Redis:
+    """取得共用的 Redis 連線（連線池由 redis-py 管理）"""
+    return redis.Redis.from_url(settings.REDIS_CACHE_URL, decode_responses=True)
@@ -0,0 +1,110 @@
+from typing import Optional
+from django.conf import settings
+from django.core.cache import caches
+from ..models import Chemist
+from .normalization import normalize_message
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def history_fingerprint(history: list) -> str:
+    """計算對話上下文的指紋"""
+    payload = json.dumps(
+        [(msg['role'], normalize_message(msg['content'])) for msg in history],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def persona_version(chemist: Chemist) -> str:
+    """以化學家的更新時間作為人設版本"""
+    if chemist.updated_at is None:
+        return '0'
+    return str(int(chemist.updated_at.timestamp() * 1_000_000))
+
+
+class ResponseCache:
+    """以 Redis 為後端的 AI 回應精確快取"""
+    KEY_PREFIX = 'ai:resp'
+
+    def __init__(self, cache_alias: str = 'default'):
+        self.cache_alias = cache_alias
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @property
+    def enabled(self) -> bool:
+        return settings.AI_RESPONSE_CACHE_ENABLED
+
+    def is_enabled_for(self, chemist: Chemist) -> bool:
+        return self.enabled and chemist.response_cache_enabled
+
+    def make_key(self, chemist: Chemist, user_message: str, history: list) -> str:
+        """組合快取鍵：化學家、人設版本、正規化訊息與上下文指紋"""
+        digest = hashlib.sha256(
+            f"{normalize_message(user_message)}\x1e{history_fingerprint(history)}".encode('utf-8')
+        ).hexdigest()[:32]
+        return f"{self.KEY_PREFIX}:{chemist.id}:{persona_version(chemist)}:{digest}"
+
+    def get(self, chemist: Chemist, user_message: str, history: list) -> Optional[str]:
+        if not self.is_enabled_for(chemist):
+            return None
+        try:
+            cached = self.cache.get(self.make_key(chemist, user_message, history))
+        except Exception as e:
+            logger.warning(f"讀取回應快取失敗: {str(e)}")
+            return None
+
+        self._incr(chemist, 'hits' if cached is not None else 'misses')
+        if cached is not None:
+            logger.info(f"回應快取命中，化學家: {chemist.name}")
+        return cached
+
+    def peek(self, chemist: Chemist, user_message: str, history: list) -> Optional[str]:
+        """查詢快取但不計入命中統計"""
+        if not self.is_enabled_for(chemist):
+            return None
+        try:
+            return self.cache.get(self.make_key(chemist, user_message, history))
+        except Exception as e:
+            logger.warning(f"讀取回應快取失敗: {str(e)}")
+            return None
+
+    def set(self, chemist: Chemist, user_message: str, history: list, response: str) -> None:
+        if not self.is_enabled_for(chemist) or not response:
+            return
+        try:
+            self.cache.set(
+                self.make_key(chemist, user_message, history),
+                response,
+                timeout=settings.AI_RESPONSE_CACHE_TTL
+            )
+        except Exception as e:
+            logger.warning(f"寫入回應快取失敗: {str(e)}")
+
+    def _incr(self, chemist: Chemist, field: str) -> None:
+        for key in (f"{self.KEY_PREFIX}:stats:{field}",
+                    f"{self.KEY_PREFIX}:stats:{chemist.id}:{field}"):
+            try:
+                self.cache.add(key, 0, timeout=None)
+                self.cache.incr(key)
+            except Exception as e:
+                logger.warning(f"更新快取統計失敗: {str(e)}")
+
+    def stats(self, chemist_id: Optional[int] = None) -> dict:
+        """回傳命中與未命中次數"""
+        scope = f"{self.KEY_PREFIX}:stats:{chemist_id}" if chemist_id else f"{self.KEY_PREFIX}:stats"
+        values = self.cache.get_many([f"{scope}:hits", f"{scope}:misses"])
+        hits = values.get(f"{scope}:hits", 0)
+        misses = values.get(f"{scope}:misses", 0)
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,147 @@
+"""
+全文搜尋
+
+Chemist、HistoricalEvent 與 ChatHistory 各有一個 search_vector 欄位，由資料庫觸發器維護（0017 遷移）：
+非 CJK 文字以 simple 設定切詞，連續的 CJK 字元切成重疊的雙字詞並保留最後一個字。
+查詢以相同的規則轉成 tsquery，所有條件都由 GIN 索引處理：
+- 兩個字以上的 CJK 片段：雙字詞以 <-> 串成片語，例如「拉瓦錫」-> '拉瓦' <-> '瓦錫'
+- 單一個 CJK 字：前綴比對，例如「氧」-> '氧':*
+- 其他詞：轉小寫後前綴比對，邊輸入邊搜尋也有結果
+各片段以 & 結合。化學家姓名另以 pg_trgm 的 word similarity 比對，容許拼字錯誤。
+
+三種結果以 UNION ALL 合併後依 (rank, kind, id) 做 keyset 分頁；
+聊天記錄只搜尋目前使用者（或匿名 session）自己的對話。
+"""
+from html import escape
+from typing import List, Optional, Sequence
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db import models
+from django.db.models import F, Q, Value
+from django.db.models.functions import Cast, Greatest
+from ..models import Chemist, ChatHistory, HistoricalEvent
+from . import conversations
+import re
+
+# 平假名、片假名、CJK 統一表意文字（含擴充 A 與相容字）與韓文音節，須與 0017 遷移的 CJK 相同
+CJK = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af'
+KINDS = ('chemist', 'event', 'chat')
+# 合併查詢的欄位；不可與模型欄位同名
+COLUMNS = ('kind', 'ref', 'rank', 'heading', 'body', 'chemist_ref', 'conversation_ref')
+ORDERING = ('-rank', 'kind', 'ref')
+MAX_TERMS = 8
+
+_TERM = re.compile(rf'[{CJK}]+|[^\W_{CJK}]+')
+_CJK_RUN = re.compile(rf'[{CJK}]+')
+
+
+def terms(q: str) -> List[str]:
+    """查詢字串中的 CJK 片段與其他詞，標點與空白只作為分隔"""
+    return _TERM.findall(q)[:MAX_TERMS]
+
+
+def _lexeme(text: str, prefix: bool = False) -> str:
+    quoted = text.replace('\\', '\\\\').replace("'", "''")
+    return f"'{quoted}'" + (':*' if prefix else '')
+
+
+def to_tsquery(q: str) -> Optional[str]:
+    """轉成 to_tsquery 語法；沒有可搜尋的詞時回傳 None"""
+    parts = []
+    for term in terms(q):
+        if not _CJK_RUN.fullmatch(term):
+            parts.append(_lexeme(term.lower(), prefix=True))
+        elif len(term) == 1:
+            parts.append(_lexeme(term, prefix=True))
+        else:
+            parts.append(' <-> '.join(_lexeme(term[i:i + 2]) for i in range(len(term) - 1)))
+    return ' & '.join(f'({part})' for part in parts) or None
+
+
+def highlight(text: str, q: str, length: Optional[int] = None) -> str:
+    """跳脫 HTML 後以 <mark> 標示查詢詞
+
+    指定 length 時只保留第一個符合處附近的 length 個字，前後被截掉的部分以「…」表示。
+    tsvector 的雙字詞沒有對應的原文位置，ts_headline 無法處理，因此在應用端比對原文。
+    """
+    text = text or ''
+    words = sorted(set(terms(q)), key=len, reverse=True)
+    pattern = re.compile('|'.join(re.escape(word) for word in words), re.IGNORECASE) if words else None
+    match = pattern.search(text) if pattern else None
+
+    start, end = 0, len(text)
+    if length and len(text) > length:
+        start = max(0, min(match.start() - length // 4, len(text) - length)) if match else 0
+        end = start + length
+    snippet = text[start:end]
+
+    pieces, position = [], 0
+    for found in pattern.finditer(snippet) if pattern else ():
+        pieces.append(escape(snippet[position:found.start()]))
+        pieces.append(f'<mark>{escape(found.group())}</mark>')
+        position = found.end()
+    pieces.append(escape(snippet[position:]))
+    return ('…' if start > 0 else '') + ''.join(pieces) + ('…' if end < len(text) else '')
+
+
+def _columns(queryset, kind: str, rank, heading, body, chemist_ref, conversation_ref):
+    return queryset.annotate(
+        kind=Value(kind, output_field=models.CharField()),
+        ref=F('id'),
+        # ts_rank 回傳 real；轉為 double precision，游標帶回的值才能與資料庫中的值精確比較
+        rank=Cast(rank, models.FloatField()),
+        heading=heading,
+        body=body,
+        chemist_ref=chemist_ref,
+        conversation_ref=conversation_ref,
+    ).values(*COLUMNS)
+
+
+def querysets(q: str, request, kinds: Sequence[str] = KINDS) -> list:
+    """各類結果的 values() 查詢，欄位依 COLUMNS 排列，可直接以 UNION ALL 合併"""
+    tsquery = to_tsquery(q)
+    if tsquery is None:
+        return []
+    query = SearchQuery(tsquery, search_type='raw', config='simple')
+    no_conversation = Value(None, output_field=models.UUIDField())
+    results = []
+
+    if 'chemist' in kinds:
+        chemists = Chemist.objects.filter(
+            Q(search_vector=query) | Q(name__trigram_word_similar=q), deleted_at__isnull=True
+        )
+        results.append(_columns(
+            chemists, 'chemist',
+            rank=Greatest(SearchRank(F('search_vector'), query), TrigramWordSimilarity(q, 'name')),
+            heading=F('name'), body=F('description'), chemist_ref=F('id'), conversation_ref=no_conversation,
+        ))
+
+    if 'event' in kinds:
+        events = HistoricalEvent.objects.filter(search_vector=query, chemist__deleted_at__isnull=True)
+        results.append(_columns(
+            events, 'event',
+            rank=SearchRank(F('search_vector'), query),
+            heading=F('title'), body=F('description'), chemist_ref=F('chemist_id'), conversation_ref=no_conversation,
+        ))
+
+    owned = conversations.for_owner(request)
+    if 'chat' in kinds and not owned.query.is_empty():
+        messages = ChatHistory.objects.filter(search_vector=query, conversation__in=owned.order_by().values('id'))
+        results.append(_columns(
+            messages, 'chat',
+            rank=SearchRank(F('search_vector'), query),
+            heading=F('role'), body=F('content'), chemist_ref=F('chemist_id'), conversation_ref=F('conversation_id'),
+        ))
+    return results
+
+
+def serialize(row: dict, q: str) -> dict:
+    return {
+        'type': row['kind'],
+        'id': row['ref'],
+        'rank': round(row['rank'], 4),
+        'title': highlight(row['heading'], q),
+        'snippet': highlight(row['body'], q, settings.SEARCH_SNIPPET_LENGTH),
+        'chemist_id': row['chemist_ref'],
+        'conversation_id': str(row['conversation_ref']) if row['conversation_ref'] else None,
+    }
@@ -0,0 +1,453 @@
+from typing import Callable, Dict, Iterator, Optional, Tuple
+from django.conf import settings
+from . import metrics
+from .concurrency import UpstreamBusy
+from .redis_client import get_redis
+import asyncio
+import logging
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+REQUESTS = metrics.counter(
+    'ai_single_flight_total', '請求合併的角色統計（leader 實際呼叫上游，其餘共用結果）', ['role']
+)
+
+# 非同步等待其他行程結果時，以不阻塞的 XREAD 輪詢的間隔秒數
+REMOTE_POLL_INTERVAL = 0.1
+
+# 僅在鎖仍屬於自己時才刪除
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlightTimeout(Exception):
+    """等待其他請求的結果逾時"""
+
+
+class LeaderFailed(Exception):
+    """leader 呼叫上游失敗，或在完成前被取消、客戶端斷線"""
+
+
+def _leader_error(error: BaseException) -> Exception:
+    # 取消與 GeneratorExit 等不是上游錯誤，但 leader 沒有完成，followers 不能把不完整的結果當作答案
+    return error if isinstance(error, Exception) else LeaderFailed(type(error).__name__)
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class _Flight:
+    """行程內一次進行中的上游呼叫，followers 等待或逐段讀取其結果"""
+
+    def __init__(self):
+        self.token = uuid.uuid4().hex
+        self.chunks = []
+        self.result: Optional[str] = None
+        self.error: Optional[BaseException] = None
+        self.done = False
+        # 是否持有 Redis 鎖（需寫入結果通道供其他行程讀取）
+        self.clustered = False
+        self._cond = threading.Condition()
+        # 非同步 followers：(event loop, future)，完成時由 finish 喚醒
+        self._waiters = []
+
+    def publish(self, chunk: str) -> None:
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, result: Optional[str] = None, error: Optional[BaseException] = None) -> None:
+        with self._cond:
+            self.result = result if result is not None else ''.join(self.chunks)
+            self.error = error
+            self.done = True
+            self._cond.notify_all()
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                # 該 event loop 已關閉
+                pass
+
+    def _outcome(self) -> str:
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def wait(self, timeout: float) -> str:
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.done, timeout):
+                raise SingleFlightTimeout()
+        return self._outcome()
+
+    async def await_result(self, timeout: float) -> str:
+        """wait 的非同步版本；以 future 等待，不佔用執行緒"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._cond:
+            if self.done:
+                return self._outcome()
+            waiter = (loop, future)
+            self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise SingleFlightTimeout()
+        finally:
+            with self._cond:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        return self._outcome()
+
+    def follow(self, timeout: float) -> Iterator[str]:
+        deadline = time.monotonic() + timeout
+        position = 0
+        while True:
+            with self._cond:
+                ready = self._cond.wait_for(
+                    lambda: self.done or len(self.chunks) > position,
+                    max(deadline - time.monotonic(), 0)
+                )
+                if not ready:
+                    raise SingleFlightTimeout()
+                pending = self.chunks[position:]
+                done = self.done
+            for chunk in pending:
+                yield chunk
+            position += len(pending)
+            if done:
+                if self.error is not None:
+                    # 已轉送的片段不完整，由呼叫端決定如何處理
+                    raise self.error
+                if not self.chunks and self.result:
+                    # leader 走非串流路徑時一次取得完整結果
+                    yield self.result
+                return
+
+
+class _Channel:
+    """leader 將結果寫入 Redis Stream，供其他行程的 followers 讀取"""
+
+    def __init__(self, stream: str, ttl: int):
+        self.stream = stream
+        self.ttl = ttl
+        self._broken = False
+
+    def _add(self, fields: dict) -> None:
+        if self._broken:
+            return
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            pipe.xadd(self.stream, fields)
+            pipe.expire(self.stream, self.ttl)
+            pipe.execute()
+        except Exception as e:
+            self._broken = True
+            logger.warning(f"寫入合併結果通道失敗: {str(e)}")
+
+    def chunk(self, text: str) -> None:
+        self._add({'t': 'chunk', 'd': text})
+
+    def done(self, result: str) -> None:
+        self._add({'t': 'done', 'd': result})
+
+    def error(self, error: BaseException) -> None:
+        fields = {'t': 'error', 'e': type(error).__name__}
+        if isinstance(error, UpstreamBusy):
+            fields['r'] = str(error.retry_after)
+        self._add(fields)
+
+
+class SingleFlight:
+    """合併相同快取鍵的並行請求，只由一個 leader 呼叫上游
+
+    行程內以 _Flight 共用結果；跨行程以 Redis 鎖決定 leader，leader 將
+    片段與最終結果寫入該次呼叫專屬的 Redis Stream，其他行程從頭讀取，
+    因此晚加入的串流 followers 也能拿到完整內容。Redis 無法使用時只做行程內合併。
+    """
+    KEY_PREFIX = 'ai:flight'
+
+    def __init__(self, timeout: Optional[float] = None, lock_ttl: Optional[int] = None):
+        self.timeout = timeout or settings.AI_SINGLE_FLIGHT_TIMEOUT
+        self.lock_ttl = lock_ttl or settings.AI_SINGLE_FLIGHT_LOCK_TTL
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.AI_SINGLE_FLIGHT_ENABLED
+
+    def _lock_key(self, key: str) -> str:
+        return f"{self.KEY_PREFIX}:{key}:lock"
+
+    def _stream_key(self, key: str, token: str) -> str:
+        return f"{self.KEY_PREFIX}:{key}:{token}"
+
+    def _join(self, key: str) -> Tuple[_Flight, bool]:
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            return flight, True
+
+    def _leave(self, key: str, flight: _Flight) -> None:
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def _claim(self, key: str, flight: _Flight) -> Optional[str]:
+        """嘗試取得叢集 leader；成功或 Redis 無法使用時回傳 None，否則回傳目前 leader 的 token"""
+        try:
+            redis = get_redis()
+            for _ in range(2):
+                if redis.set(self._lock_key(key), flight.token, nx=True, ex=self.lock_ttl):
+                    flight.clustered = True
+                    return None
+                owner = redis.get(self._lock_key(key))
+                if owner is not None:
+                    return owner
+        except Exception as e:
+            logger.warning(f"取得合併鎖失敗，改為只在行程內合併: {str(e)}")
+        return None
+
+    def _channel(self, key: str, flight: _Flight) -> Optional[_Channel]:
+        if not flight.clustered:
+            return None
+        return _Channel(self._stream_key(key, flight.token), self.lock_ttl)
+
+    def _release(self, key: str, token: str) -> None:
+        try:
+            get_redis().eval(_RELEASE_SCRIPT, 1, self._lock_key(key), token)
+        except Exception as e:
+            logger.warning(f"釋放合併鎖失敗: {str(e)}")
+
+    def _wait_timeout(self, timeout: Optional[float]) -> float:
+        return self.timeout if timeout is None else min(self.timeout, timeout)
+
+    def _read_remote(self, key: str, owner: str, timeout: Optional[float] = None) -> Iterator[dict]:
+        """從頭讀取其他行程 leader 的結果通道，直到完成、失敗或逾時"""
+        stream = self._stream_key(key, owner)
+        deadline = time.monotonic() + self._wait_timeout(timeout)
+        last_id = '0'
+        redis = get_redis()
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise SingleFlightTimeout()
+            response = redis.xread({stream: last_id}, count=100, block=int(min(remaining, 1) * 1000))
+            for _, entries in response or []:
+                for entry_id, fields in entries:
+                    last_id = entry_id
+                    yield fields
+                    if fields.get('t') in ('done', 'error'):
+                        return
+
+    @staticmethod
+    def _remote_error(fields: dict) -> BaseException:
+        if fields.get('e') == 'UpstreamBusy':
+            return UpstreamBusy(int(fields.get('r', settings.AI_RETRY_AFTER)), 'cluster')
+        return LeaderFailed(fields.get('e', ''))
+
+    def _wait_remote(self, key: str, owner: str, timeout: Optional[float] = None) -> str:
+        chunks = []
+        for fields in self._read_remote(key, owner, timeout):
+            if fields['t'] == 'chunk':
+                chunks.append(fields['d'])
+            elif fields['t'] == 'done':
+                return fields['d']
+            else:
+                raise self._remote_error(fields)
+        return ''.join(chunks)
+
+    async def _await_remote(self, key: str, owner: str, timeout: Optional[float] = None) -> str:
+        """_wait_remote 的非同步版本：每次只做不阻塞的 XREAD，等待期間以 asyncio.sleep 讓出執行緒"""
+        stream = self._stream_key(key, owner)
+        deadline = time.monotonic() + self._wait_timeout(timeout)
+        last_id = '0'
+        chunks = []
+        redis = get_redis()
+        while True:
+            response = await asyncio.to_thread(redis.xread, {stream: last_id}, count=100)
+            for _, entries in response or []:
+                for entry_id, fields in entries:
+                    last_id = entry_id
+                    if fields['t'] == 'chunk':
+                        chunks.append(fields['d'])
+                    elif fields['t'] == 'done':
+                        return fields['d']
+                    else:
+                        raise self._remote_error(fields)
+            if not response:
+                if time.monotonic() >= deadline:
+                    raise SingleFlightTimeout()
+                await asyncio.sleep(REMOTE_POLL_INTERVAL)
+
+    def _finish(self, key: str, flight: _Flight, channel: Optional[_Channel],
+                result: Optional[str] = None, error: Optional[BaseException] = None) -> None:
+        if channel is not None:
+            if error is not None:
+                channel.error(error)
+            else:
+                channel.done(result if result is not None else ''.join(flight.chunks))
+            self._release(key, flight.token)
+        flight.finish(result, error)
+        self._leave(key, flight)
+
+    async def _afinish(self, key: str, flight: _Flight, channel: Optional[_Channel],
+                       result: Optional[str] = None, error: Optional[BaseException] = None) -> None:
+        if channel is None:
+            self._finish(key, flight, None, result, error)
+            return
+        # Redis 寫入在執行緒中進行；shield 讓清理在呼叫端再次被取消時仍會完成
+        await asyncio.shield(asyncio.ensure_future(
+            asyncio.to_thread(self._finish, key, flight, channel, result, error)
+        ))
+
+    def do(self, key: str, fn: Callable[[], str], timeout: Optional[float] = None) -> str:
+        """執行 fn 並與相同 key 的並行請求共用結果；timeout 為 followers 最多等待的秒數"""
+        if not self.enabled:
+            return fn()
+
+        flight, leader = self._join(key)
+        if not leader:
+            REQUESTS.inc(role='follower')
+            return flight.wait(self._wait_timeout(timeout))
+
+        owner = self._claim(key, flight)
+        if owner is not None:
+            REQUESTS.inc(role='remote_follower')
+            try:
+                result = self._wait_remote(key, owner, timeout)
+            except SingleFlightTimeout:
+                logger.warning("等待其他行程的結果逾時，改為自行呼叫上游")
+                result = None
+            except Exception as e:
+                self._finish(key, flight, None, error=e)
+                raise
+            if result is not None:
+                self._finish(key, flight, None, result=result)
+                return result
+
+        REQUESTS.inc(role='leader')
+        channel = self._channel(key, flight)
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key, flight, channel, error=_leader_error(e))
+            raise
+        self._finish(key, flight, channel, result=result)
+        return result
+
+    async def ado(self, key: str, fn, timeout: Optional[float] = None) -> str:
+        """do 的非同步版本，fn 為回傳 awaitable 的函數"""
+        if not self.enabled:
+            return await fn()
+
+        flight, leader = self._join(key)
+        if not leader:
+            REQUESTS.inc(role='follower')
+            return await flight.await_result(self._wait_timeout(timeout))
+
+        # 客戶端斷線時 ASGI 會取消 view；任何離開方式都必須結束 flight，否則之後相同的請求都會等到逾時
+        channel = None
+        try:
+            owner = await asyncio.to_thread(self._claim, key, flight)
+            if owner is not None:
+                REQUESTS.inc(role='remote_follower')
+                try:
+                    result = await self._await_remote(key, owner, timeout)
+                except SingleFlightTimeout:
+                    logger.warning("等待其他行程的結果逾時，改為自行呼叫上游")
+                    result = None
+                if result is not None:
+                    self._finish(key, flight, None, result=result)
+                    return result
+
+            REQUESTS.inc(role='leader')
+            channel = self._channel(key, flight)
+            result = await fn()
+        except BaseException as e:
+            # 在取得 Redis 鎖後才被取消時，同樣釋放鎖並通知其他行程
+            await self._afinish(key, flight, channel or self._channel(key, flight), error=_leader_error(e))
+            raise
+        await self._afinish(key, flight, channel, result=result)
+        return result
+
+    def stream(self, key: str, start: Callable[[], Iterator[str]], timeout: Optional[float] = None) -> Iterator[str]:
+        """串流版本：start 在呼叫時立即執行（以便提早拋出 UpstreamBusy），
+        followers 取得 leader 已產出與後續的所有片段"""
+        if not self.enabled:
+            return start()
+
+        flight, leader = self._join(key)
+        if not leader:
+            REQUESTS.inc(role='follower')
+            return flight.follow(self._wait_timeout(timeout))
+
+        owner = self._claim(key, flight)
+        if owner is not None:
+            REQUESTS.inc(role='remote_follower')
+            return self._relay(key, flight, owner, start, timeout)
+
+        REQUESTS.inc(role='leader')
+        channel = self._channel(key, flight)
+        try:
+            chunks = start()
+        except BaseException as e:
+            self._finish(key, flight, channel, error=_leader_error(e))
+            raise
+        return self._lead(key, flight, channel, chunks)
+
+    def _lead(self, key: str, flight: _Flight, channel: Optional[_Channel], chunks: Iterator[str]) -> Iterator[str]:
+        error = None
+        try:
+            for chunk in chunks:
+                flight.publish(chunk)
+                if channel is not None:
+                    channel.chunk(chunk)
+                yield chunk
+        except BaseException as e:
+            # 客戶端中途斷線（GeneratorExit）時回應不完整，followers 收到 LeaderFailed 而不是部分內容
+            error = _leader_error(e)
+            raise
+        finally:
+            self._finish(key, flight, channel, error=error)
+
+    def _relay(self, key: str, flight: _Flight, owner: str, start: Callable[[], Iterator[str]],
+               timeout: Optional[float] = None) -> Iterator[str]:
+        """讀取其他行程 leader 的串流並轉給本行程的 followers"""
+        try:
+            try:
+                for fields in self._read_remote(key, owner, timeout):
+                    if fields['t'] == 'chunk':
+                        flight.publish(fields['d'])
+                        yield fields['d']
+                    elif fields['t'] == 'done':
+                        if not flight.chunks and fields['d']:
+                            flight.publish(fields['d'])
+                            yield fields['d']
+                    else:
+                        raise self._remote_error(fields)
+            except SingleFlightTimeout:
+                if not flight.chunks:
+                    # leader 沒有任何產出，改由本行程自行呼叫上游
+                    logger.warning("等待其他行程的串流逾時，改為自行呼叫上游")
+                    yield from self._lead(key, flight, None, start())
+        except BaseException as e:
+            if not flight.done:
+                self._finish(key, flight, None, error=_leader_error(e))
+            raise
+        finally:
+            if not flight.done:
+                self._finish(key, flight, None)
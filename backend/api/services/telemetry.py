@@ -0,0 +1,187 @@
+"""
+LLM 呼叫遙測
+
+每次上游呼叫與快取命中都會：
+- 更新本行程的 Prometheus 指標（請求數、token 數、首字延遲與總延遲分佈）
+- 輸出一行 JSON 結構化日誌（含模型路由的層級、原因與估算成本，供調整路由規則）
+- 累加到 Redis 中以小時為單位的用量緩衝，由 flush_llm_usage 任務定期寫入 LLMUsageRollup
+"""
+from typing import Optional
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from . import metrics
+from .redis_client import get_redis
+import datetime
+import json
+import logging
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 60)
+
+REQUESTS = metrics.counter(
+    'ai_llm_requests_total', 'LLM 請求數（cache=hit 表示由快取或預先生成回答提供）',
+    ['chemist', 'model', 'mode', 'cache']
+)
+ERRORS = metrics.counter('ai_llm_errors_total', 'LLM 呼叫失敗次數', ['chemist', 'model', 'mode', 'error'])
+TOKENS = metrics.counter('ai_llm_tokens_total', 'LLM 使用的 token 數', ['chemist', 'model', 'kind'])
+LATENCY = metrics.histogram(
+    'ai_llm_latency_seconds', 'LLM 請求的總延遲（秒）', ['chemist', 'mode', 'cache'], LATENCY_BUCKETS
+)
+TTFB = metrics.histogram('ai_llm_ttfb_seconds', '串流請求的首字延遲（秒）', ['chemist', 'mode'], LATENCY_BUCKETS)
+ROUTE_LATENCY = metrics.histogram(
+    'ai_llm_route_latency_seconds', '依模型路由層級區分的上游延遲（秒）', ['tier', 'model'], LATENCY_BUCKETS
+)
+COST = metrics.counter('ai_llm_cost_usd_total', '依 AI_MODEL_PRICES 估算的 LLM 成本（美元）', ['chemist', 'model'])
+
+KEY_PREFIX = 'ai:usage'
+_FIELDS = ('requests', 'cache_hits', 'errors', 'prompt_tokens', 'completion_tokens',
+           'latency_ms_total', 'ttfb_ms_total', 'ttfb_count')
+
+
+def _period(timestamp: float) -> int:
+    return int(timestamp // 3600 * 3600)
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """依 AI_MODEL_PRICES（每千 token 的輸入、輸出價格）估算成本；未設定價格的模型回傳 None"""
+    prices = settings.AI_MODEL_PRICES.get(model)
+    if not prices:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1000
+
+
+def record(chemist_id: Optional[int], model: str, mode: str, latency: float, cache_hit: bool = False,
+           prompt_tokens: int = 0, completion_tokens: int = 0, ttfb: Optional[float] = None,
+           error: Optional[BaseException] = None, route=None) -> None:
+    """記錄一次 LLM 請求；route 為 ModelRouter 的路由決策，不會拋出例外"""
+    chemist = str(chemist_id or '')
+    cache = 'hit' if cache_hit else 'miss'
+    error_class = type(error).__name__ if error is not None else None
+    try:
+        cost = estimate_cost(model, prompt_tokens, completion_tokens)
+        if cost:
+            COST.inc(cost, chemist=chemist, model=model)
+        if route is not None:
+            ROUTE_LATENCY.observe(ttfb if ttfb is not None else latency, tier=route.tier, model=model)
+        REQUESTS.inc(chemist=chemist, model=model, mode=mode, cache=cache)
+        LATENCY.observe(latency, chemist=chemist, mode=mode, cache=cache)
+        if ttfb is not None:
+            TTFB.observe(ttfb, chemist=chemist, mode=mode)
+        if prompt_tokens:
+            TOKENS.inc(prompt_tokens, chemist=chemist, model=model, kind='prompt')
+        if completion_tokens:
+            TOKENS.inc(completion_tokens, chemist=chemist, model=model, kind='completion')
+        if error_class:
+            ERRORS.inc(chemist=chemist, model=model, mode=mode, error=error_class)
+
+        logger.info("LLM 呼叫統計: " + json.dumps({
+            'chemist_id': chemist_id,
+            'model': model,
+            'mode': mode,
+            'cache': cache,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'ttfb_ms': None if ttfb is None else int(ttfb * 1000),
+            'latency_ms': int(latency * 1000),
+            'error': error_class,
+            'tier': route.tier if route else None,
+            'route_reason': route.reason if route else None,
+            'max_tokens': route.max_tokens if route else None,
+            'cost_usd': None if cost is None else round(cost, 6),
+        }, ensure_ascii=False))
+    except Exception as e:
+        logger.warning(f"記錄 LLM 遙測失敗: {str(e)}")
+        return
+
+    if settings.AI_USAGE_ROLLUP_ENABLED:
+        _buffer(chemist, model, mode, {
+            'requests': 1,
+            'cache_hits': int(cache_hit),
+            'errors': int(error is not None),
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'latency_ms_total': int(latency * 1000),
+            'ttfb_ms_total': 0 if ttfb is None else int(ttfb * 1000),
+            'ttfb_count': int(ttfb is not None),
+        })
+
+
+def _buffer(chemist: str, model: str, mode: str, counts: dict) -> None:
+    """以 HINCRBY 累加到當前小時的緩衝；欄位為「化學家|模型|類型|指標」"""
+    key = f"{KEY_PREFIX}:{_period(time.time())}"
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for field, amount in counts.items():
+            if amount:
+                pipe.hincrby(key, f"{chemist}|{model}|{mode}|{field}", amount)
+        # 緩衝最多保留兩天，flush 任務停擺時不會無限累積
+        pipe.expire(key, 2 * 24 * 3600)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"累加 LLM 用量失敗: {str(e)}")
+
+
+def flush_usage() -> int:
+    """將 Redis 中的用量緩衝寫入 LLMUsageRollup，回傳寫入的列數
+
+    緩衝先改名為處理中的鍵再讀取，避免與仍在累加的請求互相干擾；
+    寫入資料庫失敗時保留處理中的鍵，下次重新寫入。
+    """
+    redis = get_redis()
+    for key in redis.scan_iter(match=f"{KEY_PREFIX}:[0-9]*", count=100):
+        try:
+            redis.rename(key, f"{KEY_PREFIX}:flushing:{key.rsplit(':', 1)[1]}:{uuid.uuid4().hex}")
+        except Exception as e:
+            logger.warning(f"取得用量緩衝失敗: {key}: {str(e)}")
+
+    written = 0
+    for key in redis.scan_iter(match=f"{KEY_PREFIX}:flushing:*", count=100):
+        period = int(key.split(':')[3])
+        rows = {}
+        for field, value in redis.hgetall(key).items():
+            chemist, model, mode, name = field.rsplit('|', 3)
+            rows.setdefault((chemist, model, mode), dict.fromkeys(_FIELDS, 0))[name] += int(value)
+        with transaction.atomic():
+            for (chemist, model, mode), counts in rows.items():
+                _upsert(period, int(chemist) if chemist else None, model, mode, counts)
+        redis.delete(key)
+        written += len(rows)
+    return written
+
+
+def _upsert(period: int, chemist_id: Optional[int], model: str, mode: str, counts: dict) -> None:
+    from ..models import Chemist, LLMUsageRollup
+    period_start = datetime.datetime.fromtimestamp(period, tz=datetime.timezone.utc)
+    if chemist_id is not None and not Chemist.objects.filter(pk=chemist_id).exists():
+        chemist_id = None
+    lookup = {'period_start': period_start, 'chemist_id': chemist_id, 'model': model, 'mode': mode}
+    increments = {field: F(field) + amount for field, amount in counts.items() if amount}
+    if LLMUsageRollup.objects.filter(**lookup).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            LLMUsageRollup.objects.create(**lookup, **counts)
+    except IntegrityError:
+        # 另一個 flush 同時建立了同一列
+        LLMUsageRollup.objects.filter(**lookup).update(**increments)
+
+
+def unassign_chemist(chemist_id: int) -> int:
+    """化學家刪除前，將其用量彙總併入 chemist 為 NULL 的列，回傳合併的列數
+
+    唯一約束將 NULL 視為相同的值，直接 SET NULL 會與同一時段既有的列衝突。
+    """
+    from ..models import LLMUsageRollup
+    with transaction.atomic():
+        rows = list(LLMUsageRollup.objects.select_for_update().filter(chemist_id=chemist_id))
+        if not rows:
+            return 0
+        LLMUsageRollup.objects.filter(pk__in=[row.pk for row in rows]).delete()
+        for row in rows:
+            counts = {field: getattr(row, field) for field in _FIELDS}
+            _upsert(int(row.period_start.timestamp()), None, row.model, row.mode, counts)
+    return len(rows)
@@ -0,0 +1,141 @@
+"""
+時間軸
+
+回傳年份區間內在世的化學家與發生的歷史事件，依年代（十年）分組：
+- 化學家的生卒年在資料庫中是 int4range 生成欄位 lifespan，以 GiST 索引查詢與區間重疊（&&）的資料列
+- 事件以 (year, id) 索引做範圍查詢
+
+時間軸滑桿會送出大量只差幾年的區間，因此快取的單位是年代而不是區間：
+每個年代的事件與在世化學家各自快取，請求只查詢尚未快取的年代，再依實際區間裁切。
+化學家或事件寫入時更換版本號（invalidate），舊版本的快取不再被讀取，隨 TTL 過期。
+"""
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.core.cache import cache
+from django.db.backends.postgresql.psycopg_any import NumericRange
+from ..models import Chemist, HistoricalEvent
+from ..serializers import TimelineChemistSerializer, TimelineEventSerializer
+from . import metrics
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'timeline:version'
+DECADES = metrics.counter('timeline_decades_total', '時間軸查詢的年代數', ['result'])
+
+
+def decade_of(year: int) -> int:
+    """1789 -> 1780；西元前的年份同樣向下取整，-5 -> -10"""
+    return year // 10 * 10
+
+
+def _death_year(chemist: dict) -> Optional[int]:
+    # 與 lifespan 相同：卒年早於生年視為未知
+    death_year = chemist['death_year']
+    return death_year if death_year is not None and death_year >= chemist['birth_year'] else None
+
+
+def _alive(chemist: dict, start: int, end: int) -> bool:
+    death_year = _death_year(chemist)
+    return chemist['birth_year'] <= end and (death_year is None or death_year >= start)
+
+
+def version() -> str:
+    """目前的快取版本；不設 TTL，Redis 的 volatile-lru 不會淘汰"""
+    try:
+        current = cache.get(VERSION_KEY)
+        if current is None:
+            cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+            current = cache.get(VERSION_KEY)
+        return current or 'none'
+    except Exception as e:
+        logger.warning(f"讀取時間軸快取版本失敗: {str(e)}")
+        return 'none'
+
+
+def invalidate() -> None:
+    try:
+        cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+    except Exception as e:
+        logger.warning(f"更新時間軸快取版本失敗: {str(e)}")
+
+
+def _key(current: str, decade: int) -> str:
+    return f'timeline:{current}:{decade}'
+
+
+def load_decades(first: int, last: int) -> Dict[int, dict]:
+    """由資料庫組出 first 到 last 年代（含）的內容：{年代: {'events': [...], 'chemists': [...]}}"""
+    end = last + 9
+    buckets = {decade: {'events': [], 'chemists': []} for decade in range(first, last + 10, 10)}
+
+    events = (
+        HistoricalEvent.objects
+        .filter(year__range=(first, end), chemist__deleted_at__isnull=True)
+        .only(*TimelineEventSerializer.Meta.fields)
+        .order_by('year', 'id')
+    )
+    for event in TimelineEventSerializer(events, many=True).data:
+        buckets[decade_of(event['year'])]['events'].append(event)
+
+    chemists = (
+        Chemist.objects
+        .filter(lifespan__overlap=NumericRange(first, end, '[]'), deleted_at__isnull=True)
+        .only(*TimelineChemistSerializer.Meta.fields)
+        .order_by('birth_year', 'id')
+    )
+    for chemist in TimelineChemistSerializer(chemists, many=True).data:
+        death_year = _death_year(chemist)
+        since = max(first, decade_of(chemist['birth_year']))
+        until = last if death_year is None else min(last, decade_of(death_year))
+        for decade in range(since, until + 10, 10):
+            buckets[decade]['chemists'].append(chemist)
+    return buckets
+
+
+def _decades(first: int, last: int) -> Dict[int, dict]:
+    """先讀快取，缺少的年代以一次查詢載入後寫回快取"""
+    current = version()
+    keys = {decade: _key(current, decade) for decade in range(first, last + 10, 10)}
+    try:
+        cached = cache.get_many(list(keys.values()))
+    except Exception as e:
+        logger.warning(f"讀取時間軸快取失敗: {str(e)}")
+        cached = {}
+
+    buckets = {decade: cached[key] for decade, key in keys.items() if key in cached}
+    missing = [decade for decade in keys if decade not in buckets]
+    DECADES.inc(len(buckets), result='hit')
+    if missing:
+        DECADES.inc(len(missing), result='miss')
+        loaded = load_decades(missing[0], missing[-1])
+        buckets.update({decade: loaded[decade] for decade in missing})
+        try:
+            cache.set_many({keys[decade]: loaded[decade] for decade in missing}, timeout=settings.TIMELINE_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"寫入時間軸快取失敗: {str(e)}")
+    return buckets
+
+
+def timeline(start: int, end: int) -> dict:
+    """start 到 end 年（含）的時間軸；化學家只列一次，各年代以 chemist_ids 引用"""
+    buckets = _decades(decade_of(start), decade_of(end))
+    chemists: Dict[int, dict] = {}
+    decades: List[dict] = []
+    for decade in sorted(buckets):
+        low, high = max(start, decade), min(end, decade + 9)
+        events = [event for event in buckets[decade]['events'] if low <= event['year'] <= high]
+        chemist_ids = []
+        for chemist in buckets[decade]['chemists']:
+            if _alive(chemist, low, high):
+                chemists.setdefault(chemist['id'], chemist)
+                chemist_ids.append(chemist['id'])
+        if events or chemist_ids:
+            decades.append({'decade': decade, 'events': events, 'chemist_ids': chemist_ids})
+    return {
+        'from': start,
+        'to': end,
+        'chemists': sorted(chemists.values(), key=lambda chemist: (chemist['birth_year'], chemist['id'])),
+        'decades': decades,
+    }
@@ -0,0 +1,59 @@
+"""
+本地近似 token 計數
+
+安裝 tiktoken 時使用實際的編碼器，否則以字元類型估算：
+中日韓文字約一字一 token，其餘字元約四字一 token。
+"""
+from functools import lru_cache
+import math
+import re
+
+_CJK_RE = re.compile(r'[　-〿㐀-䶿一-鿿豈-﫿＀-￯]')
+
+# 每則訊息在 chat 格式中的額外 token（角色、分隔符號）
+MESSAGE_OVERHEAD = 4
+
+
+@lru_cache(maxsize=1)
+def _encoder():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding('cl100k_base')
+    except Exception:
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文字的 token 數"""
+    if not text:
+        return 0
+    encoder = _encoder()
+    if encoder is not None:
+        return len(encoder.encode(text))
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def estimate_message_tokens(message: dict) -> int:
+    return MESSAGE_OVERHEAD + estimate_tokens(message.get('content', ''))
+
+
+def estimate_messages_tokens(messages: list) -> int:
+    """估算整個訊息列表的 token 數（含回覆起始的 3 個 token）"""
+    return sum(estimate_message_tokens(message) for message in messages) + 3
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """保留開頭，截斷到不超過 max_tokens 的長度"""
+    if max_tokens <= 0:
+        return ''
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from .models import Chemist, HistoricalEvent
+from .services import telemetry, timeline
+from .services.persona_registry import persona_registry
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Chemist)
+@receiver(post_delete, sender=Chemist)
+def invalidate_persona(sender, instance, **kwargs):
+    """化學家資料變更時，通知所有工作行程清除舊的人設提示詞"""
+    persona_registry.invalidate(instance.id)
+
+
+@receiver(post_save, sender=Chemist)
+def regenerate_precomputed_answers(sender, instance, raw=False, **kwargs):
+    """人設版本變更後，於交易提交時排程重新生成常見問題的回答"""
+    if raw or not (settings.AI_PRECOMPUTE_ENABLED and settings.AI_PRECOMPUTE_ON_SAVE):
+        return
+
+    def schedule():
+        from .tasks import precompute_answers
+        try:
+            precompute_answers.delay(instance.id)
+        except Exception as e:
+            logger.warning(f"排程預先生成回答失敗，化學家 ID: {instance.id}，錯誤: {str(e)}")
+
+    transaction.on_commit(schedule)
+
+
+@receiver(post_save, sender=Chemist)
+@receiver(post_delete, sender=Chemist)
+@receiver(post_save, sender=HistoricalEvent)
+@receiver(post_delete, sender=HistoricalEvent)
+def invalidate_timeline(sender, instance, **kwargs):
+    """化學家或事件變更後，於交易提交時更換時間軸快取版本"""
+    transaction.on_commit(timeline.invalidate)
+
+
+@receiver(pre_delete, sender=Chemist)
+def unassign_llm_usage(sender, instance, **kwargs):
+    """用量彙總在 SET NULL 之前先併入不分化學家的列，避免違反唯一約束"""
+    telemetry.unassign_chemist(instance.id)
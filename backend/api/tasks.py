@@ -0,0 +1,178 @@
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.db.models import Q
+from .models import Chemist, ChatHistory, ChatSummary, Conversation
+from .services.ai_service import AIService
+from .services.bulk_delete import BatchDeleter
+from .services.chat_buffer import get_chat_write_buffer
+from .services.concurrency import UpstreamBusy
+from .services import chat_partitions, conversations, telemetry
+from .services.precomputed import precomputed_answers
+from .services.tokens import estimate_tokens
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, max_retries=5)
+def generate_chemist_reply(self, chemist_id: int, message: str, conversation_id: str) -> dict:
+    """在 Celery worker 中生成化學家回應並寫入對話的聊天記錄"""
+    logger.info(f"開始背景生成回應，任務 ID: {self.request.id}，化學家 ID: {chemist_id}，對話: {conversation_id}")
+    conversation = Conversation.objects.select_related('chemist').get(pk=conversation_id, chemist_id=chemist_id)
+    chemist = conversation.chemist
+
+    try:
+        ai_response = AIService().generate_response(chemist, message, conversation=conversation)
+    except UpstreamBusy as e:
+        # 上游名額已滿時稍後重試，而不是佔住 worker 等待
+        raise self.retry(exc=e, countdown=e.retry_after)
+
+    assistant_message = conversations.add_message(conversation, 'assistant', ai_response)
+
+    return {
+        'conversation_id': str(conversation.pk),
+        'assistant_message': {
+            'id': assistant_message.id,
+            'message_uuid': str(assistant_message.message_uuid),
+            'role': 'assistant',
+            'content': ai_response,
+            'timestamp': int(assistant_message.timestamp.timestamp() * 1000)
+        }
+    }
+
+
+@shared_task(bind=True, max_retries=3)
+def update_chat_summary(self, conversation_id: str) -> dict:
+    """將對話中超出上下文預算的舊訊息增量併入滾動摘要"""
+    try:
+        conversation = Conversation.objects.select_related('chemist').get(pk=conversation_id)
+    except Conversation.DoesNotExist:
+        # 對話已被清除
+        cache.delete(f"ai:summary:pending:{conversation_id}")
+        return {'summarized': 0, 'last_message_id': 0}
+    chemist = conversation.chemist
+    service = AIService()
+    summary, _ = ChatSummary.objects.get_or_create(conversation=conversation)
+
+    # 目前上下文視窗之前、尚未併入摘要的訊息
+    window = service.context_builder.build(conversation)
+    # 與上下文視窗相同，以 (timestamp, id) 排序；write-behind 寫入時 id 不一定依時間遞增
+    turns = ChatHistory.objects.filter(conversation=conversation)
+    if summary.last_message_timestamp is not None:
+        since, since_id = summary.last_message_timestamp, summary.last_message_id
+        turns = turns.filter(Q(timestamp__gt=since) | Q(timestamp=since, id__gt=since_id))
+    if window.oldest is not None:
+        until, until_id = window.oldest
+        turns = turns.filter(Q(timestamp__lt=until) | Q(timestamp=until, id__lt=until_id))
+    turns = list(turns.order_by('timestamp', 'id').values(
+        'id', 'role', 'content', 'timestamp'
+    )[:settings.AI_SUMMARY_BATCH_SIZE])
+
+    if not turns:
+        cache.delete(f"ai:summary:pending:{conversation_id}")
+        return {'summarized': 0, 'last_message_id': summary.last_message_id}
+
+    try:
+        content = service.summarize(chemist, summary.content, turns)
+    except UpstreamBusy as e:
+        raise self.retry(exc=e, countdown=e.retry_after)
+    except Exception as e:
+        logger.error(f"更新對話摘要失敗，對話: {conversation_id}，錯誤: {str(e)}")
+        raise self.retry(exc=e, countdown=30)
+
+    summary.content = content
+    summary.last_message_id = turns[-1]['id']
+    summary.last_message_timestamp = turns[-1]['timestamp']
+    summary.tokens = estimate_tokens(content)
+    summary.save(update_fields=['content', 'last_message_id', 'last_message_timestamp', 'tokens', 'updated_at'])
+    logger.info(f"已更新對話摘要，對話: {conversation_id}，併入 {len(turns)} 則，摘要 {summary.tokens} tokens")
+
+    if len(turns) >= settings.AI_SUMMARY_BATCH_SIZE:
+        # 還有更多舊訊息，接著處理下一批
+        update_chat_summary.delay(conversation_id)
+    else:
+        cache.delete(f"ai:summary:pending:{conversation_id}")
+
+    return {'summarized': len(turns), 'last_message_id': summary.last_message_id}
+
+
+@shared_task(bind=True, max_retries=3)
+def precompute_answers(self, chemist_id: int, force: bool = False) -> dict:
+    """為化學家目前的人設版本生成常見問題的回答"""
+    try:
+        chemist = Chemist.objects.get(pk=chemist_id)
+    except Chemist.DoesNotExist:
+        return {'generated': 0, 'skipped': 0, 'failed': 0}
+
+    result = precomputed_answers.generate(chemist, AIService(), force=force)
+    if result['failed']:
+        # 已完成的題目會被略過，重試時只補生成失敗的部分
+        raise self.retry(countdown=60)
+    return result
+
+
+@shared_task(ignore_result=True)
+def flush_llm_usage() -> int:
+    """將 Redis 中累加的 LLM 用量寫入每小時彙總表（由 celery beat 定期執行）"""
+    written = telemetry.flush_usage()
+    if written:
+        logger.info(f"已寫入 {written} 筆 LLM 用量彙總")
+    return written
+
+
+@shared_task(ignore_result=True)
+def flush_chat_writes() -> int:
+    """將 write-behind 緩衝中的聊天訊息批次寫入資料庫（由 celery beat 定期執行）"""
+    buffer = get_chat_write_buffer()
+    if not buffer.enabled:
+        return 0
+    written = buffer.flush()
+    if written:
+        logger.info(f"已寫入 {written} 則緩衝的聊天訊息")
+    return written
+
+
+@shared_task(ignore_result=True)
+def maintain_chat_partitions() -> dict:
+    """預先建立聊天記錄的月分割，並封存、移除超過保留期限的分割（由 celery beat 每日執行）"""
+    created = chat_partitions.ensure_partitions()
+    expired = chat_partitions.expire_partitions()
+    if expired:
+        logger.info(f"已移除 {len(expired)} 個過期的聊天記錄分割: {[result['partition'] for result in expired]}")
+    return {'created': created, 'expired': expired}
+
+
+def _purge(task, queryset, target: dict) -> dict:
+    """分批刪除並以 update_state 回報進度；刪除期間有新資料寫入而違反外鍵時稍後重試"""
+
+    def report(deleted):
+        # 同步執行（CELERY_TASK_ALWAYS_EAGER）時沒有結果後端可回報
+        if not task.request.is_eager:
+            task.update_state(state='PROGRESS', meta={**target, 'deleted': deleted})
+
+    try:
+        deleted = BatchDeleter(on_progress=report).purge(queryset)
+    except IntegrityError as e:
+        raise task.retry(exc=e, countdown=5)
+    return {**target, 'deleted': deleted}
+
+
+@shared_task(bind=True, max_retries=5)
+def delete_conversation(self, conversation_id: str) -> dict:
+    """分批刪除對話與其聊天記錄、摘要"""
+    result = _purge(self, Conversation.objects.filter(pk=conversation_id), {'conversation_id': conversation_id})
+    cache.delete(f"ai:summary:pending:{conversation_id}")
+    logger.info(f"已刪除對話 {conversation_id}: {result['deleted']}")
+    return result
+
+
+@shared_task(bind=True, max_retries=5)
+def delete_chemist(self, chemist_id: int) -> dict:
+    """分批刪除化學家與其事件、對話、聊天記錄與回饋"""
+    # BatchDeleter 在刪除化學家本身（送出 pre_delete）之前就會 SET NULL，用量彙總須先合併
+    telemetry.unassign_chemist(chemist_id)
+    result = _purge(self, Chemist.objects.filter(pk=chemist_id), {'chemist_id': chemist_id})
+    logger.info(f"已刪除化學家 {chemist_id}: {result['deleted']}")
+    return result
@@ -4,6 +4,12 @@ from .views.era import EraViewSet
 from .views.chemist import ChemistViewSet
 from .views.event import HistoricalEventViewSet
 from .views.feedback import UserFeedbackViewSet
+from .views.async_chat import send_message_async
+from .views.chat_job import ChatJobViewSet
+from .views.panel import PanelViewSet
+from .views.search import SearchView
+from .views.timeline import TimelineView
+from .views.ai_status import AICacheStatsView, AICircuitStatusView, ReadinessView, prometheus_metrics
 from django.http import HttpResponse
 
 def health_check(request):
@@ -14,8 +20,17 @@ router.register(r'era', EraViewSet, basename='era')
 router.register(r'scientist', ChemistViewSet, basename='scientist')
 router.register(r'event', HistoricalEventViewSet, basename='event')
 router.register(r'feedback', UserFeedbackViewSet)
+router.register(r'chat-jobs', ChatJobViewSet, basename='chat-job')
+router.register(r'panel', PanelViewSet, basename='panel')
 
 urlpatterns = [
     path('health/', health_check, name='health_check'),
+    path('health/ready/', ReadinessView.as_view(), name='health_ready'),
+    path('metrics/', prometheus_metrics, name='metrics'),
+    path('ai/cache-stats/', AICacheStatsView.as_view(), name='ai-cache-stats'),
+    path('ai/breaker/', AICircuitStatusView.as_view(), name='ai-breaker'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('timeline/', TimelineView.as_view(), name='timeline'),
+    path('scientist/<int:pk>/send_message_async/', send_message_async, name='scientist-send-message-async'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -0,0 +1,66 @@
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from django.http import HttpResponse
+from ..services import metrics
+from ..services.ai_service import AIService
+from ..services.response_cache import ResponseCache
+
+
+class AICacheStatsView(APIView):
+    """AI 回應快取命中統計"""
+
+    def get(self, request):
+        try:
+            chemist_id = request.query_params.get('chemist')
+            return Response({
+                'status': 'success',
+                'data': ResponseCache().stats(int(chemist_id) if chemist_id else None),
+                'message': '成功獲取快取統計'
+            })
+        except Exception as e:
+            return Response({
+                'status': 'error',
+                'message': f'獲取快取統計失敗: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AICircuitStatusView(APIView):
+    """上游斷路器狀態（所有工作行程共用）"""
+
+    def get(self, request):
+        try:
+            return Response({
+                'status': 'success',
+                'data': AIService().breaker.status(),
+                'message': '成功獲取斷路器狀態'
+            })
+        except Exception as e:
+            return Response({
+                'status': 'error',
+                'message': f'獲取斷路器狀態失敗: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class ReadinessView(APIView):
+    """就緒檢查：回傳快取的 OpenAI 連線狀態，不在請求中等待外部連線"""
+
+    def get(self, request):
+        ai_service = AIService()
+        ai_status = ai_service.connection_status()
+        breaker_state = ai_service.breaker.status()['state']
+        return Response({
+            'status': 'success',
+            'data': {
+                'ready': True,
+                'ai': ai_status,
+                'breaker': breaker_state,
+                'degraded': ai_status['ok'] is False or breaker_state != 'closed',
+            },
+            'message': 'AI 服務連線正常' if ai_status['ok'] else 'AI 服務連線狀態未確認或異常'
+        })
+
+
+def prometheus_metrics(request):
+    """以 Prometheus 文字格式輸出本行程的指標"""
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
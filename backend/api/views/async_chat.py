@@ -0,0 +1,102 @@
+import json
+import logging
+import traceback
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from ..models import Chemist
+from ..services import conversations
+from ..services.ai_service import AIService
+from ..services.concurrency import UpstreamBusy
+from ..services.conversations import ConversationNotFound
+from ..services.deadline import Deadline
+
+logger = logging.getLogger(__name__)
+
+
+def _json_response(data: dict, status: int = 200) -> JsonResponse:
+    return JsonResponse(data, status=status, json_dumps_params={'ensure_ascii': False})
+
+
+@csrf_exempt
+@require_POST
+async def send_message_async(request, pk):
+    """非同步聊天端點，在 ASGI 下等待 OpenAI 時不佔用工作執行緒"""
+    try:
+        try:
+            payload = json.loads(request.body or b'{}')
+        except json.JSONDecodeError:
+            payload = None
+        if not isinstance(payload, dict):
+            return _json_response({
+                'status': 'error',
+                'message': '請求格式錯誤'
+            }, status=400)
+
+        message = payload.get('message')
+        if not message:
+            return _json_response({
+                'status': 'error',
+                'message': '訊息不能為空'
+            }, status=400)
+
+        try:
+            chemist = await Chemist.objects.aget(pk=pk, deleted_at__isnull=True)
+        except Chemist.DoesNotExist:
+            return _json_response({
+                'status': 'error',
+                'message': '找不到指定的化學家'
+            }, status=404)
+
+        # session 與登入使用者只能以同步方式存取
+        try:
+            conversation = await sync_to_async(conversations.resolve)(
+                request, chemist, conversations.requested_conversation_id(request, payload)
+            )
+        except ConversationNotFound as e:
+            return _json_response({
+                'status': 'error',
+                'message': str(e)
+            }, status=404)
+
+        # 生成 AI 回應；用戶訊息在取得上游名額後才寫入，名額不足回傳 429 時不留下重複的用戶訊息
+        received_at = timezone.now()
+        ai_response = await AIService().agenerate_response(
+            chemist, message, Deadline.from_request(request), conversation=conversation
+        )
+
+        # 創建用戶訊息記錄
+        await conversations.aadd_message(conversation, 'user', message, timestamp=received_at)
+
+        # 創建 AI 回應記錄
+        await conversations.aadd_message(conversation, 'assistant', ai_response)
+
+        return _json_response({
+            'status': 'success',
+            'data': {
+                'conversation_id': str(conversation.pk),
+                'assistant_message': {
+                    'role': 'assistant',
+                    'content': ai_response,
+                    'timestamp': int(timezone.now().timestamp() * 1000)
+                }
+            },
+            'message': '訊息發送成功'
+        })
+
+    except UpstreamBusy as e:
+        response = _json_response({
+            'status': 'error',
+            'message': str(e)
+        }, status=429)
+        response['Retry-After'] = str(e.retry_after)
+        return response
+    except Exception as e:
+        logger.error(f"非同步發送訊息失敗: {str(e)}")
+        logger.error(f"錯誤詳情: {traceback.format_exc()}")
+        return _json_response({
+            'status': 'error',
+            'message': f'發送訊息失敗: {str(e)}'
+        }, status=500)
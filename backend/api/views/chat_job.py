@@ -0,0 +1,74 @@
+from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer
+from rest_framework.response import Response
+from celery.result import AsyncResult
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from ..renderers import EventStreamRenderer, format_sse
+import time
+
+
+def serialize_job(result: AsyncResult) -> dict:
+    """將 Celery 任務狀態轉換為 API 回應格式"""
+    data = {
+        'job_id': result.id,
+        'state': result.state,
+        'ready': result.ready(),
+        'result': None,
+        'error': None,
+    }
+    if result.successful():
+        data['result'] = result.result
+    elif result.failed():
+        data['error'] = str(result.result)
+    elif isinstance(result.info, dict):
+        # 執行中的任務可透過 update_state 回報進度
+        data['progress'] = result.info
+    return data
+
+
+class ChatJobViewSet(viewsets.ViewSet):
+    """背景聊天任務狀態 API"""
+
+    def retrieve(self, request, pk=None):
+        try:
+            return Response({
+                'status': 'success',
+                'data': serialize_job(AsyncResult(pk)),
+                'message': '成功獲取任務狀態'
+            })
+        except Exception as e:
+            return Response({
+                'status': 'error',
+                'message': f'獲取任務狀態失敗: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=True, methods=['get'],
+            renderer_classes=[JSONRenderer, BrowsableAPIRenderer, EventStreamRenderer])
+    def events(self, request, pk=None):
+        """以 SSE 訂閱任務狀態，任務完成或逾時後結束串流"""
+        interval = settings.CHAT_JOB_POLL_INTERVAL
+        timeout = settings.CHAT_JOB_STREAM_TIMEOUT
+
+        def event_stream():
+            result = AsyncResult(pk)
+            deadline = time.monotonic() + timeout
+            last_state = None
+            while True:
+                data = serialize_job(result)
+                if data['state'] != last_state or 'progress' in data:
+                    last_state = data['state']
+                    yield format_sse('state', data)
+                if data['ready']:
+                    yield format_sse('done', data)
+                    return
+                if time.monotonic() >= deadline:
+                    yield format_sse('timeout', {'job_id': pk})
+                    return
+                time.sleep(interval)
+
+        response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
@@ -1,12 +1,25 @@
 from rest_framework import viewsets, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer
 from django_filters import rest_framework as filters
+from django.conf import settings
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django.utils import timezone
-from ..models import Chemist, ChatHistory
-from ..serializers import ChemistSerializer, ChatHistorySerializer
+from ..models import Chemist, ChatHistory, Conversation, HistoricalEvent
+from ..renderers import EventStreamRenderer, format_sse
+from ..serializers import ChemistListSerializer, ChemistSerializer, ChatHistorySerializer, ConversationSerializer
+from ..services import conversations, timeline
 from ..services.ai_service import AIService
+from ..services.chat_buffer import get_chat_write_buffer, merge_pending
+from ..services.concurrency import UpstreamBusy
+from ..services.conversations import ConversationNotFound
+from ..services.deadline import Deadline
+from ..tasks import delete_chemist, delete_conversation, generate_chemist_reply
 import time
 
 class ChemistFilter(filters.FilterSet):
@@ -21,17 +34,61 @@ class ChemistViewSet(viewsets.ModelViewSet):
     serializer_class = ChemistSerializer
     filterset_class = ChemistFilter
     filter_backends = (filters.DjangoFilterBackend,)
-    ai_service = AIService()
+    keyset_ordering = ('id',)
+
+    @property
+    def ai_service(self):
+        return AIService()
+
+    def get_queryset(self):
+        # 排入背景刪除的化學家立即從 API 中消失
+        queryset = Chemist.objects.filter(deleted_at__isnull=True)
+        if self.action == 'list':
+            # 兩次查詢：化學家的列表欄位與所有事件摘要
+            return queryset.only(*ChemistListSerializer.LOAD_FIELDS).prefetch_related(Prefetch(
+                'events',
+                queryset=HistoricalEvent.objects.only('id', 'chemist_id', 'title', 'year', 'event_type')
+            ))
+        if self.action == 'retrieve':
+            return queryset.prefetch_related('events')
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ChemistListSerializer
+        return ChemistSerializer
+
+    def _prefetch_recent_history(self, chemist) -> None:
+        """只載入目前對話最近 CHEMIST_DETAIL_HISTORY 則訊息"""
+        conversation = conversations.resolve(
+            self.request, chemist, conversations.requested_conversation_id(self.request), create=False
+        )
+        if conversation is None:
+            chemist.recent_chat_history = []
+            return
+        prefetch_related_objects([chemist], Prefetch(
+            'chat_history',
+            queryset=ChatHistory.objects.filter(conversation=conversation).only(
+                'id', 'chemist_id', 'message_uuid', 'role', 'content', 'timestamp'
+            ).order_by('-timestamp', '-id')[:settings.CHEMIST_DETAIL_HISTORY],
+            to_attr='recent_chat_history'
+        ))
+        chemist.recent_chat_history = merge_pending(
+            chemist.recent_chat_history, get_chat_write_buffer().pending(conversation.pk),
+            settings.CHEMIST_DETAIL_HISTORY
+        )
 
     def list(self, request, *args, **kwargs):
         try:
             queryset = self.filter_queryset(self.get_queryset())
-            serializer = self.get_serializer(queryset, many=True)
+            page = self.paginate_queryset(queryset)
+            serializer = self.get_serializer(page, many=True)
+            return self.paginator.get_paginated_response(serializer.data, '成功獲取化學家列表')
+        except ValidationError as e:
             return Response({
-                'status': 'success',
-                'data': serializer.data,
-                'message': '成功獲取化學家列表'
-            })
+                'status': 'error',
+                'message': f'分頁參數錯誤: {e.detail}'
+            }, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({
                 'status': 'error',
@@ -41,19 +98,48 @@ class ChemistViewSet(viewsets.ModelViewSet):
     def retrieve(self, request, *args, **kwargs):
         try:
             instance = self.get_object()
+            self._prefetch_recent_history(instance)
             serializer = self.get_serializer(instance)
             return Response({
                 'status': 'success',
                 'data': serializer.data,
                 'message': '成功獲取化學家詳情'
             })
+        except ConversationNotFound as e:
+            return Response({
+                'status': 'error',
+                'message': str(e)
+            }, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response({
                 'status': 'error',
                 'message': f'獲取化學家詳情失敗: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    @action(detail=True, methods=['post'])
+    def destroy(self, request, *args, **kwargs):
+        """標記化學家為刪除中，由背景任務分批刪除其事件、對話與聊天記錄"""
+        instance = self.get_object()
+        Chemist.objects.filter(pk=instance.pk).update(deleted_at=timezone.now())
+        # update() 不會送出 post_save，時間軸快取需自行失效
+        timeline.invalidate()
+        job = delete_chemist.delay(instance.pk)
+        return Response({
+            'status': 'success',
+            'data': self._job_links(request, job, chemist_id=instance.pk),
+            'message': '化學家刪除中'
+        }, status=status.HTTP_202_ACCEPTED)
+
+    @staticmethod
+    def _job_links(request, job, **data) -> dict:
+        return {
+            **data,
+            'job_id': job.id,
+            'status_url': request.build_absolute_uri(reverse('chat-job-detail', args=[job.id])),
+            'events_url': request.build_absolute_uri(reverse('chat-job-events', args=[job.id])),
+        }
+
+    @action(detail=True, methods=['post'],
+            renderer_classes=[JSONRenderer, BrowsableAPIRenderer, EventStreamRenderer])
     def send_message(self, request, pk=None):
         try:
             print(f"開始處理發送訊息請求，化學家 ID: {pk}")
@@ -66,31 +152,43 @@ class ChemistViewSet(viewsets.ModelViewSet):
                     'message': '訊息不能為空'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            print(f"創建用戶訊息記錄: {message}")
-            # 創建用戶訊息記錄
-            user_message = ChatHistory.objects.create(
-                chemist=chemist,
-                role='user',
-                content=message,
-                timestamp=timezone.now()
-            )
-            
+            conversation = conversations.resolve(request, chemist, conversations.requested_conversation_id(request))
+
+            # 用戶訊息在取得上游名額後才寫入（時間仍以收到訊息的時間為準），
+            # 名額不足回傳 429 時客戶端重送不會留下重複的用戶訊息
+            received_at = timezone.now()
+
+            if request.query_params.get('stream') in ('1', 'true'):
+                return self._stream_message(chemist, conversation, message, Deadline.from_request(request), received_at)
+
+            if request.query_params.get('mode') == 'async':
+                conversations.add_message(conversation, 'user', message, timestamp=received_at)
+                # 交由 Celery worker 生成回應，立即回傳任務 ID
+                job = generate_chemist_reply.delay(chemist.id, message, str(conversation.pk))
+                return Response({
+                    'status': 'success',
+                    'data': self._job_links(request, job, conversation_id=str(conversation.pk)),
+                    'message': '訊息已排入處理佇列'
+                }, status=status.HTTP_202_ACCEPTED)
+
             print("生成 AI 回應...")
             # 生成 AI 回應
-            ai_response = self.ai_service.generate_response(chemist, message)
+            ai_response = self.ai_service.generate_response(
+                chemist, message, deadline=Deadline.from_request(request), conversation=conversation
+            )
             
+            print(f"創建用戶訊息記錄: {message}")
+            # 創建用戶訊息記錄
+            conversations.add_message(conversation, 'user', message, timestamp=received_at)
+
             print(f"創建 AI 回應記錄: {ai_response}")
             # 創建 AI 回應記錄
-            assistant_message = ChatHistory.objects.create(
-                chemist=chemist,
-                role='assistant',
-                content=ai_response,
-                timestamp=timezone.now()
-            )
+            assistant_message = conversations.add_message(conversation, 'assistant', ai_response)
             
             return Response({
                 'status': 'success',
                 'data': {
+                    'conversation_id': str(conversation.pk),
                     'assistant_message': {
                         'role': 'assistant',
                         'content': ai_response,
@@ -100,6 +198,16 @@ class ChemistViewSet(viewsets.ModelViewSet):
                 'message': '訊息發送成功'
             })
             
+        except ConversationNotFound as e:
+            return Response({
+                'status': 'error',
+                'message': str(e)
+            }, status=status.HTTP_404_NOT_FOUND)
+        except UpstreamBusy as e:
+            return Response({
+                'status': 'error',
+                'message': str(e)
+            }, status=status.HTTP_429_TOO_MANY_REQUESTS, headers={'Retry-After': str(e.retry_after)})
         except Exception as e:
             print(f"發送訊息時發生錯誤: {str(e)}")
             import traceback
@@ -109,21 +217,81 @@ class ChemistViewSet(viewsets.ModelViewSet):
                 'message': f'發送訊息失敗: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    def _stream_message(self, chemist, conversation, message, deadline, received_at):
+        """以 SSE 串流回傳 AI 回應，串流結束後寫入聊天記錄"""
+        # 在建立串流回應前先取得上游名額，名額不足時由呼叫端回傳 429，此時還沒有寫入用戶訊息
+        deltas = self.ai_service.stream_response(chemist, message, deadline, conversation=conversation)
+        conversations.add_message(conversation, 'user', message, timestamp=received_at)
+
+        def event_stream():
+            yield format_sse('conversation', {'conversation_id': str(conversation.pk)})
+            chunks = []
+            try:
+                for delta in deltas:
+                    chunks.append(delta)
+                    yield format_sse('delta', {'content': delta})
+            except Exception as e:
+                # 共用的上游呼叫中途中斷時回應不完整，不寫入 AI 回應記錄
+                print(f"串流回應中斷: {str(e)}")
+                yield format_sse('error', {'status': 'error', 'message': AIService.FALLBACK_MESSAGE})
+                return
+
+            ai_response = ''.join(chunks)
+            # 串流完成後才寫入 AI 回應記錄
+            conversations.add_message(conversation, 'assistant', ai_response)
+            yield format_sse('done', {
+                'conversation_id': str(conversation.pk),
+                'assistant_message': {
+                    'role': 'assistant',
+                    'content': ai_response,
+                    'timestamp': int(timezone.now().timestamp() * 1000)
+                }
+            })
+
+        response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # 關閉 nginx 的代理緩衝，讓片段即時送達客戶端
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
     @action(detail=True, methods=['get'])
     def chat_history(self, request, pk=None):
         try:
             print(f"開始獲取聊天記錄，化學家 ID: {pk}")
             chemist = self.get_object()
-            history = ChatHistory.objects.filter(
-                chemist=chemist
-            ).order_by('timestamp')
+            conversation = conversations.resolve(
+                request, chemist, conversations.requested_conversation_id(request), create=False
+            )
+            if conversation is None:
+                history = ChatHistory.objects.none()
+            else:
+                history = ChatHistory.objects.filter(conversation=conversation)
             
-            serializer = ChatHistorySerializer(history, many=True)
-            return Response({
-                'status': 'success',
-                'data': serializer.data
-            })
+            # 第一頁為最新的訊息，以 prev 游標載入更早的訊息
+            page = self.paginator.paginate_queryset(
+                history, request, view=self, ordering=('timestamp', 'id'), from_end=True
+            )
+            if conversation is not None and not request.query_params.get(self.paginator.cursor_query_param):
+                # 最新一頁附上 write-behind 緩衝中尚未寫入資料庫的訊息
+                page = list(reversed(merge_pending(
+                    list(reversed(page)), get_chat_write_buffer().pending(conversation.pk)
+                )))
+            serializer = ChatHistorySerializer(page, many=True)
+            response = self.paginator.get_paginated_response(serializer.data)
+            if conversation is not None:
+                response['X-Conversation-Id'] = str(conversation.pk)
+            return response
             
+        except ConversationNotFound as e:
+            return Response({
+                'status': 'error',
+                'message': str(e)
+            }, status=status.HTTP_404_NOT_FOUND)
+        except ValidationError as e:
+            return Response({
+                'status': 'error',
+                'message': f'分頁參數錯誤: {e.detail}'
+            }, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             print(f"獲取聊天記錄時發生錯誤: {str(e)}")
             import traceback
@@ -137,15 +305,62 @@ class ChemistViewSet(viewsets.ModelViewSet):
     def clear_history(self, request, pk=None):
         try:
             chemist = self.get_object()
-            ChatHistory.objects.filter(chemist=chemist).delete()
-            
+            conversation = conversations.resolve(
+                request, chemist, conversations.requested_conversation_id(request), create=False
+            )
+            if conversation is None:
+                return Response({
+                    'status': 'success',
+                    'message': '聊天記錄已清除'
+                })
+
+            # 標記後立即無法存取，下一則訊息會開始新的對話；聊天記錄與摘要由背景任務分批刪除
+            Conversation.objects.filter(pk=conversation.pk).update(deleted_at=timezone.now())
+            get_chat_write_buffer().discard(conversation.pk)
+            job = delete_conversation.delay(str(conversation.pk))
             return Response({
                 'status': 'success',
-                'message': '聊天記錄已清除'
-            })
+                'data': self._job_links(request, job, conversation_id=str(conversation.pk)),
+                'message': '聊天記錄清除中'
+            }, status=status.HTTP_202_ACCEPTED)
             
+        except ConversationNotFound as e:
+            return Response({
+                'status': 'error',
+                'message': str(e)
+            }, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response({
                 'status': 'error',
                 'message': f'清除聊天記錄失敗: {str(e)}'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR) 
\ No newline at end of file
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=True, methods=['get', 'post'], url_path='conversations', url_name='conversations')
+    def conversation_list(self, request, pk=None):
+        """GET 列出目前使用者（或匿名 session）與化學家的對話；POST 開始新的對話"""
+        try:
+            chemist = self.get_object()
+            if request.method == 'POST':
+                conversation = conversations.create(request, chemist)
+                return Response({
+                    'status': 'success',
+                    'data': ConversationSerializer(conversation).data,
+                    'message': '已建立新的對話'
+                }, status=status.HTTP_201_CREATED)
+
+            page = self.paginator.paginate_queryset(
+                conversations.for_owner(request, chemist), request, view=self, ordering=('-last_active_at', '-id')
+            )
+            serializer = ConversationSerializer(page, many=True)
+            return self.paginator.get_paginated_response(serializer.data)
+
+        except ValidationError as e:
+            return Response({
+                'status': 'error',
+                'message': f'分頁參數錯誤: {e.detail}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({
+                'status': 'error',
+                'message': f'獲取對話失敗: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -8,6 +8,7 @@ class EraViewSet(viewsets.ModelViewSet):
     """時代 API 視圖集"""
     queryset = Era.objects.all()
     serializer_class = EraSerializer
+    keyset_ordering = ('year', 'id')
 
     @action(detail=True, methods=['get'], url_path='full-detail')
     def era_detail(self, request, pk=None):
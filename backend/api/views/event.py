@@ -1,4 +1,5 @@
 from rest_framework import viewsets, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from django_filters import rest_framework as filters
 from ..models import HistoricalEvent
@@ -16,16 +17,19 @@ class HistoricalEventViewSet(viewsets.ModelViewSet):
     serializer_class = HistoricalEventSerializer
     filterset_class = HistoricalEventFilter
     filter_backends = (filters.DjangoFilterBackend,)
+    keyset_ordering = ('year', 'id')
 
     def list(self, request, *args, **kwargs):
         try:
             queryset = self.filter_queryset(self.get_queryset())
-            serializer = self.get_serializer(queryset, many=True)
+            page = self.paginate_queryset(queryset)
+            serializer = self.get_serializer(page, many=True)
+            return self.paginator.get_paginated_response(serializer.data, '成功獲取歷史事件列表')
+        except ValidationError as e:
             return Response({
-                'status': 'success',
-                'data': serializer.data,
-                'message': '成功獲取歷史事件列表'
-            })
+                'status': 'error',
+                'message': f'分頁參數錯誤: {e.detail}'
+            }, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({
                 'status': 'error',
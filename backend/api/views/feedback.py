@@ -6,6 +6,7 @@ class UserFeedbackViewSet(viewsets.ModelViewSet):
     queryset = UserFeedback.objects.all()
     serializer_class = UserFeedbackSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    keyset_ordering = ('-created_at', '-id')
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user if self.request.user.is_authenticated else None) 
\ No newline at end of file
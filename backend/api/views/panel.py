@@ -0,0 +1,198 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import chain
+from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer
+from rest_framework.response import Response
+from django.conf import settings
+from django.db import connection
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from ..models import Chemist
+from ..renderers import EventStreamRenderer, format_sse
+from ..services import conversations
+from ..services.ai_service import AIService
+from ..services.concurrency import UpstreamBusy
+from ..services.deadline import Deadline
+import logging
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+
+class PanelViewSet(viewsets.ViewSet):
+    """同時向多位化學家提問的座談 API"""
+
+    @action(detail=False, methods=['post'],
+            renderer_classes=[JSONRenderer, BrowsableAPIRenderer, EventStreamRenderer])
+    def ask(self, request):
+        try:
+            message = request.data.get('message')
+            chemist_ids = request.data.get('chemist_ids')
+
+            if not message:
+                return Response({
+                    'status': 'error',
+                    'message': '訊息不能為空'
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            try:
+                chemist_ids = list(dict.fromkeys(int(chemist_id) for chemist_id in chemist_ids))
+            except (TypeError, ValueError):
+                chemist_ids = []
+            if not chemist_ids or len(chemist_ids) > settings.AI_PANEL_MAX_CHEMISTS:
+                return Response({
+                    'status': 'error',
+                    'message': f'請選擇 1 至 {settings.AI_PANEL_MAX_CHEMISTS} 位化學家'
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            chemists = Chemist.objects.filter(deleted_at__isnull=True).in_bulk(chemist_ids)
+            missing = [chemist_id for chemist_id in chemist_ids if chemist_id not in chemists]
+            if missing:
+                return Response({
+                    'status': 'error',
+                    'message': f'找不到指定的化學家: {missing}'
+                }, status=status.HTTP_404_NOT_FOUND)
+
+            panel = [chemists[chemist_id] for chemist_id in chemist_ids]
+            # 每位化學家各自延續與目前訪客的對話
+            panel_conversations = {
+                chemist.id: conversations.resolve(request, chemist) for chemist in panel
+            }
+            ai_service = AIService()
+            # 在請求執行緒中以一次查詢組好所有對話的上下文，工作執行緒不必各自查詢
+            histories = ai_service.get_chat_histories(list(panel_conversations.values()), message)
+            asked_at = timezone.now()
+            answers = self._fan_out(ai_service, panel, message, histories, Deadline.from_request(request))
+
+            if request.query_params.get('stream') in ('1', 'true'):
+                # 名額不足的結果先保留，直到第一個實際的回答才開始串流；全部名額不足時與 JSON 一樣回傳 429
+                busy = []
+                for answer in answers:
+                    if answer['status'] != 'busy':
+                        return self._stream_answers(
+                            panel_conversations, message, asked_at, chain(busy, [answer], answers)
+                        )
+                    busy.append(answer)
+                return self._busy_response(busy)
+
+            results = sorted(answers, key=lambda answer: chemist_ids.index(answer['chemist_id']))
+            if all(answer['status'] == 'busy' for answer in results):
+                return self._busy_response(results)
+
+            self._save_history(panel_conversations, message, asked_at, results)
+            return Response({
+                'status': 'success',
+                'data': {
+                    'conversation_ids': {
+                        chemist_id: str(conversation.pk) for chemist_id, conversation in panel_conversations.items()
+                    },
+                    'answers': [self._serialize(answer) for answer in results]
+                },
+                'message': '座談提問成功'
+            })
+
+        except Exception as e:
+            logger.error(f"座談提問失敗: {str(e)}")
+            logger.error(f"錯誤詳情: {traceback.format_exc()}")
+            return Response({
+                'status': 'error',
+                'message': f'座談提問失敗: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @staticmethod
+    def _busy_response(answers: list) -> Response:
+        retry_after = max(answer['retry_after'] for answer in answers)
+        return Response({
+            'status': 'error',
+            'message': f'上游請求過多，請於 {retry_after} 秒後重試'
+        }, status=status.HTTP_429_TOO_MANY_REQUESTS, headers={'Retry-After': str(retry_after)})
+
+    @staticmethod
+    def _fan_out(ai_service: AIService, panel: list, message: str, histories: dict, deadline: Deadline):
+        """並行呼叫上游，依完成順序逐一產出結果；所有化學家共用同一個期限"""
+        started = time.monotonic()
+
+        def ask_one(chemist):
+            try:
+                content = ai_service.generate_response(chemist, message, histories[chemist.id], deadline)
+                # 生成失敗時回傳的是固定的致歉訊息，不算回答也不寫入記錄
+                answer = {'status': 'error' if content == ai_service.FALLBACK_MESSAGE else 'success', 'content': content}
+            except UpstreamBusy as e:
+                answer = {'status': 'busy', 'content': '', 'retry_after': e.retry_after}
+            finally:
+                # 預先生成回答未快取或斷路器備援時工作執行緒仍會查詢資料庫；執行緒不會重用，結束前關閉自己的連線
+                connection.close()
+            answer.update({
+                'chemist_id': chemist.id,
+                'chemist_name': chemist.name,
+                'elapsed_ms': int((time.monotonic() - started) * 1000),
+                'completed_at': timezone.now(),
+            })
+            return answer
+
+        executor = ThreadPoolExecutor(max_workers=len(panel), thread_name_prefix='panel')
+        futures = [executor.submit(ask_one, chemist) for chemist in panel]
+        executor.shutdown(wait=False)
+
+        def completed():
+            for future in as_completed(futures):
+                yield future.result()
+
+        return completed()
+
+    @staticmethod
+    def _serialize(answer: dict) -> dict:
+        data = {
+            'chemist_id': answer['chemist_id'],
+            'chemist_name': answer['chemist_name'],
+            'status': answer['status'],
+            'elapsed_ms': answer['elapsed_ms'],
+        }
+        if answer['status'] == 'busy':
+            data['retry_after'] = answer['retry_after']
+        elif answer['status'] == 'error':
+            data['message'] = answer['content']
+        else:
+            data['assistant_message'] = {
+                'role': 'assistant',
+                'content': answer['content'],
+                'timestamp': int(answer['completed_at'].timestamp() * 1000)
+            }
+        return data
+
+    @staticmethod
+    def _save_history(panel_conversations: dict, message: str, asked_at, answers: list) -> None:
+        """一次批次寫入所有成功回應的問答記錄（啟用 write-behind 時寫入緩衝）"""
+        messages = []
+        for answer in answers:
+            if answer['status'] != 'success':
+                continue
+            conversation = panel_conversations[answer['chemist_id']]
+            messages.append((conversation, 'user', message, asked_at))
+            messages.append((conversation, 'assistant', answer['content'], answer['completed_at']))
+        conversations.add_messages(messages)
+
+    def _stream_answers(self, panel_conversations: dict, message: str, asked_at, answers):
+        """以 SSE 依完成順序回傳各化學家的回答，全部完成後寫入聊天記錄"""
+
+        def event_stream():
+            results = []
+            for answer in answers:
+                results.append(answer)
+                yield format_sse('answer', self._serialize(answer))
+
+            self._save_history(panel_conversations, message, asked_at, results)
+            yield format_sse('done', {
+                'conversation_ids': {
+                    chemist_id: str(conversation.pk) for chemist_id, conversation in panel_conversations.items()
+                },
+                'answered': sum(1 for answer in results if answer['status'] == 'success'),
+                'total': len(results)
+            })
+
+        response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
@@ -0,0 +1,51 @@
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from ..pagination import KeysetPagination
+from ..services import search
+
+
+class SearchView(APIView):
+    """化學家、歷史事件與自己的聊天記錄的全文搜尋，依相關度排序並標示符合的字詞
+
+    查詢參數：q（必填）、type（chemist、event、chat，以逗號分隔，預設全部）、cursor、page_size
+    """
+
+    def get(self, request):
+        try:
+            q = request.query_params.get('q', '').strip()
+            if not q:
+                return Response({
+                    'status': 'error',
+                    'message': '搜尋字詞不能為空'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            if len(q) > settings.SEARCH_MAX_QUERY_LENGTH:
+                return Response({
+                    'status': 'error',
+                    'message': f'搜尋字詞不能超過 {settings.SEARCH_MAX_QUERY_LENGTH} 個字'
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            kinds = [kind for kind in request.query_params.get('type', '').split(',') if kind] or search.KINDS
+            unknown = [kind for kind in kinds if kind not in search.KINDS]
+            if unknown:
+                return Response({
+                    'status': 'error',
+                    'message': f'不支援的搜尋類型: {unknown}'
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            paginator = KeysetPagination()
+            rows = paginator.paginate_union(search.querysets(q, request, kinds), request, ordering=search.ORDERING)
+            data = [search.serialize(row, q) for row in rows]
+            return paginator.get_paginated_response(data, '搜尋完成')
+        except ValidationError as e:
+            return Response({
+                'status': 'error',
+                'message': f'分頁參數錯誤: {e.detail}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({
+                'status': 'error',
+                'message': f'搜尋失敗: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
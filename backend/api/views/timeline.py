@@ -0,0 +1,39 @@
+from django.conf import settings
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from ..services import timeline
+
+
+class TimelineView(APIView):
+    """年份區間內在世的化學家與歷史事件，依年代分組
+
+    查詢參數：from、to（西元年，含兩端；西元前以負數表示）
+    """
+
+    def get(self, request):
+        try:
+            try:
+                start = int(request.query_params['from'])
+                end = int(request.query_params['to'])
+            except (KeyError, ValueError):
+                return Response({
+                    'status': 'error',
+                    'message': 'from 與 to 必須為整數年份'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            if start > end or end - start > settings.TIMELINE_MAX_SPAN:
+                return Response({
+                    'status': 'error',
+                    'message': f'年份區間無效，from 不能大於 to，且區間不能超過 {settings.TIMELINE_MAX_SPAN} 年'
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            return Response({
+                'status': 'success',
+                'data': timeline.timeline(start, end),
+                'message': '成功獲取時間軸'
+            })
+        except Exception as e:
+            return Response({
+                'status': 'error',
+                'message': f'獲取時間軸失敗: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
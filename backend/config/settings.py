@@ -1,3 +1,4 @@
+import json
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -13,9 +14,62 @@ MODEL_NAME = os.getenv('MODEL_NAME', 'gpt-4')
 MAX_TOKENS = int(os.getenv('MAX_TOKENS', 1000))
 TEMPERATURE = float(os.getenv('TEMPERATURE', 0.7))
 
+# 模型路由：簡單訊息交給快速模型，複雜問題交給強模型
+AI_ROUTER_ENABLED = os.getenv('AI_ROUTER_ENABLED', 'True').lower() == 'true'
+AI_FAST_MODEL = os.getenv('AI_FAST_MODEL', 'gpt-4o-mini')
+AI_STRONG_MODEL = os.getenv('AI_STRONG_MODEL', MODEL_NAME)
+AI_ANSWER_MAX_CHARS = int(os.getenv('AI_ANSWER_MAX_CHARS', 200))  # 與人設提示詞的字數要求一致
+AI_TOKENS_PER_CHAR = float(os.getenv('AI_TOKENS_PER_CHAR', 1.5))  # 中文每字約用的 token 數
+AI_ROUTER_SHORT_CHARS = int(os.getenv('AI_ROUTER_SHORT_CHARS', 20))
+AI_ROUTER_LONG_CHARS = int(os.getenv('AI_ROUTER_LONG_CHARS', 80))
+AI_ROUTER_DEEP_HISTORY = int(os.getenv('AI_ROUTER_DEEP_HISTORY', 8))  # 對話達此訊息數時偏向強模型
+# 每千 token 的輸入、輸出價格（美元），只用於日誌與指標中的成本估算
+AI_MODEL_PRICES = json.loads(os.getenv(
+    'AI_MODEL_PRICES', '{"gpt-4": [0.03, 0.06], "gpt-4o": [0.0025, 0.01], "gpt-4o-mini": [0.00015, 0.0006]}'
+))
+
+# OpenAI 連線檢查（背景執行，結果快取於行程內）
+AI_PROBE_ON_STARTUP = os.getenv('AI_PROBE_ON_STARTUP', 'False').lower() == 'true'
+AI_PROBE_TTL = int(os.getenv('AI_PROBE_TTL', 60))
+
+# 上游 LLM 併發控制
+AI_MAX_IN_FLIGHT = int(os.getenv('AI_MAX_IN_FLIGHT', 8))  # 每個行程同時進行的請求數
+AI_MAX_QUEUE = int(os.getenv('AI_MAX_QUEUE', 32))  # 每個行程的等待佇列長度
+AI_QUEUE_TIMEOUT = float(os.getenv('AI_QUEUE_TIMEOUT', 10))  # 等待名額的秒數
+AI_CLUSTER_MAX_IN_FLIGHT = int(os.getenv('AI_CLUSTER_MAX_IN_FLIGHT', 0))  # 叢集上限，0 表示不限制
+AI_CLUSTER_LEASE = float(os.getenv('AI_CLUSTER_LEASE', 120))  # 叢集名額租約秒數
+AI_RETRY_AFTER = int(os.getenv('AI_RETRY_AFTER', 5))
+
+# OpenAI HTTP 連線池
+AI_HTTP_MAX_CONNECTIONS = int(os.getenv('AI_HTTP_MAX_CONNECTIONS', 20))
+AI_HTTP_MAX_KEEPALIVE = int(os.getenv('AI_HTTP_MAX_KEEPALIVE', 10))
+AI_HTTP_KEEPALIVE_EXPIRY = float(os.getenv('AI_HTTP_KEEPALIVE_EXPIRY', 60))
+AI_HTTP_TIMEOUT = float(os.getenv('AI_HTTP_TIMEOUT', 60))
+
+# 請求期限、對沖與重試
+AI_REQUEST_DEADLINE = float(os.getenv('AI_REQUEST_DEADLINE', 30))  # 每個請求的總期限秒數
+AI_HEDGE_ENABLED = os.getenv('AI_HEDGE_ENABLED', 'True').lower() == 'true'
+AI_HEDGE_PERCENTILE = float(os.getenv('AI_HEDGE_PERCENTILE', 0.95))  # 首字延遲超過此分位時送出對沖請求
+AI_HEDGE_MIN_DELAY = float(os.getenv('AI_HEDGE_MIN_DELAY', 0.5))
+AI_HEDGE_DEFAULT_DELAY = float(os.getenv('AI_HEDGE_DEFAULT_DELAY', 3))  # 樣本不足時的對沖門檻
+AI_HEDGE_MIN_SAMPLES = int(os.getenv('AI_HEDGE_MIN_SAMPLES', 20))
+AI_RETRY_MAX = int(os.getenv('AI_RETRY_MAX', 2))
+AI_RETRY_BACKOFF_BASE = float(os.getenv('AI_RETRY_BACKOFF_BASE', 0.25))
+AI_RETRY_BACKOFF_CAP = float(os.getenv('AI_RETRY_BACKOFF_CAP', 4))
+
+# LLM 供應者：openai 或 mock（本地模擬，供離線壓測與 CI 使用）
+AI_PROVIDER = os.getenv('AI_PROVIDER', 'openai')
+
+# 模擬供應者的延遲分佈與錯誤率
+AI_MOCK_TTFB_MS = float(os.getenv('AI_MOCK_TTFB_MS', 400))
+AI_MOCK_TTFB_SIGMA = float(os.getenv('AI_MOCK_TTFB_SIGMA', 0.4))
+AI_MOCK_TOKENS_PER_SEC = float(os.getenv('AI_MOCK_TOKENS_PER_SEC', 40))
+AI_MOCK_ERROR_RATE = float(os.getenv('AI_MOCK_ERROR_RATE', 0))
+AI_MOCK_SEED = int(os.getenv('AI_MOCK_SEED')) if os.getenv('AI_MOCK_SEED') else None
+
 # OpenAI API 設置
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-if not OPENAI_API_KEY:
+if AI_PROVIDER == 'openai' and not OPENAI_API_KEY:
     raise ValueError("OPENAI_API_KEY environment variable is not set")
 
 # SECURITY WARNING: don't run with debug turned on in production!
@@ -41,6 +95,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'django_filters',
     'corsheaders',
@@ -150,9 +205,11 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'x-conversation-id',
+    'x-request-deadline-ms',
 ]
 
-CORS_EXPOSE_HEADERS = ['content-type', 'x-csrftoken']
+CORS_EXPOSE_HEADERS = ['content-type', 'x-csrftoken', 'x-conversation-id']
 CORS_PREFLIGHT_MAX_AGE = 86400  # 24 hours
 CORS_ALLOW_ALL_ORIGINS = False  # 生產環境關閉
 
@@ -168,13 +225,114 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    # keyset 分頁，不執行 COUNT(*)；各視圖以 keyset_ordering 指定排序欄位
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
     'PAGE_SIZE': int(os.getenv('API_PAGE_SIZE', 10)),
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
     ],
 }
 
+# 化學家詳情附帶的目前對話最近訊息數，完整記錄請使用 chat_history 分頁查詢
+CHEMIST_DETAIL_HISTORY = int(os.getenv('CHEMIST_DETAIL_HISTORY', 20))
+
+# 聊天記錄 write-behind 緩衝：訊息先寫入 Redis stream，由 flush_chat_writes 定期批次寫入資料庫
+CHAT_WRITE_BEHIND_ENABLED = os.getenv('CHAT_WRITE_BEHIND_ENABLED', 'False').lower() == 'true'
+CHAT_WRITE_BEHIND_BATCH = int(os.getenv('CHAT_WRITE_BEHIND_BATCH', 500))
+CHAT_WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv('CHAT_WRITE_BEHIND_FLUSH_INTERVAL', 2))
+# 已讀取但超過此秒數未確認的訊息視為 worker 中斷，由其他 worker 重新寫入
+CHAT_WRITE_BEHIND_CLAIM_IDLE = float(os.getenv('CHAT_WRITE_BEHIND_CLAIM_IDLE', 60))
+CHAT_WRITE_BEHIND_PENDING_TTL = int(os.getenv('CHAT_WRITE_BEHIND_PENDING_TTL', 86400))
+
+# 聊天記錄月分割（PostgreSQL）：由 maintain_chat_partitions 每日預先建立分割並移除過期分割
+CHAT_PARTITION_PREMAKE_MONTHS = int(os.getenv('CHAT_PARTITION_PREMAKE_MONTHS', 3))
+CHAT_PARTITION_MAINTENANCE_INTERVAL = int(os.getenv('CHAT_PARTITION_MAINTENANCE_INTERVAL', 24 * 60 * 60))
+# 保留本月與之前幾個完整月份，0 表示永久保留
+CHAT_HISTORY_RETENTION_MONTHS = int(os.getenv('CHAT_HISTORY_RETENTION_MONTHS', 0))
+# 過期分割移除前先匯出為壓縮 JSONL；zstd 需要另外安裝 zstandard
+CHAT_ARCHIVE_ENABLED = os.getenv('CHAT_ARCHIVE_ENABLED', 'True').lower() == 'true'
+CHAT_ARCHIVE_DIR = os.getenv('CHAT_ARCHIVE_DIR', str(BASE_DIR / 'archive' / 'chat_history'))
+CHAT_ARCHIVE_COMPRESSION = os.getenv('CHAT_ARCHIVE_COMPRESSION', 'gzip')
+
+# 清除聊天記錄與刪除化學家改由背景任務分批刪除，每批的筆數（各自為一個短交易）
+BULK_DELETE_BATCH_SIZE = int(os.getenv('BULK_DELETE_BATCH_SIZE', 1000))
+
+# 全文搜尋：查詢字串長度上限與結果摘要的字數
+SEARCH_MAX_QUERY_LENGTH = int(os.getenv('SEARCH_MAX_QUERY_LENGTH', 100))
+SEARCH_SNIPPET_LENGTH = int(os.getenv('SEARCH_SNIPPET_LENGTH', 160))
+
+# 時間軸：單次查詢的最大年數，以及每個年代快取的存活秒數（寫入時另以版本號失效）
+TIMELINE_MAX_SPAN = int(os.getenv('TIMELINE_MAX_SPAN', 1000))
+TIMELINE_CACHE_TTL = int(os.getenv('TIMELINE_CACHE_TTL', 24 * 60 * 60))
+
+# Cache Configuration
+REDIS_CACHE_URL = os.getenv('REDIS_CACHE_URL', 'redis://redis:6379/1')
+# Redis 以 volatile-lru 淘汰有設定 TTL 的鍵，避免誤刪 Celery 佇列
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_CACHE_URL,
+        'KEY_PREFIX': 'chronochem',
+    }
+}
+
+# AI 回應快取設定
+AI_RESPONSE_CACHE_ENABLED = os.getenv('AI_RESPONSE_CACHE_ENABLED', 'True').lower() == 'true'
+AI_RESPONSE_CACHE_TTL = int(os.getenv('AI_RESPONSE_CACHE_TTL', 7 * 24 * 60 * 60))
+
+# 常見問題預先生成設定
+AI_PRECOMPUTE_ENABLED = os.getenv('AI_PRECOMPUTE_ENABLED', 'True').lower() == 'true'
+AI_PRECOMPUTE_ON_SAVE = os.getenv('AI_PRECOMPUTE_ON_SAVE', 'True').lower() == 'true'  # 化學家更新後自動重新生成
+AI_PRECOMPUTE_CONCURRENCY = int(os.getenv('AI_PRECOMPUTE_CONCURRENCY', 2))  # 同時生成的問題數，應低於 AI_MAX_IN_FLIGHT
+AI_PRECOMPUTE_QUESTIONS_FILE = os.getenv(
+    'AI_PRECOMPUTE_QUESTIONS_FILE', str(BASE_DIR / 'api' / 'data' / 'canonical_questions.json')
+)
+AI_PRECOMPUTE_CACHE_TTL = int(os.getenv('AI_PRECOMPUTE_CACHE_TTL', 60 * 60))
+
+# 模糊問句快取設定 (MinHash/LSH)
+AI_FUZZY_CACHE_ENABLED = os.getenv('AI_FUZZY_CACHE_ENABLED', 'True').lower() == 'true'
+AI_FUZZY_CACHE_THRESHOLD = float(os.getenv('AI_FUZZY_CACHE_THRESHOLD', 0.45))
+AI_FUZZY_CACHE_CONTENT_THRESHOLD = float(os.getenv('AI_FUZZY_CACHE_CONTENT_THRESHOLD', 0.8))
+AI_FUZZY_CACHE_NUM_PERM = int(os.getenv('AI_FUZZY_CACHE_NUM_PERM', 128))
+AI_FUZZY_CACHE_BANDS = int(os.getenv('AI_FUZZY_CACHE_BANDS', 64))
+AI_FUZZY_CACHE_TTL = int(os.getenv('AI_FUZZY_CACHE_TTL', 30 * 24 * 60 * 60))
+AI_FUZZY_CACHE_MAX_ENTRIES = int(os.getenv('AI_FUZZY_CACHE_MAX_ENTRIES', 5000))  # 每個人設版本最多保留的問答數
+
+# 人設提示詞登錄表設定
+AI_PERSONA_CACHE_SIZE = int(os.getenv('AI_PERSONA_CACHE_SIZE', 256))
+AI_PERSONA_CACHE_TTL = int(os.getenv('AI_PERSONA_CACHE_TTL', 30 * 24 * 60 * 60))
+
+# 對話上下文與滾動摘要設定
+AI_CONTEXT_TOKEN_BUDGET = int(os.getenv('AI_CONTEXT_TOKEN_BUDGET', 1200))
+AI_CONTEXT_MAX_MESSAGES = int(os.getenv('AI_CONTEXT_MAX_MESSAGES', 20))
+AI_SUMMARY_ENABLED = os.getenv('AI_SUMMARY_ENABLED', 'True').lower() == 'true'
+AI_SUMMARY_MAX_CHARS = int(os.getenv('AI_SUMMARY_MAX_CHARS', 300))
+AI_SUMMARY_MAX_TOKENS = int(os.getenv('AI_SUMMARY_MAX_TOKENS', 400))
+AI_SUMMARY_BATCH_SIZE = int(os.getenv('AI_SUMMARY_BATCH_SIZE', 40))
+AI_SUMMARY_DEBOUNCE = int(os.getenv('AI_SUMMARY_DEBOUNCE', 120))
+
+# 上游斷路器設定：視窗內錯誤率或慢呼叫比例超過門檻時暫停呼叫上游，改用備援回答
+AI_BREAKER_ENABLED = os.getenv('AI_BREAKER_ENABLED', 'True').lower() == 'true'
+AI_BREAKER_WINDOW = float(os.getenv('AI_BREAKER_WINDOW', 60))  # 統計視窗秒數
+AI_BREAKER_MIN_CALLS = int(os.getenv('AI_BREAKER_MIN_CALLS', 10))  # 視窗內至少幾次呼叫才判斷
+AI_BREAKER_ERROR_RATE = float(os.getenv('AI_BREAKER_ERROR_RATE', 0.5))
+AI_BREAKER_SLOW_CALL_SECONDS = float(os.getenv('AI_BREAKER_SLOW_CALL_SECONDS', 10))
+AI_BREAKER_SLOW_CALL_RATE = float(os.getenv('AI_BREAKER_SLOW_CALL_RATE', 0.8))
+AI_BREAKER_OPEN_SECONDS = float(os.getenv('AI_BREAKER_OPEN_SECONDS', 30))  # 開啟多久後放行探測請求
+AI_BREAKER_FALLBACK_SIMILARITY = float(os.getenv('AI_BREAKER_FALLBACK_SIMILARITY', 0.3))  # 備援回答的最低問句相似度
+
+# 相同請求合併設定 (single-flight)
+AI_SINGLE_FLIGHT_ENABLED = os.getenv('AI_SINGLE_FLIGHT_ENABLED', 'True').lower() == 'true'
+AI_SINGLE_FLIGHT_TIMEOUT = int(os.getenv('AI_SINGLE_FLIGHT_TIMEOUT', 60))
+AI_SINGLE_FLIGHT_LOCK_TTL = int(os.getenv('AI_SINGLE_FLIGHT_LOCK_TTL', 90))
+
+# LLM 用量彙總：呼叫統計先累加在 Redis，由 flush_llm_usage 定期寫入 LLMUsageRollup
+AI_USAGE_ROLLUP_ENABLED = os.getenv('AI_USAGE_ROLLUP_ENABLED', 'True').lower() == 'true'
+AI_USAGE_FLUSH_INTERVAL = int(os.getenv('AI_USAGE_FLUSH_INTERVAL', 60))
+
+# 多位化學家座談設定
+AI_PANEL_MAX_CHEMISTS = int(os.getenv('AI_PANEL_MAX_CHEMISTS', 6))
+
 # Celery Configuration
 CELERY_BROKER_URL = os.getenv('REDIS_URL', 'redis://redis:6379/0')
 CELERY_RESULT_BACKEND = os.getenv('REDIS_URL', 'redis://redis:6379/0')
@@ -185,4 +343,22 @@ CELERY_TIMEZONE = TIME_ZONE
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60  # 30 minutes
 CELERY_WORKER_MAX_TASKS_PER_CHILD = 1000
-CELERY_WORKER_PREFETCH_MULTIPLIER = 1 
\ No newline at end of file
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_BEAT_SCHEDULE = {
+    'flush-llm-usage': {
+        'task': 'api.tasks.flush_llm_usage',
+        'schedule': AI_USAGE_FLUSH_INTERVAL,
+    },
+    'flush-chat-writes': {
+        'task': 'api.tasks.flush_chat_writes',
+        'schedule': CHAT_WRITE_BEHIND_FLUSH_INTERVAL,
+    },
+    'maintain-chat-partitions': {
+        'task': 'api.tasks.maintain_chat_partitions',
+        'schedule': CHAT_PARTITION_MAINTENANCE_INTERVAL,
+    },
+}
+
+# 背景聊天任務設定
+CHAT_JOB_POLL_INTERVAL = float(os.getenv('CHAT_JOB_POLL_INTERVAL', 0.5))
+CHAT_JOB_STREAM_TIMEOUT = int(os.getenv('CHAT_JOB_STREAM_TIMEOUT', 120))
@@ -0,0 +1,121 @@
+"""
+聊天端點併發吞吐量基準測試
+
+分別對同步端點 (send_message) 與非同步端點 (send_message_async) 發出
+固定數量的併發請求，回報每秒完成請求數與延遲分位數。
+
+建議以單一行程啟動伺服器，才能比較「每個行程」的吞吐量：
+
+    # 同步 (WSGI, gthread)
+    gunicorn config.wsgi:application -w 1 --threads 2 -k gthread -b 127.0.0.1:8001
+    # 非同步 (ASGI, uvicorn)
+    gunicorn config.asgi:application -w 1 -k uvicorn.workers.UvicornWorker -b 127.0.0.1:8001
+
+然後執行：
+
+    python scripts/bench_chat_concurrency.py --chemist 1 --concurrency 200 --requests 400
+
+不需要 API 金鑰的離線壓測：以 AI_PROVIDER=mock 啟動伺服器，模擬的首字延遲、
+輸出速度與錯誤率由 AI_MOCK_* 設定控制；加上 --unique 讓每個請求的訊息不同，
+避免被回應快取與請求合併吸收。CI 可用 --max-p95-ms 與 --max-error-rate 設定門檻，
+超過時以非零狀態碼結束：
+
+    AI_PROVIDER=mock AI_MOCK_SEED=1 gunicorn config.asgi:application -w 1 -k uvicorn.workers.UvicornWorker -b 127.0.0.1:8001
+    python scripts/bench_chat_concurrency.py --mode async --unique --max-p95-ms 3000 --max-error-rate 0.01
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+import httpx
+
+
+async def _worker(client, url, message, queue, latencies, errors, unique):
+    while True:
+        try:
+            index = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        started = time.perf_counter()
+        try:
+            payload = {'message': f"{message}（{index}）" if unique else message}
+            response = await client.post(url, json=payload)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+            else:
+                latencies.append(time.perf_counter() - started)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+
+
+async def run_benchmark(url, message, concurrency, total, unique=False):
+    queue = asyncio.Queue()
+    for index in range(total):
+        queue.put_nowait(index)
+
+    latencies, errors = [], []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=300, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            _worker(client, url, message, queue, latencies, errors, unique)
+            for _ in range(concurrency)
+        ])
+        elapsed = time.perf_counter() - started
+
+    return latencies, errors, elapsed
+
+
+def _report(label, latencies, errors, elapsed):
+    """輸出結果並回傳 (p95 毫秒, 錯誤率)"""
+    print(f"== {label} ==")
+    print(f"  完成: {len(latencies)}  失敗: {len(errors)}  耗時: {elapsed:.2f}s")
+    print(f"  吞吐量: {len(latencies) / elapsed:.2f} req/s")
+    p95_ms = None
+    if latencies:
+        ordered = sorted(latencies)
+        p95_ms = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000
+        print(f"  延遲 p50: {statistics.median(ordered) * 1000:.0f}ms  p95: {p95_ms:.0f}ms")
+    total = len(latencies) + len(errors)
+    return p95_ms, (len(errors) / total if total else 0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='聊天端點併發吞吐量基準測試')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8001/api/v1')
+    parser.add_argument('--chemist', type=int, default=1)
+    parser.add_argument('--message', default='介紹一下你自己')
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--mode', choices=['sync', 'async', 'both'], default='both')
+    parser.add_argument('--unique', action='store_true', help='每個請求使用不同訊息，避開快取與請求合併')
+    parser.add_argument('--max-p95-ms', type=float, help='p95 延遲超過此值時以非零狀態碼結束')
+    parser.add_argument('--max-error-rate', type=float, help='錯誤率超過此值時以非零狀態碼結束')
+    args = parser.parse_args()
+
+    endpoints = {
+        'sync': f"{args.base_url}/scientist/{args.chemist}/send_message/",
+        'async': f"{args.base_url}/scientist/{args.chemist}/send_message_async/",
+    }
+    modes = ['sync', 'async'] if args.mode == 'both' else [args.mode]
+
+    failed = False
+    for mode in modes:
+        latencies, errors, elapsed = asyncio.run(
+            run_benchmark(endpoints[mode], args.message, args.concurrency, args.requests, args.unique)
+        )
+        p95_ms, error_rate = _report(f"{mode} ({endpoints[mode]})", latencies, errors, elapsed)
+        if args.max_p95_ms is not None and (p95_ms is None or p95_ms > args.max_p95_ms):
+            print(f"  ✗ p95 超過門檻 {args.max_p95_ms:.0f}ms")
+            failed = True
+        if args.max_error_rate is not None and error_rate > args.max_error_rate:
+            print(f"  ✗ 錯誤率 {error_rate:.2%} 超過門檻 {args.max_error_rate:.2%}")
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+冷啟動基準測試：量測從啟動行程到第一個請求成功回應的時間
+
+    python scripts/bench_cold_start.py --runs 5
+    python scripts/bench_cold_start.py --cmd "gunicorn config.asgi:application -w 1 -k uvicorn.workers.UvicornWorker -b 127.0.0.1:{port}"
+"""
+import argparse
+import os
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_for(url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            pass
+        time.sleep(0.02)
+    return False
+
+
+def measure(cmd, url, timeout):
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        shlex.split(cmd), cwd=BACKEND_DIR,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        ok = wait_for(url, timeout)
+        elapsed = time.perf_counter() - started
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return elapsed if ok else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='冷啟動基準測試')
+    parser.add_argument('--cmd', default=f'{sys.executable} manage.py runserver --noreload 127.0.0.1:{{port}}')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--path', default='/api/v1/scientist/')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=60)
+    args = parser.parse_args()
+
+    cmd = args.cmd.format(port=args.port)
+    url = f"http://127.0.0.1:{args.port}{args.path}"
+    print(f"指令: {cmd}")
+    print(f"首個請求: {url}")
+
+    results = []
+    for i in range(args.runs):
+        elapsed = measure(cmd, url, args.timeout)
+        if elapsed is None:
+            print(f"  第 {i + 1} 次：{args.timeout:.0f} 秒內未成功回應")
+            continue
+        results.append(elapsed)
+        print(f"  第 {i + 1} 次：{elapsed * 1000:.0f}ms")
+
+    if results:
+        print(f"中位數: {statistics.median(results) * 1000:.0f}ms  最慢: {max(results) * 1000:.0f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+模糊問句快取離線評估
+
+讀取標註過的問句配對 (JSONL)，每行格式：
+
+    {"stored": "你怎麼發現氧氣的", "query": "氧氣是怎麼被你發現的", "duplicate": true}
+
+將 stored 寫入記憶體內的 LSH 索引後以 query 查詢，回報：
+- 命中率：標註為重複的配對中，快取成功命中的比例
+- 誤判率：標註為不重複的配對中，快取錯誤命中的比例
+
+    python scripts/evaluate_fuzzy_cache.py scripts/data/fuzzy_cache_sample.jsonl --sweep
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.services.minhash import FuzzyMatcher, LSHIndex, MinHasher  # noqa: E402
+
+
+def load_pairs(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(pairs, threshold, content_threshold, num_perm, bands):
+    hasher = MinHasher(num_perm=num_perm)
+    matcher = FuzzyMatcher(threshold=threshold, content_threshold=content_threshold)
+    tp = fp = positives = negatives = 0
+    false_positives = []
+
+    for pair in pairs:
+        index = LSHIndex(hasher, bands=bands)
+        index.insert('stored', pair['stored'])
+        hit = matcher.eligible(pair['query']) and index.query(pair['query'], matcher) is not None
+        if pair['duplicate']:
+            positives += 1
+            tp += hit
+        else:
+            negatives += 1
+            fp += hit
+            if hit:
+                false_positives.append(pair)
+
+    return {
+        'threshold': threshold,
+        'hit_rate': tp / positives if positives else 0.0,
+        'false_positive_rate': fp / negatives if negatives else 0.0,
+        'positives': positives,
+        'negatives': negatives,
+        'false_positives': false_positives,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='模糊問句快取離線評估')
+    parser.add_argument('sample', help='標註資料 JSONL 檔案')
+    parser.add_argument('--threshold', type=float, default=0.45)
+    parser.add_argument('--content-threshold', type=float, default=0.8)
+    parser.add_argument('--num-perm', type=int, default=128)
+    parser.add_argument('--bands', type=int, default=64)
+    parser.add_argument('--sweep', action='store_true', help='掃描 0.3 到 0.8 的門檻值')
+    args = parser.parse_args()
+
+    pairs = load_pairs(args.sample)
+    thresholds = [round(0.3 + 0.05 * i, 2) for i in range(11)] if args.sweep else [args.threshold]
+
+    print(f"樣本數: {len(pairs)}")
+    print(f"{'門檻':>6} {'命中率':>8} {'誤判率':>8}")
+    for threshold in thresholds:
+        result = evaluate(pairs, threshold, args.content_threshold, args.num_perm, args.bands)
+        print(f"{threshold:>6.2f} {result['hit_rate']:>8.2%} {result['false_positive_rate']:>8.2%}")
+
+    if not args.sweep and result['false_positives']:
+        print("\n誤判的配對:")
+        for pair in result['false_positives']:
+            print(f"  {pair['stored']}  <->  {pair['query']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+from unittest import mock
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from api.models import (
+    Chemist, ChatHistory, ChatSummary, Conversation, HistoricalEvent, LLMUsageRollup, UserFeedback
+)
+from api.services.bulk_delete import BatchDeleter
+from api.tasks import delete_chemist, delete_conversation
+
+
+class BatchDeleterTest(TestCase):
+    def setUp(self):
+        self.chemist = Chemist.objects.create(name='拉瓦錫')
+        self.other = Chemist.objects.create(name='道耳吞')
+        for chemist in (self.chemist, self.other):
+            HistoricalEvent.objects.create(chemist=chemist, title='發現', year=1789)
+            UserFeedback.objects.create(chemist=chemist, rating=5, comment='很有趣')
+            for _ in range(2):
+                conversation = Conversation.objects.create(chemist=chemist)
+                ChatSummary.objects.create(conversation=conversation, content='摘要')
+                ChatHistory.objects.bulk_create(
+                    ChatHistory(chemist=chemist, conversation=conversation, role='user', content=str(n))
+                    for n in range(5)
+                )
+        self.usage = LLMUsageRollup.objects.create(period_start=timezone.now(), chemist=self.chemist, model='gpt-4')
+
+    def test_purge_removes_related_rows_in_batches(self):
+        progress = []
+        deleted = BatchDeleter(batch_size=3, on_progress=progress.append).purge(
+            Chemist.objects.filter(pk=self.chemist.pk)
+        )
+
+        self.assertEqual(deleted['api.ChatHistory'], 10)
+        self.assertEqual(deleted['api.Conversation'], 2)
+        self.assertEqual(deleted['api.Chemist'], 1)
+        # 每批各回報一次進度
+        self.assertGreaterEqual(len([p for p in progress if 'api.ChatHistory' in p]), 4)
+        self.assertFalse(Chemist.objects.filter(pk=self.chemist.pk).exists())
+        self.usage.refresh_from_db()
+        self.assertIsNone(self.usage.chemist_id)
+        for model in (HistoricalEvent, UserFeedback, Conversation):
+            self.assertEqual(set(model.objects.values_list('chemist_id', flat=True)), {self.other.pk})
+        self.assertEqual(ChatHistory.objects.count(), 10)
+        self.assertEqual(ChatSummary.objects.count(), 2)
+
+    def test_delete_conversation_task(self):
+        conversation = Conversation.objects.filter(chemist=self.chemist).first()
+        result = delete_conversation.apply(args=[str(conversation.pk)]).get()
+
+        self.assertEqual(result['deleted']['api.ChatHistory'], 5)
+        self.assertFalse(Conversation.objects.filter(pk=conversation.pk).exists())
+        self.assertEqual(ChatHistory.objects.filter(chemist=self.chemist).count(), 5)
+
+
+class ChemistDestroyTest(TestCase):
+    def test_destroy_hides_chemist_and_schedules_deletion(self):
+        chemist = Chemist.objects.create(name='居禮')
+        client = APIClient()
+        with mock.patch('api.views.chemist.delete_chemist.delay') as delay:
+            delay.return_value.id = 'job-1'
+            response = client.delete(reverse('scientist-detail', args=[chemist.id]))
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertTrue(response.data['data']['status_url'].endswith(reverse('chat-job-detail', args=['job-1'])))
+        delay.assert_called_once_with(chemist.id)
+        self.assertEqual(client.get(reverse('scientist-list')).data['data'], [])
+
+        delete_chemist.apply(args=[chemist.id]).get()
+        self.assertFalse(Chemist.objects.exists())
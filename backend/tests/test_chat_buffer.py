@@ -0,0 +1,118 @@
+import datetime
+import fakeredis
+import uuid
+from unittest import mock
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.test import APIClient
+from api.models import Chemist, ChatHistory, Conversation
+from api.services import conversations
+from api.services import chat_buffer
+from api.services.chat_buffer import ChatWriteBuffer, _to_message, write_batch
+from api.services.context_builder import ContextBuilder
+
+
+def entry(conversation, content, seconds=0, message_uuid=None):
+    return {
+        'message_uuid': str(message_uuid or uuid.uuid4()),
+        'conversation_id': str(conversation.pk),
+        'chemist_id': conversation.chemist_id,
+        'role': 'user',
+        'content': content,
+        'timestamp': (timezone.now() + datetime.timedelta(seconds=seconds)).isoformat(),
+    }
+
+
+class WriteBatchTest(TestCase):
+    def setUp(self):
+        self.chemist = Chemist.objects.create(name='拉瓦錫')
+        self.conversation = Conversation.objects.create(chemist=self.chemist)
+
+    def test_redelivered_entries_are_written_once(self):
+        entries = [entry(self.conversation, str(i), seconds=i) for i in range(3)]
+        self.assertEqual(write_batch(entries), 3)
+        # 確認前中斷的批次會被重送
+        latest = entry(self.conversation, '3', seconds=3)
+        write_batch(entries[1:] + [latest])
+
+        self.assertEqual(
+            list(ChatHistory.objects.filter(conversation=self.conversation).order_by('timestamp').values_list(
+                'content', flat=True
+            )),
+            ['0', '1', '2', '3']
+        )
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.last_active_at, parse_datetime(latest['timestamp']))
+
+    def test_replayed_message_with_different_timestamp_is_skipped(self):
+        message_uuid = uuid.uuid4()
+        self.assertEqual(write_batch([entry(self.conversation, '一次', message_uuid=message_uuid)]), 1)
+        # 分割表的唯一限制含 timestamp，時間不同的重送也不能寫入第二筆
+        write_batch([entry(self.conversation, '一次', seconds=5, message_uuid=message_uuid)])
+        self.assertEqual(ChatHistory.objects.filter(message_uuid=message_uuid).count(), 1)
+
+    def test_entries_of_cleared_conversations_are_dropped(self):
+        cleared = Conversation.objects.create(chemist=self.chemist)
+        entries = [entry(self.conversation, '保留'), entry(cleared, '捨棄')]
+        cleared.delete()
+
+        self.assertEqual(write_batch(entries), 1)
+        self.assertEqual(list(ChatHistory.objects.values_list('content', flat=True)), ['保留'])
+
+
+@override_settings(CHAT_WRITE_BEHIND_ENABLED=True)
+class BufferedReadTest(TestCase):
+    def setUp(self):
+        self.chemist = Chemist.objects.create(name='居禮')
+        self.conversation = Conversation.objects.create(chemist=self.chemist)
+
+    def test_append_falls_back_to_database_without_redis(self):
+        with mock.patch('api.services.chat_buffer.get_redis', side_effect=ConnectionError):
+            message = conversations.add_message(self.conversation, 'user', '你好')
+        self.assertIsNotNone(message.id)
+        self.assertTrue(ChatHistory.objects.filter(message_uuid=message.message_uuid).exists())
+
+    def test_unflushed_messages_are_visible_to_readers(self):
+        stored = entry(self.conversation, '已寫入', seconds=-10)
+        write_batch([stored])
+        # 緩衝集合中仍留有已寫入的訊息時以 message_uuid 去重
+        pending = [_to_message(stored), _to_message(entry(self.conversation, '尚未寫入'))]
+
+        with mock.patch.object(ChatWriteBuffer, 'pending', return_value=pending):
+            window = ContextBuilder(budget=1000, max_messages=10).build(self.conversation)
+            response = APIClient().get(
+                reverse('scientist-chat-history', args=[self.chemist.id]),
+                {'conversation_id': str(self.conversation.pk)}
+            )
+
+        self.assertEqual([message['content'] for message in window.messages], ['已寫入', '尚未寫入'])
+        self.assertEqual(window.oldest_id, ChatHistory.objects.get().id)
+        rows = response.data['data']
+        self.assertEqual([row['content'] for row in rows], ['已寫入', '尚未寫入'])
+        self.assertIsNone(rows[1]['id'])
+        self.assertEqual(rows[1]['message_uuid'], str(pending[1].message_uuid))
+
+
+@override_settings(CHAT_WRITE_BEHIND_ENABLED=True, CHAT_WRITE_BEHIND_CLAIM_IDLE=0)
+class BufferReplayTest(TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        patcher = mock.patch.object(chat_buffer, 'get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.conversation = Conversation.objects.create(chemist=Chemist.objects.create(name='道耳頓'))
+
+    def test_replayed_buffered_message_is_written_once(self):
+        buffer = ChatWriteBuffer()
+        message = buffer.append(self.conversation, 'user', '原子是什麼？')
+        payload = self.redis.xrange(chat_buffer.STREAM_KEY)[0][1]['payload']
+        self.assertEqual(buffer.flush(), 1)
+
+        # 寫入後、XACK 前中斷：相同的 payload 再次被讀取
+        self.redis.xadd(chat_buffer.STREAM_KEY, {'payload': payload})
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(list(ChatHistory.objects.values_list('message_uuid', 'content')),
+                         [(message.message_uuid, '原子是什麼？')])
+        self.assertEqual(self.redis.xlen(chat_buffer.STREAM_KEY), 0)
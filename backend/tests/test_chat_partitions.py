@@ -0,0 +1,147 @@
+import datetime
+import gzip
+import io
+import json
+import tempfile
+from pathlib import Path
+from unittest import skipIf, skipUnless
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+from api.models import Chemist, ChatHistory, Conversation
+from api.services import chat_partitions
+
+
+class PartitionHelpersTest(SimpleTestCase):
+    def test_month_arithmetic_and_names(self):
+        month = datetime.date(2026, 11, 1)
+        self.assertEqual(chat_partitions.add_months(month, 2), datetime.date(2027, 1, 1))
+        self.assertEqual(chat_partitions.add_months(month, -11), datetime.date(2025, 12, 1))
+        self.assertEqual(chat_partitions.partition_name(month), 'api_chathistory_p202611')
+        self.assertEqual(chat_partitions.partition_month('api_chathistory_p202611'), month)
+        self.assertIsNone(chat_partitions.partition_month('api_chathistory_default'))
+        self.assertIn(
+            "FROM ('2026-11-01 00:00:00+00') TO ('2026-12-01 00:00:00+00')",
+            chat_partitions.create_partition_sql(month)
+        )
+
+    def test_expired_keeps_current_and_retained_months(self):
+        months = [datetime.date(2026, m, 1) for m in range(1, 11)]
+        now = datetime.datetime(2026, 10, 18, tzinfo=datetime.timezone.utc)
+        self.assertEqual(chat_partitions.expired(months, 0, now), [])
+        self.assertEqual(
+            chat_partitions.expired(months, 6, now),
+            [datetime.date(2026, 1, 1), datetime.date(2026, 2, 1), datetime.date(2026, 3, 1)]
+        )
+
+    def test_write_archive_is_jsonl_and_atomic(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'nested' / 'api_chathistory_p202601.jsonl.gz'
+            timestamp = datetime.datetime(2026, 1, 2, tzinfo=datetime.timezone.utc)
+            rows = [(1, 'u1', 'c1', 7, 'user', '你好', timestamp), (2, 'u2', 'c1', 7, 'assistant', '幸會', timestamp)]
+            self.assertEqual(chat_partitions.write_archive(iter(rows), path, 'gzip'), 2)
+            with gzip.open(path, 'rt', encoding='utf-8') as stream:
+                records = [json.loads(line) for line in stream]
+            self.assertEqual([record['content'] for record in records], ['你好', '幸會'])
+            self.assertEqual(records[0]['timestamp'], str(timestamp))
+
+            def broken():
+                yield rows[0]
+                raise RuntimeError('讀取中斷')
+
+            failed = path.with_name('api_chathistory_p202602.jsonl.gz')
+            with self.assertRaises(RuntimeError):
+                chat_partitions.write_archive(broken(), failed, 'gzip')
+            self.assertEqual(sorted(p.name for p in path.parent.iterdir()), [path.name])
+
+
+@skipIf(connection.vendor == 'postgresql', 'PostgreSQL 上聊天記錄為分割表')
+class NonPostgresTest(TestCase):
+    def test_partition_maintenance_is_a_noop(self):
+        self.assertFalse(chat_partitions.is_partitioned())
+        self.assertEqual(chat_partitions.ensure_partitions(), [])
+        self.assertEqual(chat_partitions.expire_partitions(retention_months=1), [])
+
+
+@skipUnless(connection.vendor == 'postgresql', '需要 PostgreSQL 分割表')
+class PostgresPartitionTest(TransactionTestCase):
+    def test_expired_partition_is_archived_then_dropped(self):
+        now = timezone.now()
+        old = chat_partitions.add_months(chat_partitions.month_start(now), -14)
+        with connection.cursor() as cursor:
+            cursor.execute(chat_partitions.create_partition_sql(old))
+        self.assertIn(old, chat_partitions.partitions())
+        self.assertEqual(chat_partitions.ensure_partitions(ahead=1), [])
+
+        chemist = Chemist.objects.create(name='波以耳')
+        conversation = Conversation.objects.create(chemist=chemist)
+        old_time = datetime.datetime(old.year, old.month, 15, tzinfo=datetime.timezone.utc)
+        ChatHistory.objects.create(chemist=chemist, conversation=conversation, content='舊訊息', timestamp=old_time)
+        ChatHistory.objects.create(chemist=chemist, conversation=conversation, content='新訊息')
+
+        with tempfile.TemporaryDirectory() as directory:
+            results = chat_partitions.expire_partitions(retention_months=12, archive=True, directory=directory,
+                                                        compression='gzip', now=now)
+            self.assertEqual([result['partition'] for result in results], [chat_partitions.partition_name(old)])
+            with gzip.open(results[0]['archive'], 'rt', encoding='utf-8') as stream:
+                self.assertEqual([json.loads(line)['content'] for line in stream], ['舊訊息'])
+
+        self.assertNotIn(old, chat_partitions.partitions())
+        self.assertEqual(list(ChatHistory.objects.values_list('content', flat=True)), ['新訊息'])
+
+    def test_rows_in_default_are_moved_into_new_partition(self):
+        now = timezone.now()
+        future = chat_partitions.add_months(chat_partitions.month_start(now), 6)
+        self.assertNotIn(future, chat_partitions.partitions())
+        self.addCleanup(chat_partitions.drop_partition, future)
+
+        chemist = Chemist.objects.create(name='波以耳')
+        conversation = Conversation.objects.create(chemist=chemist)
+        future_time = datetime.datetime(future.year, future.month, 3, tzinfo=datetime.timezone.utc)
+        ChatHistory.objects.create(chemist=chemist, conversation=conversation, content='預約訊息', timestamp=future_time)
+
+        self.assertIn(chat_partitions.partition_name(future),
+                      chat_partitions.ensure_partitions(ahead=6, now=now))
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {chat_partitions.DEFAULT_PARTITION}")
+            self.assertEqual(cursor.fetchone()[0], 0)
+            cursor.execute(f"SELECT content FROM {chat_partitions.partition_name(future)}")
+            self.assertEqual(cursor.fetchall(), [('預約訊息',)])
+            # default 分割已重新掛回
+            cursor.execute("SELECT relispartition FROM pg_class WHERE relname = %s",
+                           [chat_partitions.DEFAULT_PARTITION])
+            self.assertTrue(cursor.fetchone()[0])
+        self.assertEqual(list(ChatHistory.objects.values_list('content', flat=True)), ['預約訊息'])
+
+    def test_expired_rows_in_default_are_archived_then_deleted(self):
+        now = timezone.now()
+        old = chat_partitions.add_months(chat_partitions.month_start(now), -20)
+        self.assertNotIn(old, chat_partitions.partitions())
+
+        chemist = Chemist.objects.create(name='波以耳')
+        conversation = Conversation.objects.create(chemist=chemist)
+        old_time = datetime.datetime(old.year, old.month, 10, tzinfo=datetime.timezone.utc)
+        ChatHistory.objects.create(chemist=chemist, conversation=conversation, content='舊訊息', timestamp=old_time)
+        ChatHistory.objects.create(chemist=chemist, conversation=conversation, content='新訊息')
+
+        results = chat_partitions.expire_partitions(retention_months=12, archive=False, now=now, dry_run=True)
+        self.assertEqual(results, [{'partition': chat_partitions.DEFAULT_PARTITION, 'archive': None, 'rows': 1}])
+        self.assertEqual(ChatHistory.objects.count(), 2)
+
+        with tempfile.TemporaryDirectory() as directory:
+            results = chat_partitions.expire_partitions(retention_months=12, archive=True, directory=directory,
+                                                        compression='gzip', now=now)
+            self.assertEqual([(result['partition'], result['rows']) for result in results],
+                             [(chat_partitions.DEFAULT_PARTITION, 1)])
+            with gzip.open(results[0]['archive'], 'rt', encoding='utf-8') as stream:
+                self.assertEqual([json.loads(line)['content'] for line in stream], ['舊訊息'])
+
+        self.assertEqual(list(ChatHistory.objects.values_list('content', flat=True)), ['新訊息'])
+
+    def test_dry_run_does_not_create_partitions(self):
+        future = chat_partitions.add_months(chat_partitions.month_start(timezone.now()), 6)
+        out = io.StringIO()
+        call_command('chat_partitions', '--dry-run', '--ahead', '6', stdout=out)
+        self.assertIn(f"將建立分割 {chat_partitions.partition_name(future)}", out.getvalue())
+        self.assertNotIn(future, chat_partitions.partitions())
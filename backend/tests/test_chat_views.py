@@ -0,0 +1,196 @@
+import json
+from unittest import mock
+from celery import states
+from celery.result import AsyncResult
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from api.models import Chemist, ChatHistory
+from api.services.ai_service import AIService
+from api.services.concurrency import UpstreamBusy
+from api.services.providers import MockProvider
+from api.services.single_flight import LeaderFailed
+from api.tasks import generate_chemist_reply
+
+
+def parse_sse(response) -> list:
+    """將串流回應拆成 (event, data) 列表"""
+    body = b''.join(response.streaming_content).decode('utf-8') if response.streaming else response.content.decode()
+    events = []
+    for block in body.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+@override_settings(AI_SUMMARY_ENABLED=False, AI_FUZZY_CACHE_ENABLED=False, AI_PRECOMPUTE_ENABLED=False)
+class ChatViewTestCase(TestCase):
+    """以 MockProvider 走完整的回應流程（快取、上游名額、對沖），不連線 OpenAI"""
+
+    error_rate = 0
+
+    def setUp(self):
+        cache.clear()
+        self.provider = MockProvider(ttfb_ms=0, tokens_per_sec=1_000_000, error_rate=self.error_rate, seed=1)
+        patcher = mock.patch.object(AIService, 'provider', new_callable=mock.PropertyMock, return_value=self.provider)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.chemist = Chemist.objects.create(name='拉瓦錫', birth_year=1743, death_year=1794)
+        self.client = APIClient()
+
+    def history(self):
+        return list(ChatHistory.objects.order_by('timestamp', 'id').values_list('role', 'content'))
+
+
+class SendMessageStreamTest(ChatViewTestCase):
+    def post(self, message, **params):
+        url = reverse('scientist-send-message', args=[self.chemist.id])
+        return self.client.post(f"{url}?stream=1", {'message': message, **params}, format='json',
+                                HTTP_ACCEPT='text/event-stream')
+
+    def test_streams_deltas_and_saves_reply_after_done(self):
+        response = self.post('燃燒是什麼？')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['X-Accel-Buffering'], 'no')
+        # 串流開始前只寫入用戶訊息
+        self.assertEqual(self.history(), [('user', '燃燒是什麼？')])
+
+        events = parse_sse(response)
+        names = [name for name, _ in events]
+        self.assertEqual((names[0], names[-1]), ('conversation', 'done'))
+        self.assertTrue(set(names[1:-1]) == {'delta'} and len(names) > 3)
+
+        reply = ''.join(data['content'] for name, data in events if name == 'delta')
+        done = events[-1][1]
+        self.assertEqual(done['assistant_message']['content'], reply)
+        self.assertEqual(done['conversation_id'], events[0][1]['conversation_id'])
+        self.assertTrue(reply.startswith('我是拉瓦錫。'))
+        self.assertEqual(self.history(), [('user', '燃燒是什麼？'), ('assistant', reply)])
+
+    def test_errors_are_sent_as_error_events(self):
+        events = parse_sse(self.post(''))
+        self.assertEqual(events, [('error', {'status': 'error', 'message': '訊息不能為空'})])
+
+        with mock.patch.object(AIService, 'stream_response', side_effect=UpstreamBusy(3)):
+            response = self.post('燃燒是什麼？')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '3')
+        self.assertEqual(parse_sse(response)[0][0], 'error')
+        self.assertEqual(self.history(), [])
+
+
+    def test_interrupted_shared_stream_is_not_saved(self):
+        def deltas():
+            yield '燃燒是'
+            raise LeaderFailed('GeneratorExit')
+
+        with mock.patch.object(AIService, 'stream_response', return_value=deltas()):
+            events = parse_sse(self.post('燃燒是什麼？'))
+        self.assertEqual([name for name, _ in events], ['conversation', 'delta', 'error'])
+        self.assertEqual(self.history(), [('user', '燃燒是什麼？')])
+
+
+class EmptyStreamTest(ChatViewTestCase):
+    def test_empty_stream_is_not_cached(self):
+        with mock.patch.object(self.provider, 'stream', return_value=iter(())), \
+                mock.patch.object(AIService, '_store_cached') as store_cached:
+            self.assertEqual(list(AIService().stream_response(self.chemist, '燃燒是什麼？')), [])
+        store_cached.assert_not_called()
+
+
+class SendMessageStreamFailureTest(ChatViewTestCase):
+    error_rate = 1
+
+    def test_upstream_failure_streams_fallback_message(self):
+        url = reverse('scientist-send-message', args=[self.chemist.id])
+        response = self.client.post(f"{url}?stream=1", {'message': '燃燒是什麼？'}, format='json')
+        events = parse_sse(response)
+        self.assertEqual([name for name, _ in events], ['conversation', 'delta', 'done'])
+        self.assertEqual(events[-1][1]['assistant_message']['content'], AIService.FALLBACK_MESSAGE)
+
+
+class SendMessageAsyncViewTest(ChatViewTestCase):
+    async def test_generates_and_saves_reply(self):
+        url = reverse('scientist-send-message-async', args=[self.chemist.id])
+        response = await self.async_client.post(url, {'message': '氧氣是什麼？'}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = json.loads(response.content)['data']
+        self.assertTrue(data['assistant_message']['content'].startswith('我是拉瓦錫。'))
+
+        rows = [(row.role, str(row.conversation_id)) async for row in ChatHistory.objects.order_by('timestamp', 'id')]
+        self.assertEqual(rows, [('user', data['conversation_id']), ('assistant', data['conversation_id'])])
+
+    async def test_conversation_id_from_query_string(self):
+        url = reverse('scientist-send-message-async', args=[self.chemist.id])
+        first = json.loads((await self.async_client.post(
+            url, {'message': '氧氣是什麼？'}, content_type='application/json'
+        )).content)['data']['conversation_id']
+        response = await self.async_client.post(
+            f"{url}?conversation_id={first}", {'message': '氫氣呢？'}, content_type='application/json'
+        )
+        self.assertEqual(json.loads(response.content)['data']['conversation_id'], first)
+
+    async def test_rejects_invalid_requests_and_busy_upstream(self):
+        url = reverse('scientist-send-message-async', args=[self.chemist.id])
+        for body in (b'{', b'[]', b'"hi"'):
+            response = await self.async_client.post(url, body, content_type='application/json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, body)
+        response = await self.async_client.post(
+            reverse('scientist-send-message-async', args=[999]), {'message': '你好'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        with mock.patch.object(AIService, 'agenerate_response', side_effect=UpstreamBusy(2)):
+            response = await self.async_client.post(url, {'message': '你好'}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '2')
+        self.assertFalse(await ChatHistory.objects.aexists())
+
+
+@override_settings(CHAT_JOB_POLL_INTERVAL=0.01, CHAT_JOB_STREAM_TIMEOUT=0.05)
+class ChatJobAPITest(ChatViewTestCase):
+    def setUp(self):
+        super().setUp()
+        # 測試中不連線 broker：以 apply() 在本行程執行任務，並以任務 ID 查回結果
+        self.jobs = {}
+
+        def delay(*args):
+            result = generate_chemist_reply.apply(args)
+            self.jobs[result.id] = result
+            return result
+
+        for target, side_effect in (('api.views.chemist.generate_chemist_reply.delay', delay),
+                                    ('api.views.chat_job.AsyncResult', lambda job_id: self.jobs[job_id])):
+            patcher = mock.patch(target, side_effect=side_effect)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_create_poll_and_subscribe(self):
+        url = reverse('scientist-send-message', args=[self.chemist.id])
+        response = self.client.post(f"{url}?mode=async", {'message': '燃燒是什麼？'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job = response.data['data']
+        self.assertTrue(job['status_url'].endswith(reverse('chat-job-detail', args=[job['job_id']])))
+
+        polled = self.client.get(reverse('chat-job-detail', args=[job['job_id']])).data['data']
+        self.assertEqual((polled['state'], polled['ready']), (states.SUCCESS, True))
+        reply = polled['result']['assistant_message']['content']
+        self.assertEqual(polled['result']['conversation_id'], job['conversation_id'])
+        self.assertEqual(self.history(), [('user', '燃燒是什麼？'), ('assistant', reply)])
+
+        events = parse_sse(self.client.get(reverse('chat-job-events', args=[job['job_id']])))
+        self.assertEqual([name for name, _ in events], ['state', 'done'])
+        self.assertEqual(events[-1][1]['result']['assistant_message']['content'], reply)
+
+    def test_events_time_out_while_pending(self):
+        self.jobs['pending'] = mock.Mock(spec=AsyncResult, id='pending', state=states.PENDING, info=None, **{
+            'ready.return_value': False, 'successful.return_value': False, 'failed.return_value': False,
+        })
+        polled = self.client.get(reverse('chat-job-detail', args=['pending'])).data['data']
+        self.assertEqual((polled['state'], polled['ready']), (states.PENDING, False))
+
+        events = parse_sse(self.client.get(reverse('chat-job-events', args=['pending'])))
+        self.assertEqual([name for name, _ in events], ['state', 'timeout'])
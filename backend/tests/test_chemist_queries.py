@@ -0,0 +1,51 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from api.models import Chemist, ChatHistory, Conversation, HistoricalEvent
+
+
+@override_settings(CHEMIST_DETAIL_HISTORY=3)
+class ChemistQueryCountTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def add_chemists(self, count, messages):
+        chemists = []
+        for i in range(count):
+            chemist = Chemist.objects.create(name=f'化學家{Chemist.objects.count()}')
+            HistoricalEvent.objects.create(chemist=chemist, title='發現', year=1800 + i)
+            HistoricalEvent.objects.create(chemist=chemist, title='著作', year=1810 + i)
+            conversation = Conversation.objects.create(chemist=chemist)
+            ChatHistory.objects.bulk_create(
+                ChatHistory(chemist=chemist, conversation=conversation, role='user', content=str(n))
+                for n in range(messages)
+            )
+            chemists.append((chemist, conversation))
+        return chemists
+
+    def test_list_query_count_is_constant(self):
+        self.add_chemists(2, messages=2)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('scientist-list'), {'page_size': 100})
+        self.assertEqual(len(response.data['data']), 2)
+        self.assertNotIn('chat_history', response.data['data'][0])
+        self.assertEqual(len(response.data['data'][0]['events']), 2)
+
+        self.add_chemists(6, messages=30)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('scientist-list'), {'page_size': 100})
+        self.assertEqual(len(response.data['data']), 8)
+
+    def test_detail_returns_bounded_recent_history(self):
+        (chemist, conversation), = self.add_chemists(1, messages=50)
+        url = reverse('scientist-detail', args=[chemist.id])
+
+        # 化學家、事件、對話與最近訊息各一次查詢
+        with self.assertNumQueries(4):
+            response = self.client.get(url, {'conversation_id': str(conversation.pk)})
+        self.assertEqual([row['content'] for row in response.data['data']['chat_history']], ['47', '48', '49'])
+
+        # 沒有對話時不查詢聊天記錄
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.data['data']['chat_history'], [])
@@ -0,0 +1,80 @@
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from api.services import circuit_breaker as circuit_breaker_module
+from api.services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+from api.services.concurrency import UpstreamBusy
+
+
+@override_settings(AI_REQUEST_DEADLINE=5)
+class CircuitBreakerTest(SimpleTestCase):
+    def setUp(self):
+        # Redis 無法使用時退回行程內狀態
+        patcher = mock.patch.object(circuit_breaker_module, 'get_redis', side_effect=ConnectionError)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.clock = [1000.0]
+        for target in ('time.time', 'time.monotonic'):
+            patcher = mock.patch(f'api.services.circuit_breaker.{target}', side_effect=lambda: self.clock[0])
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker('test', min_calls=4, error_rate=0.5, slow_call_seconds=2,
+                                      slow_call_rate=0.75, open_seconds=30, sync_interval=0)
+
+    def fail(self, times=1):
+        for _ in range(times):
+            self.breaker.acquire().failure(ConnectionError('上游中斷'))
+
+    def succeed(self, times=1, latency=0.1):
+        for _ in range(times):
+            permit = self.breaker.acquire()
+            self.clock[0] += latency
+            permit.success()
+
+    def test_opens_when_error_rate_exceeded(self):
+        self.succeed(2)
+        self.fail(1)
+        self.assertEqual(self.breaker.status()['state'], CLOSED)
+        self.fail(1)
+        self.assertEqual(self.breaker.status()['state'], OPEN)
+        with self.assertRaises(CircuitOpen) as ctx:
+            self.breaker.acquire()
+        self.assertEqual(ctx.exception.retry_after, 30)
+
+    def test_opens_when_calls_are_slow(self):
+        self.succeed(3, latency=3)
+        self.assertEqual(self.breaker.status()['state'], CLOSED)
+        self.succeed(1, latency=3)
+        self.assertEqual(self.breaker.status()['state'], OPEN)
+
+    def test_upstream_busy_is_not_counted(self):
+        for _ in range(5):
+            self.breaker.acquire().failure(UpstreamBusy(5))
+        self.assertEqual(self.breaker.status()['window']['calls'], 0)
+
+    def test_half_open_allows_single_probe(self):
+        self.fail(4)
+        self.clock[0] += 31
+        probe = self.breaker.acquire()
+        self.assertEqual(self.breaker.status()['state'], HALF_OPEN)
+        with self.assertRaises(CircuitOpen):
+            self.breaker.acquire()
+
+        probe.success()
+        self.assertEqual(self.breaker.status()['state'], CLOSED)
+        self.assertEqual(self.breaker.status()['window']['calls'], 0)
+        self.breaker.acquire().release()
+
+    def test_failed_probe_reopens(self):
+        self.fail(4)
+        self.clock[0] += 31
+        self.breaker.acquire().failure(TimeoutError())
+        self.assertEqual(self.breaker.status()['state'], OPEN)
+        with self.assertRaises(CircuitOpen):
+            self.breaker.acquire()
+
+    def test_old_failures_leave_the_window(self):
+        self.fail(3)
+        self.clock[0] += 61
+        self.succeed(3)
+        self.fail(1)
+        self.assertEqual(self.breaker.status()['state'], CLOSED)
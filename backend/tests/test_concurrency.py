@@ -0,0 +1,155 @@
+from unittest import mock
+from django.test import SimpleTestCase
+from api.services import concurrency
+from api.services.concurrency import RedisSemaphore, UpstreamBusy, UpstreamLimiter
+import asyncio
+import fakeredis
+import gc
+import threading
+import time
+
+
+class RedisTestCase(SimpleTestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        patcher = mock.patch.object(concurrency, 'get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class RedisSemaphoreTest(RedisTestCase):
+    def test_acquire_until_limit_and_release(self):
+        semaphore = RedisSemaphore('test:semaphore', limit=2, lease=60)
+        self.assertTrue(semaphore.try_acquire('a'))
+        self.assertTrue(semaphore.try_acquire('b'))
+        self.assertFalse(semaphore.try_acquire('c'))
+        self.assertGreater(self.redis.ttl('test:semaphore'), 0)
+
+        semaphore.release('a')
+        self.assertTrue(semaphore.try_acquire('c'))
+        self.assertEqual(set(self.redis.zrange('test:semaphore', 0, -1)), {'b', 'c'})
+
+    def test_stale_holders_expire_after_lease(self):
+        semaphore = RedisSemaphore('test:semaphore', limit=1, lease=0.05)
+        self.assertTrue(semaphore.try_acquire('crashed'))
+        self.assertFalse(semaphore.try_acquire('next'))
+        # 持有者沒有釋放就當機，租約過期後名額自動歸還
+        time.sleep(0.1)
+        self.assertTrue(semaphore.try_acquire('next'))
+        self.assertEqual(self.redis.zrange('test:semaphore', 0, -1), ['next'])
+
+
+class ClusterLimiterTest(RedisTestCase):
+    def test_cluster_full_raises_upstream_busy(self):
+        limiter = UpstreamLimiter(max_in_flight=4, max_queue=4, wait_timeout=0.05, cluster_limit=1, retry_after=7)
+        slot = limiter.acquire()
+        with self.assertRaises(UpstreamBusy) as raised:
+            limiter.acquire()
+        self.assertEqual((raised.exception.scope, raised.exception.retry_after), ('cluster', 7))
+        self.assertIsNone(limiter.try_acquire())
+
+        slot.release()
+        self.assertEqual(self.redis.zcard(limiter.cluster.key), 0)
+        limiter.acquire().release()
+
+    def test_cancelled_aacquire_returns_local_slot(self):
+        limiter = UpstreamLimiter(max_in_flight=2, max_queue=2, wait_timeout=5, cluster_limit=1)
+        held = limiter.acquire()
+
+        async def cancel_while_waiting():
+            task = asyncio.create_task(limiter.aacquire())
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancel_while_waiting())
+        self.assertEqual(limiter._semaphore._value, 1)
+        held.release()
+        self.assertEqual(self.redis.zcard(limiter.cluster.key), 0)
+
+    def test_cluster_slot_taken_after_cancel_is_released(self):
+        limiter = UpstreamLimiter(max_in_flight=1, max_queue=0, wait_timeout=5, cluster_limit=1)
+        try_acquire = limiter._try_acquire_cluster
+
+        def slow_try_acquire(token):
+            time.sleep(0.1)
+            return try_acquire(token)
+
+        async def cancel_during_attempt():
+            with mock.patch.object(limiter, '_try_acquire_cluster', side_effect=slow_try_acquire):
+                task = asyncio.create_task(limiter.aacquire())
+                await asyncio.sleep(0.02)
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+                # 等執行緒中的嘗試完成並歸還
+                await asyncio.sleep(0.2)
+
+        asyncio.run(cancel_during_attempt())
+        self.assertEqual(self.redis.zcard(limiter.cluster.key), 0)
+        limiter.acquire().release()
+
+    def test_redis_outage_falls_back_to_local_limit(self):
+        limiter = UpstreamLimiter(max_in_flight=1, max_queue=0, wait_timeout=0.05, cluster_limit=1)
+        with mock.patch.object(concurrency, 'get_redis', side_effect=ConnectionError):
+            slot = limiter.acquire()
+            with self.assertRaises(UpstreamBusy):
+                limiter.acquire()
+            slot.release()
+
+
+class UpstreamLimiterTest(SimpleTestCase):
+    def test_waits_in_queue_and_rejects_when_queue_is_full(self):
+        limiter = UpstreamLimiter(max_in_flight=1, max_queue=1, wait_timeout=1)
+        slot = limiter.acquire()
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(limiter.acquire()))
+        waiter.start()
+        time.sleep(0.05)
+
+        # 佇列已有一個等待者，再來的請求立即被拒絕
+        started = time.monotonic()
+        with self.assertRaises(UpstreamBusy) as raised:
+            limiter.acquire()
+        self.assertEqual(raised.exception.scope, 'local')
+        self.assertLess(time.monotonic() - started, 0.5)
+
+        slot.release()
+        waiter.join(1)
+        self.assertEqual(len(results), 1)
+        results[0].release()
+
+    def test_queue_wait_times_out(self):
+        limiter = UpstreamLimiter(max_in_flight=1, max_queue=1, wait_timeout=1)
+        slot = limiter.acquire()
+        with self.assertRaises(UpstreamBusy):
+            limiter.acquire(timeout=0.05)
+        slot.release()
+
+    def test_aacquire_polls_until_a_slot_is_released(self):
+        limiter = UpstreamLimiter(max_in_flight=1, max_queue=1, wait_timeout=1)
+        slot = limiter.acquire()
+        threading.Timer(0.1, slot.release).start()
+        started = time.monotonic()
+        acquired = asyncio.run(limiter.aacquire())
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+        acquired.release()
+
+        slot = limiter.acquire()
+        with self.assertRaises(UpstreamBusy):
+            asyncio.run(limiter.aacquire(timeout=0.05))
+        slot.release()
+
+    def test_dropped_slot_is_released(self):
+        limiter = UpstreamLimiter(max_in_flight=1, max_queue=0, wait_timeout=0)
+        limiter.acquire()
+        gc.collect()
+        slot = limiter.try_acquire()
+        self.assertIsNotNone(slot)
+        slot.release()
+        # 重複釋放不會多歸還名額
+        slot.release()
+        held = limiter.acquire()
+        self.assertIsNone(limiter.try_acquire())
+        held.release()
@@ -0,0 +1,97 @@
+import datetime
+from unittest import mock
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from api.models import Chemist, ChatHistory, ChatSummary, Conversation
+from api.services.ai_service import AIService
+from api.services.context_builder import ContextBuilder, SUMMARY_PREFIX
+from api.services.tokens import estimate_messages_tokens, estimate_tokens, truncate_to_tokens
+from api.tasks import update_chat_summary
+
+START = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def rows(*contents):
+    """由新到舊的聊天記錄，ID 與時間遞減"""
+    return [
+        {'id': n, 'role': 'user' if n % 2 else 'assistant', 'content': content,
+         'timestamp': START + datetime.timedelta(minutes=n)}
+        for n, content in ((len(contents) - i, content) for i, content in enumerate(contents))
+    ]
+
+
+@override_settings(AI_CONTEXT_TOKEN_BUDGET=100, AI_CONTEXT_MAX_MESSAGES=20)
+class ContextBuilderTest(SimpleTestCase):
+    def setUp(self):
+        self.builder = ContextBuilder()
+
+    def test_keeps_recent_turns_within_budget(self):
+        window = self.builder.fit(rows('新' * 40, '中' * 40, '舊' * 40), None)
+        self.assertEqual([m['content'] for m in window.messages], ['中' * 40, '新' * 40])
+        self.assertLessEqual(window.tokens, 100)
+        self.assertEqual(window.oldest_id, 2)
+        self.assertTrue(window.needs_summary)
+
+    def test_skips_current_user_message(self):
+        history = [{'id': 3, 'role': 'user', 'content': '你好', 'timestamp': START}]
+        window = self.builder.fit(history, None, user_message='你好')
+        self.assertEqual(window.messages, [])
+        self.assertFalse(window.needs_summary)
+
+    def test_summary_replaces_summarized_turns(self):
+        history = rows('新問題', '舊問題')
+        summary = ChatSummary(content='談過燃素說', last_message_id=1, last_message_timestamp=history[1]['timestamp'])
+        window = self.builder.fit(history, summary)
+        self.assertEqual(window.messages[0], {'role': 'system', 'content': SUMMARY_PREFIX + '談過燃素說'})
+        self.assertEqual([m['content'] for m in window.messages[1:]], ['新問題'])
+        self.assertFalse(window.needs_summary)
+
+    def test_summary_cutoff_follows_timestamp_not_id(self):
+        # write-behind 寫入時較新的訊息可能拿到較小的 id
+        history = rows('新問題', '舊問題')
+        history[0]['id'], history[1]['id'] = 1, 2
+        summary = ChatSummary(content='談過燃素說', last_message_id=2, last_message_timestamp=history[1]['timestamp'])
+        window = self.builder.fit(history, summary)
+        self.assertEqual([m['content'] for m in window.messages[1:]], ['新問題'])
+        self.assertEqual(window.oldest, (history[0]['timestamp'], 1))
+
+    def test_truncates_oversized_latest_turn(self):
+        window = self.builder.fit(rows('長' * 500), None)
+        self.assertEqual(len(window.messages), 1)
+        self.assertLessEqual(estimate_messages_tokens(window.messages) - 3, 100)
+
+
+@override_settings(AI_CONTEXT_TOKEN_BUDGET=50, AI_CONTEXT_MAX_MESSAGES=20, AI_SUMMARY_BATCH_SIZE=20,
+                   CHAT_WRITE_BEHIND_ENABLED=False)
+class UpdateChatSummaryTest(TestCase):
+    def test_summarizes_turns_before_window_in_timestamp_order(self):
+        chemist = Chemist.objects.create(name='拉瓦錫')
+        conversation = Conversation.objects.create(chemist=chemist)
+        now = timezone.now()
+        # id 順序與時間順序不同：最舊的兩則最後才寫入
+        contents = ['第三則' * 10, '第四則' * 10, '第一則' * 10, '第二則' * 10]
+        minutes = [3, 4, 1, 2]
+        for content, minute in zip(contents, minutes):
+            ChatHistory.objects.create(chemist=chemist, conversation=conversation, role='user', content=content,
+                                       timestamp=now + datetime.timedelta(minutes=minute))
+
+        # AIService 是單例，上下文預算在建立時讀取
+        with mock.patch.object(AIService(), 'context_builder', ContextBuilder()), \
+                mock.patch.object(AIService, 'summarize', return_value='摘要') as summarize:
+            result = update_chat_summary.apply(args=[str(conversation.pk)]).get()
+        summarized = [turn['content'] for turn in summarize.call_args.args[2]]
+        self.assertEqual(summarized, ['第一則' * 10, '第二則' * 10, '第三則' * 10])
+        self.assertEqual(result['summarized'], 3)
+
+        summary = ChatSummary.objects.get(conversation=conversation)
+        last = ChatHistory.objects.get(content='第三則' * 10)
+        self.assertEqual((summary.last_message_timestamp, summary.last_message_id), (last.timestamp, last.id))
+        window = ContextBuilder().build(conversation)
+        self.assertEqual([m['content'] for m in window.messages[1:]], ['第四則' * 10])
+
+
+class TokensTest(SimpleTestCase):
+    def test_truncate_to_tokens(self):
+        text = '氧氣 oxygen ' * 50
+        self.assertLessEqual(estimate_tokens(truncate_to_tokens(text, 30)), 30)
+        self.assertEqual(truncate_to_tokens('短', 30), '短')
@@ -0,0 +1,118 @@
+from unittest import mock
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from api.models import Chemist, ChatHistory, Conversation
+from api.services import conversations
+from api.services.ai_service import AIService
+from api.services.concurrency import UpstreamBusy
+from api.services.context_builder import ContextBuilder
+
+
+def fake_reply(chemist, message, history=None, deadline=None, conversation=None):
+    return f'回覆：{message}'
+
+
+@override_settings(AI_SUMMARY_ENABLED=False)
+@mock.patch.object(AIService, 'generate_response', side_effect=fake_reply)
+class ConversationAPITest(TestCase):
+    def setUp(self):
+        self.chemist = Chemist.objects.create(name='居禮')
+        self.send_url = reverse('scientist-send-message', args=[self.chemist.id])
+        self.history_url = reverse('scientist-chat-history', args=[self.chemist.id])
+
+    def send(self, client, message, **data):
+        return client.post(self.send_url, {'message': message, **data}, format='json')
+
+    def test_visitors_only_see_their_own_conversation(self, generate_response):
+        alice, bob = APIClient(), APIClient()
+        first = self.send(alice, '鐳是怎麼發現的')
+        self.send(bob, '你好')
+        self.send(alice, '釙呢')
+
+        conversation_id = first.data['data']['conversation_id']
+        self.assertEqual(Conversation.objects.count(), 2)
+        self.assertEqual(ChatHistory.objects.filter(conversation_id=conversation_id).count(), 4)
+        # 同一個 session 未指定對話時延續最近的對話
+        self.assertEqual(str(generate_response.call_args.kwargs['conversation'].pk), conversation_id)
+
+        history = bob.get(self.history_url)
+        self.assertEqual([row['content'] for row in history.data['data']], ['你好', '回覆：你好'])
+
+    def test_conversation_id_selects_conversation(self, generate_response):
+        client = APIClient()
+        conversation = Conversation.objects.create(chemist=self.chemist)
+        self.send(client, '問題一', conversation_id=str(conversation.pk))
+
+        history = APIClient().get(self.history_url, {'conversation_id': str(conversation.pk)})
+        self.assertEqual(len(history.data['data']), 2)
+        self.assertEqual(history['X-Conversation-Id'], str(conversation.pk))
+
+    def test_upstream_busy_does_not_store_user_message(self, generate_response):
+        client = APIClient()
+        generate_response.side_effect = UpstreamBusy(5)
+        response = self.send(client, '鐳是怎麼發現的')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '5')
+        self.assertFalse(ChatHistory.objects.exists())
+
+        # 客戶端重送後只有一組問答
+        generate_response.side_effect = fake_reply
+        self.send(client, '鐳是怎麼發現的')
+        history = client.get(self.history_url)
+        self.assertEqual([row['content'] for row in history.data['data']], ['鐳是怎麼發現的', '回覆：鐳是怎麼發現的'])
+
+    def test_rejects_conversation_of_another_user_or_chemist(self, generate_response):
+        owner = User.objects.create_user('marie')
+        private = Conversation.objects.create(chemist=self.chemist, user=owner)
+        other = Conversation.objects.create(chemist=Chemist.objects.create(name='道耳吞'))
+
+        for conversation in (private, other):
+            response = self.send(APIClient(), '你好', conversation_id=str(conversation.pk))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.send(APIClient(), '你好', conversation_id='not-a-uuid')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(ChatHistory.objects.exists())
+
+    def test_clear_history_only_removes_own_conversation(self, generate_response):
+        alice, bob = APIClient(), APIClient()
+        self.send(alice, '你好')
+        self.send(bob, '你好')
+
+        with mock.patch('api.views.chemist.delete_conversation.delay') as delay:
+            delay.return_value.id = 'job-1'
+            response = alice.delete(reverse('scientist-clear-history', args=[self.chemist.id]))
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(Conversation.objects.filter(deleted_at__isnull=True).count(), 1)
+        delay.assert_called_once_with(response.data['data']['conversation_id'])
+        self.assertEqual(alice.get(self.history_url).data['data'], [])
+        self.assertEqual(len(bob.get(self.history_url).data['data']), 2)
+
+    def test_start_new_conversation(self, generate_response):
+        client = APIClient()
+        self.send(client, '你好')
+        url = reverse('scientist-conversations', args=[self.chemist.id])
+        created = client.post(url)
+        self.assertEqual(created.status_code, status.HTTP_201_CREATED)
+
+        listed = client.get(url)
+        self.assertEqual([row['id'] for row in listed.data['data']][0], created.data['data']['id'])
+        self.assertEqual(len(listed.data['data']), 2)
+
+
+class ConversationContextTest(TestCase):
+    def test_context_is_scoped_to_conversation(self):
+        chemist = Chemist.objects.create(name='拉瓦錫')
+        mine, theirs = (Conversation.objects.create(chemist=chemist) for _ in range(2))
+        conversations.add_message(mine, 'user', '燃燒是什麼')
+        conversations.add_message(theirs, 'user', '別人的問題')
+        conversations.add_message(mine, 'assistant', '與氧結合')
+
+        builder = ContextBuilder(budget=1000, max_messages=10)
+        window = builder.build(mine)
+        self.assertEqual([message['content'] for message in window.messages], ['燃燒是什麼', '與氧結合'])
+
+        windows = builder.build_many([mine, theirs])
+        self.assertEqual([message['content'] for message in windows[theirs.pk].messages], ['別人的問題'])
@@ -0,0 +1,66 @@
+from unittest import mock
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from api.models import Chemist, ChatHistory, Conversation
+from api.services import fuzzy_cache
+from api.services.fuzzy_cache import FuzzyReplyCache
+import fakeredis
+import io
+import time
+
+QUESTIONS = ['你是怎麼發現氧氣的呢', '請介紹一下質量守恆定律', '請解釋金屬煅燒後變重的原因']
+
+
+@override_settings(AI_FUZZY_CACHE_ENABLED=True, AI_FUZZY_CACHE_MAX_ENTRIES=2)
+class FuzzyReplyCacheTest(TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        patcher = mock.patch.object(fuzzy_cache, 'get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.chemist = Chemist.objects.create(name='拉瓦錫')
+        self.cache = FuzzyReplyCache()
+
+    def test_oldest_entries_are_evicted_beyond_limit(self):
+        for question in QUESTIONS:
+            self.cache.add(self.chemist, question, f'答：{question}')
+
+        namespace = self.cache._namespace(self.chemist)
+        self.assertEqual(self.redis.hlen(f"{namespace}:e"), 2)
+        self.assertEqual(self.redis.zcard(f"{namespace}:t"), 2)
+        self.assertIsNone(self.cache.lookup(self.chemist, QUESTIONS[0]))
+        self.assertEqual(self.cache.lookup(self.chemist, QUESTIONS[2]), f'答：{QUESTIONS[2]}')
+        # 被淘汰的問句也從 LSH 分桶移除
+        for key in self.cache._band_keys(namespace, QUESTIONS[0]):
+            self.assertEqual(self.redis.scard(key), 0)
+
+    def test_entries_older_than_ttl_are_evicted(self):
+        with mock.patch.object(fuzzy_cache.time, 'time', return_value=time.time() - 10):
+            self.cache.add(self.chemist, QUESTIONS[0], '舊的回答')
+        with override_settings(AI_FUZZY_CACHE_TTL=5):
+            self.cache.add(self.chemist, QUESTIONS[1], '新的回答')
+        self.assertIsNone(self.cache.lookup(self.chemist, QUESTIONS[0]))
+        self.assertEqual(self.cache.lookup(self.chemist, QUESTIONS[1]), '新的回答')
+
+    def test_clear_removes_every_persona_version(self):
+        self.cache.add(self.chemist, QUESTIONS[0], '回答')
+        self.chemist.description = '新的人設'
+        self.chemist.save()
+        self.cache.add(self.chemist, QUESTIONS[1], '回答')
+
+        self.assertGreater(self.cache.clear(self.chemist), 0)
+        self.assertEqual(list(self.redis.scan_iter(match=f"{FuzzyReplyCache.KEY_PREFIX}:{self.chemist.id}:*")), [])
+
+    def test_rebuild_skips_deleted_chemists(self):
+        deleted = Chemist.objects.create(name='普利斯特里', deleted_at=timezone.now())
+        for chemist in (self.chemist, deleted):
+            conversation = Conversation.objects.create(chemist=chemist)
+            ChatHistory.objects.create(chemist=chemist, conversation=conversation, role='user', content=QUESTIONS[0])
+            ChatHistory.objects.create(chemist=chemist, conversation=conversation, role='assistant', content='回答')
+
+        output = io.StringIO()
+        call_command('rebuild_fuzzy_cache', stdout=output)
+        self.assertIn('拉瓦錫：已索引 1 組問答', output.getvalue())
+        self.assertNotIn('普利斯特里', output.getvalue())
+        self.assertEqual(list(self.redis.scan_iter(match=f"{FuzzyReplyCache.KEY_PREFIX}:{deleted.id}:*")), [])
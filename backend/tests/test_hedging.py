@@ -0,0 +1,112 @@
+from django.test import SimpleTestCase
+from api.services.concurrency import UpstreamLimiter
+from api.services.deadline import Deadline, DeadlineExceeded
+from api.services.hedging import HEDGES, RETRIES, HedgedCaller, HedgePolicy
+import asyncio
+import threading
+import time
+
+
+class _BlockingStream:
+    """模擬已收到回應標頭、但遲遲沒有首字的上游串流；close() 由其他執行緒呼叫時結束讀取"""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self.closed.wait(10)
+        raise ConnectionError('連線已關閉')
+
+    def close(self):
+        self.closed.set()
+
+
+class HedgedCallerTest(SimpleTestCase):
+    def setUp(self):
+        self.limiter = UpstreamLimiter(max_in_flight=4, max_queue=4, wait_timeout=1)
+        self.caller = HedgedCaller(self.limiter, HedgePolicy(
+            default_delay=0.05, min_samples=10 ** 6, backoff_base=0.01, backoff_cap=0.01
+        ))
+
+    def test_hedge_wins_when_primary_is_slow(self):
+        calls = []
+        lock = threading.Lock()
+
+        def start(timeout):
+            with lock:
+                calls.append(timeout)
+                first = len(calls) == 1
+            time.sleep(1 if first else 0.01)
+            return '對沖' if not first else '主要'
+
+        started = time.monotonic()
+        result = self.caller.call(start, Deadline(5), 'test-hedge')
+        self.assertEqual(result, '對沖')
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(HEDGES.value(mode='test-hedge', outcome='won'), 1)
+
+    def test_retries_after_failure(self):
+        calls = []
+
+        def start(timeout):
+            calls.append(timeout)
+            if len(calls) == 1:
+                raise ConnectionError('上游中斷')
+            return '重試成功'
+
+        self.assertEqual(self.caller.call(start, Deadline(5), 'test-retry'), '重試成功')
+        self.assertEqual(RETRIES.value(mode='test-retry'), 1)
+
+    def test_stream_yields_winner_chunks_and_releases_slots(self):
+        chunks = list(self.caller.stream(lambda timeout: iter(['元', '素']), Deadline(5), 'test-stream'))
+        self.assertEqual(chunks, ['元', '素'])
+        # 所有嘗試結束後名額都已歸還
+        time.sleep(0.05)
+        slots = [self.limiter.try_acquire() for _ in range(4)]
+        self.assertTrue(all(slots))
+        for slot in slots:
+            slot.release()
+
+    def test_losing_stream_is_closed_and_releases_slot(self):
+        limiter = UpstreamLimiter(max_in_flight=2, max_queue=0, wait_timeout=0)
+        caller = HedgedCaller(limiter, self.caller.policy)
+        primary = _BlockingStream()
+
+        def start(timeout):
+            if primary.started.is_set():
+                return iter(['氧', '氣'])
+            primary.started.set()
+            return primary
+
+        started = time.monotonic()
+        chunks = list(caller.stream(start, Deadline(5), 'test-cancel'))
+        self.assertEqual(chunks, ['氧', '氣'])
+        # 主要嘗試仍阻塞在讀取中，取消時被關閉，名額立即歸還
+        self.assertTrue(primary.closed.wait(1))
+        time.sleep(0.05)
+        slots = [limiter.try_acquire() for _ in range(2)]
+        self.assertTrue(all(slots))
+        self.assertLess(time.monotonic() - started, 1)
+        for slot in slots:
+            slot.release()
+
+    def test_deadline_exceeded(self):
+        caller = HedgedCaller(self.limiter, HedgePolicy(enabled=False))
+        with self.assertRaises(DeadlineExceeded):
+            caller.call(lambda timeout: time.sleep(1), Deadline(0.1), 'test-deadline')
+
+    def test_async_hedge(self):
+        calls = []
+
+        async def start(timeout):
+            calls.append(timeout)
+            await asyncio.sleep(1 if len(calls) == 1 else 0.01)
+            return len(calls)
+
+        result = asyncio.run(self.caller.acall(start, Deadline(5), 'test-async'))
+        self.assertEqual(result, 2)
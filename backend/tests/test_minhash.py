@@ -0,0 +1,32 @@
+from django.test import SimpleTestCase
+from api.services.minhash import FuzzyMatcher, LSHIndex, MinHasher, jaccard, shingles
+
+
+class MinHasherTest(SimpleTestCase):
+    def test_estimate_close_to_jaccard(self):
+        hasher = MinHasher(num_perm=256)
+        a, b = '你怎麼發現氧氣的', '氧氣是怎麼被你發現的'
+        exact = jaccard(shingles(a), shingles(b))
+        estimate = MinHasher.estimate_similarity(hasher.signature(a), hasher.signature(b))
+        self.assertAlmostEqual(estimate, exact, delta=0.1)
+
+    def test_identical_text_identical_signature(self):
+        hasher = MinHasher()
+        self.assertTrue((hasher.signature('介紹一下你自己') == hasher.signature('介绍一下你自己')).all())
+
+
+class LSHIndexTest(SimpleTestCase):
+    def setUp(self):
+        self.index = LSHIndex(MinHasher(), bands=64)
+        self.matcher = FuzzyMatcher(threshold=0.45)
+        self.index.insert('oxygen', '你怎麼發現氧氣的')
+        self.index.insert('intro', '介紹一下你自己')
+
+    def test_paraphrase_hits(self):
+        self.assertEqual(self.index.query('氧氣是怎麼被你發現的', self.matcher)[0], 'oxygen')
+
+    def test_different_subject_misses(self):
+        self.assertIsNone(self.index.query('你怎麼發現氫氣的', self.matcher))
+
+    def test_short_follow_up_not_eligible(self):
+        self.assertFalse(self.matcher.eligible('那後來呢？'))
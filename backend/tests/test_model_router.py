@@ -0,0 +1,64 @@
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from api.services import telemetry
+from api.services.model_router import FAST, STRONG, ModelRouter
+
+
+class ModelRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = ModelRouter(enabled=True, fast_model='fast-model', strong_model='strong-model',
+                                  answer_max_chars=200, tokens_per_char=1.5, max_tokens=1000)
+
+    def test_output_cap_derived_from_answer_length(self):
+        self.assertEqual(self.router.answer_tokens, 360)
+        capped = ModelRouter(enabled=True, fast_model='f', strong_model='s', answer_max_chars=200,
+                             tokens_per_char=1.5, max_tokens=300)
+        self.assertEqual(capped.answer_tokens, 300)
+
+    def test_greeting_goes_to_fast_model_with_smaller_cap(self):
+        route = self.router.route('你好！')
+        self.assertEqual((route.tier, route.model, route.reason), (FAST, 'fast-model', 'greeting'))
+        self.assertEqual(route.max_tokens, 180)
+
+    def test_short_question_goes_to_fast_model(self):
+        route = self.router.route('你在哪裡出生？')
+        self.assertEqual(route.tier, FAST)
+        self.assertEqual(route.max_tokens, 360)
+
+    def test_reasoning_question_goes_to_strong_model(self):
+        route = self.router.route('為什麼燃燒需要氧氣？')
+        self.assertEqual((route.tier, route.model), (STRONG, 'strong-model'))
+        self.assertIn('complex', route.reason)
+
+    def test_english_keywords_match_whole_words_only(self):
+        self.assertEqual(self.router.route('Why does iron rust?').tier, STRONG)
+        self.assertEqual(self.router.route('請問why會生鏽').tier, STRONG)
+        self.assertEqual(self.router.route('Show me').tier, FAST)
+        self.assertEqual(self.router.route('However, thanks').tier, FAST)
+
+    def test_formula_in_deep_conversation_goes_to_strong_model(self):
+        history = [{'role': 'user', 'content': '問題'}, {'role': 'assistant', 'content': '回答'}] * 4
+        self.assertEqual(self.router.route('那 H2O 呢？').tier, FAST)
+        self.assertEqual(self.router.route('那 H2O 呢？', history).tier, STRONG)
+
+    def test_disabled_router_keeps_strong_model_and_max_tokens(self):
+        router = ModelRouter(enabled=False, fast_model='fast-model', strong_model='strong-model',
+                             answer_max_chars=200, tokens_per_char=1.5, max_tokens=1000)
+        route = router.route('你好')
+        self.assertEqual((route.model, route.max_tokens), ('strong-model', 1000))
+
+
+@override_settings(AI_USAGE_ROLLUP_ENABLED=False, AI_MODEL_PRICES={'fast-model': [0.5, 1.0]})
+class RouteTelemetryTest(SimpleTestCase):
+    def test_route_decision_and_cost_are_recorded(self):
+        route = ModelRouter(enabled=True, fast_model='fast-model', strong_model='strong-model',
+                            answer_max_chars=200, tokens_per_char=1.5, max_tokens=1000).route('嗨')
+        with self.assertLogs('api.services.telemetry', 'INFO') as logs:
+            telemetry.record(42, 'fast-model', 'complete', 0.3, prompt_tokens=1000,
+                             completion_tokens=500, route=route)
+
+        self.assertIn('"tier": "fast"', logs.output[0])
+        self.assertIn('"cost_usd": 1.0', logs.output[0])
+        self.assertEqual(telemetry.COST.value(chemist='42', model='fast-model'), 1.0)
+        self.assertEqual(telemetry.ROUTE_LATENCY.count(tier='fast', model='fast-model'), 1)
+        self.assertIsNone(telemetry.estimate_cost('unknown-model', 1000, 1000))
@@ -0,0 +1,74 @@
+import datetime
+from urllib.parse import parse_qs, urlparse
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from api.models import Chemist, ChatHistory, Conversation, HistoricalEvent
+from api.pagination import decode_cursor
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def walk(self, url, link='next', **params):
+        """沿著游標翻完所有頁，回傳每頁的資料與最後一頁的回應"""
+        pages = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['status'], 'success')
+            pages.append(response.data['data'])
+            if not response.data['pagination'][link]:
+                return pages, response
+            response = self.client.get(response.data['pagination'][link])
+
+    def test_events_follow_year_then_id_without_count(self):
+        chemist = Chemist.objects.create(name='拉瓦錫')
+        years = [1789, 1774, 1774, 1783, 1774, 1777, 1789]
+        for year in years:
+            HistoricalEvent.objects.create(chemist=chemist, title=f'{year}', year=year)
+
+        url = reverse('event-list')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, {'page_size': 3})
+        self.assertFalse(any('COUNT(' in query['sql'].upper() for query in queries.captured_queries))
+
+        pages, last = self.walk(url, page_size=3)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        rows = [row for page in pages for row in page]
+        self.assertEqual([row['year'] for row in rows], sorted(years))
+        self.assertEqual(len({row['id'] for row in rows}), len(years))
+
+        # 從最後一頁往回翻得到相同的資料
+        back, _ = self.walk(last.data['pagination']['prev'], link='prev')
+        self.assertEqual([row['id'] for page in reversed(back) for row in page],
+                         [row['id'] for row in rows[:-1]])
+
+    def test_chat_history_starts_from_latest_messages(self):
+        chemist = Chemist.objects.create(name='居禮')
+        conversation = Conversation.objects.create(chemist=chemist)
+        start = timezone.now()
+        for i in range(5):
+            ChatHistory.objects.create(chemist=chemist, conversation=conversation, role='user', content=str(i),
+                                       timestamp=start + datetime.timedelta(seconds=i))
+
+        url = reverse('scientist-chat-history', args=[chemist.id])
+        response = self.client.get(url, {'conversation_id': str(conversation.pk), 'page_size': 2})
+        self.assertEqual([row['content'] for row in response.data['data']], ['3', '4'])
+        self.assertIsNone(response.data['pagination']['next'])
+
+        cursor = parse_qs(urlparse(response.data['pagination']['prev']).query)['cursor'][0]
+        self.assertEqual(decode_cursor(cursor)[1], 'p')
+
+        older, _ = self.walk(response.data['pagination']['prev'], link='prev')
+        self.assertEqual([[row['content'] for row in page] for page in older], [['1', '2'], ['0']])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse('scientist-list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['status'], 'error')
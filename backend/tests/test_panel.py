@@ -0,0 +1,108 @@
+from unittest import mock
+import fakeredis
+import json
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from api.models import Chemist, ChatHistory, Conversation
+from api.services import chat_buffer
+from api.services.ai_service import AIService
+from api.services.concurrency import UpstreamBusy
+
+
+def fake_reply(chemist, message, history=None, deadline=None):
+    if chemist.name == '波以耳':
+        raise UpstreamBusy(4)
+    if chemist.name == '道耳頓':
+        return AIService.FALLBACK_MESSAGE
+    return f'{chemist.name}：{message}'
+
+
+def sse_events(response) -> list:
+    body = b''.join(response.streaming_content).decode('utf-8')
+    return [
+        (block.split('\n')[0].removeprefix('event: '), json.loads(block.split('\n')[1].removeprefix('data: ')))
+        for block in body.strip().split('\n\n')
+    ]
+
+
+@override_settings(AI_PANEL_MAX_CHEMISTS=4, AI_SUMMARY_ENABLED=False)
+class PanelAPITest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.chemists = [Chemist.objects.create(name=name) for name in ('拉瓦錫', '門得列夫', '波以耳')]
+        self.url = reverse('panel-ask')
+
+    @mock.patch.object(AIService, 'generate_response', side_effect=fake_reply)
+    def test_ask_panel(self, generate_response):
+        response = self.client.post(self.url, {
+            'message': '什麼是元素？',
+            'chemist_ids': [chemist.id for chemist in self.chemists]
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        answers = response.data['data']['answers']
+        self.assertEqual([answer['chemist_name'] for answer in answers], ['拉瓦錫', '門得列夫', '波以耳'])
+        self.assertEqual(answers[0]['assistant_message']['content'], '拉瓦錫：什麼是元素？')
+        self.assertEqual(answers[2]['status'], 'busy')
+        # 忙碌的化學家不寫入記錄
+        self.assertEqual(ChatHistory.objects.count(), 4)
+
+    @mock.patch.object(AIService, 'generate_response', side_effect=fake_reply)
+    def test_fallback_answers_are_errors_and_not_saved(self, generate_response):
+        dalton = Chemist.objects.create(name='道耳頓')
+        response = self.client.post(self.url, {
+            'message': '什麼是原子？', 'chemist_ids': [self.chemists[0].id, dalton.id]
+        }, format='json')
+
+        answers = response.data['data']['answers']
+        self.assertEqual([answer['status'] for answer in answers], ['success', 'error'])
+        self.assertEqual(answers[1]['message'], AIService.FALLBACK_MESSAGE)
+        self.assertNotIn('assistant_message', answers[1])
+        self.assertFalse(ChatHistory.objects.filter(chemist=dalton).exists())
+        conversation = Conversation.objects.get(chemist=self.chemists[0])
+        self.assertEqual(conversation.last_active_at, ChatHistory.objects.get(
+            conversation=conversation, role='assistant'
+        ).timestamp)
+
+    @override_settings(CHAT_WRITE_BEHIND_ENABLED=True)
+    @mock.patch.object(AIService, 'generate_response', side_effect=fake_reply)
+    def test_history_goes_through_write_behind_buffer(self, generate_response):
+        redis = fakeredis.FakeRedis(decode_responses=True)
+        with mock.patch.object(chat_buffer, 'get_redis', return_value=redis):
+            self.client.post(self.url, {
+                'message': '什麼是元素？', 'chemist_ids': [chemist.id for chemist in self.chemists[:2]]
+            }, format='json')
+            self.assertFalse(ChatHistory.objects.exists())
+            self.assertEqual(redis.xlen(chat_buffer.STREAM_KEY), 4)
+
+            chat_buffer.ChatWriteBuffer().flush()
+        rows = ChatHistory.objects.order_by('timestamp', 'id')
+        self.assertEqual(rows.count(), 4)
+        self.assertEqual(len({row.message_uuid for row in rows}), 4)
+
+    @mock.patch.object(AIService, 'generate_response', side_effect=fake_reply)
+    def test_stream_returns_429_when_every_chemist_is_busy(self, generate_response):
+        response = self.client.post(f"{self.url}?stream=1", {
+            'message': '什麼是元素？', 'chemist_ids': [self.chemists[2].id]
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '4')
+
+        response = self.client.post(f"{self.url}?stream=1", {
+            'message': '什麼是元素？', 'chemist_ids': [self.chemists[2].id, self.chemists[0].id]
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        events = sse_events(response)
+        self.assertEqual([name for name, _ in events], ['answer', 'answer', 'done'])
+        self.assertEqual(sorted(data['status'] for _, data in events[:2]), ['busy', 'success'])
+        self.assertEqual(ChatHistory.objects.count(), 2)
+
+    def test_rejects_unknown_chemist(self):
+        response = self.client.post(self.url, {'message': '你好', 'chemist_ids': [999]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_rejects_too_many_chemists(self):
+        response = self.client.post(self.url, {'message': '你好', 'chemist_ids': list(range(1, 6))}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
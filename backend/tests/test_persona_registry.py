@@ -0,0 +1,46 @@
+from datetime import timedelta
+from unittest import mock
+from django.test import SimpleTestCase
+from django.utils import timezone
+from api.models import Chemist
+from api.services import persona_registry as registry_module
+from api.services.persona_registry import PersonaRegistry
+from api.services.tokens import estimate_tokens
+
+
+class PersonaRegistryTest(SimpleTestCase):
+    def setUp(self):
+        # 不連線 Redis，只測試行程內快取
+        mock.patch.object(registry_module, 'get_redis', side_effect=ConnectionError).start()
+        mock.patch.object(PersonaRegistry, '_ensure_listener').start()
+        self.addCleanup(mock.patch.stopall)
+
+        self.registry = PersonaRegistry(max_size=2)
+        self.chemist = Chemist(
+            id=1, name='拉瓦錫', birth_year=1743, death_year=1794, updated_at=timezone.now()
+        )
+
+    def test_compiles_once_per_version(self):
+        with mock.patch.object(registry_module, 'render_persona_prompt', wraps=registry_module.render_persona_prompt) as render:
+            first = self.registry.get(self.chemist)
+            second = self.registry.get(self.chemist)
+        self.assertIs(first, second)
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(first['tokens'], estimate_tokens(first['prompt']))
+
+    def test_new_version_recompiles(self):
+        first = self.registry.get(self.chemist)
+        self.chemist.personality = '嚴謹'
+        self.chemist.updated_at += timedelta(seconds=1)
+        second = self.registry.get(self.chemist)
+        self.assertNotEqual(first['version'], second['version'])
+        self.assertIn('嚴謹', second['prompt'])
+
+    def test_system_prompt_overrides_template(self):
+        self.chemist.system_prompt = '你是拉瓦錫。'
+        self.assertEqual(self.registry.get(self.chemist)['prompt'], '你是拉瓦錫。')
+
+    def test_evict_local(self):
+        first = self.registry.get(self.chemist)
+        self.registry.evict_local(self.chemist.id)
+        self.assertIsNot(self.registry.get(self.chemist), first)
@@ -0,0 +1,65 @@
+from unittest import mock
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from api.models import Chemist, PrecomputedAnswer
+from api.services.ai_service import AIService
+from api.services.precomputed import canonical_questions, precomputed_answers
+
+
+class FakeService:
+    def __init__(self, fail=()):
+        self.calls = []
+        self.fail = fail
+
+    def precompute_answer(self, chemist, question):
+        self.calls.append(question)
+        if question in self.fail:
+            raise ConnectionError('上游中斷')
+        return f'{chemist.name}答：{question}'
+
+
+@override_settings(AI_PRECOMPUTE_ENABLED=True, AI_PRECOMPUTE_ON_SAVE=False, AI_PRECOMPUTE_CONCURRENCY=2)
+class PrecomputedAnswersTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.chemist = Chemist.objects.create(name='瑪麗·居里')
+        self.questions = canonical_questions(self.chemist)
+
+    def test_generate_and_lookup_normalized_question(self):
+        result = precomputed_answers.generate(self.chemist, FakeService())
+        self.assertEqual(result, {'generated': len(self.questions), 'skipped': 0, 'failed': 0})
+        self.assertIn('什麼是放射性？', self.questions)
+        # 全半形、空白與結尾標點不影響比對
+        self.assertEqual(
+            precomputed_answers.lookup(self.chemist, '  什麼是放射性?'), '瑪麗·居里答：什麼是放射性？'
+        )
+        self.assertIsNone(precomputed_answers.lookup(self.chemist, '鐳有多重？'))
+
+    def test_only_missing_answers_are_generated(self):
+        service = FakeService(fail={'什麼是放射性？'})
+        self.assertEqual(precomputed_answers.generate(self.chemist, service)['failed'], 1)
+
+        retry = FakeService()
+        result = precomputed_answers.generate(self.chemist, retry)
+        self.assertEqual(retry.calls, ['什麼是放射性？'])
+        self.assertEqual(result['skipped'], len(self.questions) - 1)
+
+    def test_persona_change_replaces_old_answers(self):
+        precomputed_answers.generate(self.chemist, FakeService())
+        self.chemist.personality = '堅毅'
+        self.chemist.save()
+
+        self.assertIsNone(precomputed_answers.lookup(self.chemist, '什麼是放射性？'))
+        precomputed_answers.generate(self.chemist, FakeService())
+        self.assertEqual(PrecomputedAnswer.objects.count(), len(self.questions))
+        self.assertEqual(set(PrecomputedAnswer.objects.values_list('persona_version', flat=True)), {
+            PrecomputedAnswer.objects.first().persona_version
+        })
+        self.assertIsNotNone(precomputed_answers.lookup(self.chemist, '什麼是放射性？'))
+
+    def test_generate_response_serves_precomputed_answer(self):
+        precomputed_answers.generate(self.chemist, FakeService())
+        with mock.patch.object(AIService, '_get_chat_history') as get_chat_history:
+            answer = AIService().generate_response(self.chemist, '你是怎麼發現鐳的')
+        self.assertEqual(answer, '瑪麗·居里答：你是怎麼發現鐳的？')
+        get_chat_history.assert_not_called()
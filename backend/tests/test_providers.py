@@ -0,0 +1,46 @@
+from django.test import SimpleTestCase, override_settings
+from api.services.providers import MockProvider, MockProviderError, OpenAIProvider, get_provider
+
+MESSAGES = [
+    {'role': 'system', 'content': '你現在扮演拉瓦錫（1743-1794）。'},
+    {'role': 'user', 'content': '燃燒是什麼？'},
+]
+
+
+class MockProviderTest(SimpleTestCase):
+    def provider(self, **kwargs):
+        options = {'ttfb_ms': 0, 'tokens_per_sec': 1_000_000, 'error_rate': 0, 'seed': 1}
+        options.update(kwargs)
+        return MockProvider(**options)
+
+    def test_deterministic_persona_text(self):
+        first = self.provider().complete('mock', MESSAGES, max_tokens=500, temperature=0.7)
+        second = self.provider().complete('mock', MESSAGES, max_tokens=500, temperature=0.7)
+        self.assertEqual(first.content, second.content)
+        self.assertTrue(first.content.startswith('我是拉瓦錫。'))
+        self.assertGreater(first.completion_tokens, 0)
+
+    def test_stream_matches_completion(self):
+        provider = self.provider()
+        streamed = ''.join(provider.stream('mock', MESSAGES, max_tokens=500, temperature=0.7))
+        self.assertEqual(streamed, provider.complete('mock', MESSAGES, max_tokens=500, temperature=0.7).content)
+
+    def test_max_tokens_caps_output(self):
+        self.assertEqual(len(self.provider().complete('mock', MESSAGES, max_tokens=10, temperature=0.7).content), 10)
+
+    def test_error_rate(self):
+        with self.assertRaises(MockProviderError):
+            self.provider(error_rate=1).complete('mock', MESSAGES, max_tokens=500, temperature=0.7)
+
+    def test_unknown_provider(self):
+        with self.assertRaises(ValueError):
+            get_provider('unknown')
+
+
+@override_settings(OPENAI_API_KEY='test')
+class OpenAIProviderTest(SimpleTestCase):
+    def test_sdk_retries_are_disabled(self):
+        # 重試只由 HedgedCaller 負責
+        provider = OpenAIProvider()
+        self.assertEqual(provider.client.max_retries, 0)
+        self.assertEqual(provider.async_client.max_retries, 0)
@@ -0,0 +1,49 @@
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from api.models import Chemist
+from api.services.response_cache import ResponseCache, normalize_message
+
+LOCMEM_CACHE = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+class NormalizeMessageTest(SimpleTestCase):
+    def test_whitespace_and_width(self):
+        self.assertEqual(normalize_message('  你發現了 什麼？ '), normalize_message('你發現了 什麼?'))
+
+    def test_simplified_and_traditional(self):
+        self.assertEqual(normalize_message('你发现了什么？'), normalize_message('你發現了什麼？'))
+
+    def test_trailing_punctuation(self):
+        self.assertEqual(normalize_message('介紹一下你自己。'), normalize_message('介紹一下你自己'))
+
+
+@override_settings(CACHES=LOCMEM_CACHE, AI_RESPONSE_CACHE_ENABLED=True, AI_RESPONSE_CACHE_TTL=60)
+class ResponseCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.cache = ResponseCache()
+        self.chemist = Chemist(id=1, name='拉瓦錫', updated_at=timezone.now())
+
+    def test_hit_after_set(self):
+        history = [{'role': 'assistant', 'content': '您好！'}]
+        self.cache.set(self.chemist, '你發現了什麼？', history, '氧氣')
+        self.assertEqual(self.cache.get(self.chemist, '你发现了什么', history), '氧氣')
+
+    def test_persona_version_changes_key(self):
+        key = self.cache.make_key(self.chemist, '你好', [])
+        self.chemist.updated_at = timezone.now() + timezone.timedelta(seconds=1)
+        self.assertNotEqual(key, self.cache.make_key(self.chemist, '你好', []))
+
+    def test_history_changes_key(self):
+        self.assertNotEqual(
+            self.cache.make_key(self.chemist, '你好', []),
+            self.cache.make_key(self.chemist, '你好', [{'role': 'user', 'content': '嗨'}])
+        )
+
+    def test_opt_out(self):
+        self.chemist.response_cache_enabled = False
+        self.cache.set(self.chemist, '你好', [], '您好')
+        self.assertIsNone(self.cache.get(self.chemist, '你好', []))
@@ -0,0 +1,101 @@
+from unittest import skipUnless
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from api.models import Chemist, ChatHistory, Conversation, HistoricalEvent
+from api.services import search
+
+
+class QueryBuilderTest(SimpleTestCase):
+    def test_cjk_runs_become_bigram_phrases(self):
+        self.assertEqual(search.to_tsquery('拉瓦錫'), "('拉瓦' <-> '瓦錫')")
+        self.assertEqual(search.to_tsquery('氧'), "('氧':*)")
+        self.assertEqual(search.to_tsquery('Oxygen 燃燒，理論'),
+                         "('oxygen':*) & ('燃燒') & ('理論')")
+
+    def test_punctuation_only_query_has_no_terms(self):
+        self.assertIsNone(search.to_tsquery("!!! ' ..."))
+        self.assertEqual(search.to_tsquery("O'Brien"), "('o':*) & ('brien':*)")
+
+    def test_highlight_escapes_and_trims_around_first_match(self):
+        self.assertEqual(search.highlight('<b>氧氣</b>與燃燒', '燃燒'), '&lt;b&gt;氧氣&lt;/b&gt;與<mark>燃燒</mark>')
+        self.assertEqual(search.highlight('Oxygen theory', 'oxy'), '<mark>Oxy</mark>gen theory')
+        text = 'A' * 50 + '拉瓦錫' + 'B' * 50
+        snippet = search.highlight(text, '拉瓦錫', length=20)
+        self.assertTrue(snippet.startswith('…') and snippet.endswith('…'))
+        self.assertIn('<mark>拉瓦錫</mark>', snippet)
+
+
+@skipUnless(connection.vendor == 'postgresql', '需要 PostgreSQL 全文搜尋')
+class SearchAPITest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('search')
+        self.lavoisier = Chemist.objects.create(
+            name='安托萬·拉瓦錫 Antoine Lavoisier', achievements='提出燃燒的氧化學說', description='現代化學之父'
+        )
+        self.priestley = Chemist.objects.create(name='約瑟夫·普利斯特里 Joseph Priestley', description='發現氧氣')
+        HistoricalEvent.objects.create(chemist=self.lavoisier, title='燃燒理論', description='推翻燃素說', year=1777)
+        HistoricalEvent.objects.create(chemist=self.priestley, title='分離出氧氣', description='加熱氧化汞', year=1774)
+
+    def search(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return response.data['data']
+
+    def test_ranks_and_highlights_across_models(self):
+        results = self.search(q='燃燒')
+        self.assertEqual([(row['type'], row['id']) for row in results][0], ('event', self.lavoisier.events.get().id))
+        self.assertEqual(results[0]['title'], '<mark>燃燒</mark>理論')
+        self.assertIn(('chemist', self.lavoisier.id), [(row['type'], row['id']) for row in results])
+        # 「氧」是「氧氣」與「氧化」的前綴
+        self.assertEqual({row['type'] for row in self.search(q='氧', type='event')}, {'event'})
+        self.assertEqual(len(self.search(q='氧')), 3)
+        # 部分拉丁字母姓名也能找到
+        self.assertEqual([row['id'] for row in self.search(q='lavo', type='chemist')], [self.lavoisier.id])
+
+    def test_search_vector_follows_updates_and_deleted_chemists_are_hidden(self):
+        self.lavoisier.description = '也研究了質量守恆'
+        self.lavoisier.save()
+        self.assertEqual([row['id'] for row in self.search(q='質量守恆')], [self.lavoisier.id])
+
+        self.priestley.deleted_at = timezone.now()
+        self.priestley.save(update_fields=['deleted_at'])
+        self.assertFalse([row for row in self.search(q='氧氣') if row['chemist_id'] == self.priestley.id])
+
+    def test_chat_results_are_limited_to_own_conversations(self):
+        owner = User.objects.create_user('owner')
+        mine = Conversation.objects.create(chemist=self.lavoisier, user=owner)
+        other = Conversation.objects.create(chemist=self.lavoisier, user=User.objects.create_user('other'))
+        ChatHistory.objects.create(chemist=self.lavoisier, conversation=mine, role='user', content='請解釋氧化反應')
+        ChatHistory.objects.create(chemist=self.lavoisier, conversation=other, role='user', content='氧化反應是什麼')
+
+        self.assertEqual(self.search(q='氧化反應', type='chat'), [])
+        self.client.force_login(owner)
+        results = self.search(q='氧化反應', type='chat')
+        self.assertEqual([row['conversation_id'] for row in results], [str(mine.id)])
+        self.assertEqual(results[0]['snippet'], '請解釋<mark>氧化反應</mark>')
+
+    def test_pages_through_union_with_cursor(self):
+        for year in range(1780, 1790):
+            HistoricalEvent.objects.create(chemist=self.lavoisier, title=f'{year} 年的燃燒實驗', year=year)
+        seen = []
+        response = self.client.get(self.url, {'q': '燃燒', 'page_size': 4})
+        while True:
+            seen += [(row['type'], row['id']) for row in response.data['data']]
+            if not response.data['pagination']['next']:
+                break
+            response = self.client.get(response.data['pagination']['next'])
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(seen, [(row['type'], row['id']) for row in self.search(q='燃燒', page_size=100)])
+
+    def test_rejects_invalid_queries(self):
+        for params in ({}, {'q': ' '}, {'q': '氧' * 101}, {'q': '氧', 'type': 'user'}, {'q': '氧', 'cursor': 'bad'}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+            self.assertEqual(response.data['status'], 'error')
+
@@ -0,0 +1,162 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from api.services import single_flight as single_flight_module
+from api.services.concurrency import UpstreamBusy
+from api.services.single_flight import LeaderFailed, SingleFlight
+import asyncio
+import fakeredis
+import threading
+
+
+@override_settings(AI_SINGLE_FLIGHT_ENABLED=True, AI_SINGLE_FLIGHT_TIMEOUT=5, AI_SINGLE_FLIGHT_LOCK_TTL=10)
+class SingleFlightTest(SimpleTestCase):
+    def setUp(self):
+        # Redis 無法使用時退回行程內合併
+        patcher = mock.patch.object(single_flight_module, 'get_redis', side_effect=ConnectionError)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.flight = SingleFlight()
+
+    def test_concurrent_calls_share_one_upstream_call(self):
+        calls = []
+        entered = threading.Event()
+        release = threading.Event()
+
+        def upstream():
+            calls.append(1)
+            entered.set()
+            release.wait(2)
+            return '答案'
+
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            futures = [pool.submit(self.flight.do, 'k', upstream) for _ in range(10)]
+            entered.wait(2)
+            release.set()
+            results = [future.result() for future in futures]
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['答案'] * 10)
+
+    def test_followers_receive_leader_error(self):
+        entered = threading.Event()
+        release = threading.Event()
+
+        def upstream():
+            entered.set()
+            release.wait(2)
+            raise UpstreamBusy(3)
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(self.flight.do, 'k', upstream)
+            entered.wait(2)
+            follower = pool.submit(self.flight.do, 'k', lambda: '不應被呼叫')
+            release.set()
+            with self.assertRaises(UpstreamBusy):
+                leader.result()
+            with self.assertRaises(UpstreamBusy):
+                follower.result()
+
+    def test_stream_follower_gets_all_chunks(self):
+        leader = self.flight.stream('k', lambda: iter(['氧', '氣']))
+        self.assertEqual(next(leader), '氧')
+        follower = self.flight.stream('k', lambda: iter(['不應被呼叫']))
+        self.assertEqual(next(leader), '氣')
+        self.assertEqual(list(leader), [])
+        self.assertEqual(list(follower), ['氧', '氣'])
+
+    def test_new_flight_after_completion(self):
+        self.assertEqual(self.flight.do('k', lambda: '一'), '一')
+        self.assertEqual(self.flight.do('k', lambda: '二'), '二')
+
+    def test_stream_followers_fail_when_leader_disconnects(self):
+        leader = self.flight.stream('k', lambda: iter(['氧', '氣']))
+        self.assertEqual(next(leader), '氧')
+        follower = self.flight.stream('k', lambda: iter(['不應被呼叫']))
+        # 客戶端斷線：leader 的產生器被關閉
+        leader.close()
+        with self.assertRaises(LeaderFailed):
+            list(follower)
+        self.assertEqual(list(self.flight.stream('k', lambda: iter(['新']))), ['新'])
+
+
+@override_settings(AI_SINGLE_FLIGHT_ENABLED=True, AI_SINGLE_FLIGHT_TIMEOUT=5, AI_SINGLE_FLIGHT_LOCK_TTL=10)
+class AsyncSingleFlightTest(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(single_flight_module, 'get_redis', side_effect=ConnectionError)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.flight = SingleFlight()
+
+    async def test_followers_wait_without_threads(self):
+        release = asyncio.Event()
+        calls = []
+
+        async def upstream():
+            calls.append(1)
+            await release.wait()
+            return '答案'
+
+        with mock.patch.object(asyncio, 'to_thread', wraps=asyncio.to_thread) as to_thread:
+            tasks = [asyncio.create_task(self.flight.ado('k', upstream)) for _ in range(10)]
+            await asyncio.sleep(0.05)
+            release.set()
+            results = await asyncio.gather(*tasks)
+        self.assertEqual(results, ['答案'] * 10)
+        self.assertEqual(len(calls), 1)
+        # 只有 leader 取得合併鎖時用到執行緒
+        self.assertEqual(to_thread.call_count, 1)
+
+    async def test_cancelled_leader_releases_flight(self):
+        async def slow():
+            await asyncio.sleep(10)
+            return '不會完成'
+
+        async def fast():
+            return '新答案'
+
+        leader = asyncio.create_task(self.flight.ado('k', slow))
+        await asyncio.sleep(0.05)
+        follower = asyncio.create_task(self.flight.ado('k', fast))
+        await asyncio.sleep(0.05)
+        leader.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+        with self.assertRaises(LeaderFailed):
+            await follower
+        self.assertEqual(await asyncio.wait_for(self.flight.ado('k', fast), 1), '新答案')
+
+
+@override_settings(AI_SINGLE_FLIGHT_ENABLED=True, AI_SINGLE_FLIGHT_TIMEOUT=5, AI_SINGLE_FLIGHT_LOCK_TTL=10)
+class RemoteSingleFlightTest(SimpleTestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        patcher = mock.patch.object(single_flight_module, 'get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.flight = SingleFlight()
+        # 其他行程的 leader 已取得鎖
+        self.redis.set(self.flight._lock_key('k'), 'other')
+        self.stream = self.flight._stream_key('k', 'other')
+
+    async def test_polls_other_process_result(self):
+        async def upstream():
+            raise AssertionError('不應呼叫上游')
+
+        async def publish():
+            await asyncio.sleep(0.15)
+            self.redis.xadd(self.stream, {'t': 'chunk', 'd': '氧'})
+            self.redis.xadd(self.stream, {'t': 'done', 'd': '氧氣'})
+
+        publisher = asyncio.create_task(publish())
+        self.assertEqual(await self.flight.ado('k', upstream), '氧氣')
+        await publisher
+
+    async def test_remote_leader_failure_is_raised(self):
+        self.redis.xadd(self.stream, {'t': 'error', 'e': 'LeaderFailed'})
+
+        async def upstream():
+            raise AssertionError('不應呼叫上游')
+
+        with self.assertRaises(LeaderFailed):
+            await self.flight.ado('k', upstream)
@@ -0,0 +1,69 @@
+from unittest import mock, skipUnless
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from api.models import Chemist, LLMUsageRollup
+from api.services import telemetry
+
+
+@override_settings(AI_USAGE_ROLLUP_ENABLED=True)
+class TelemetryTest(TestCase):
+    def setUp(self):
+        self.chemist = Chemist.objects.create(name='拉瓦錫')
+
+    def test_record_updates_metrics(self):
+        labels = {'chemist': str(self.chemist.id), 'model': 'gpt-test'}
+        # 首字延遲不分模型，其他測試可能已記錄同一個化學家 ID
+        ttfb_count = telemetry.TTFB.count(chemist=str(self.chemist.id), mode='stream')
+        with mock.patch.object(telemetry, 'get_redis', side_effect=ConnectionError):
+            telemetry.record(self.chemist.id, 'gpt-test', 'stream', 1.2, prompt_tokens=300,
+                             completion_tokens=80, ttfb=0.4)
+            telemetry.record(self.chemist.id, 'gpt-test', 'stream', 0.01, cache_hit=True)
+            telemetry.record(self.chemist.id, 'gpt-test', 'stream', 3, error=TimeoutError())
+
+        self.assertEqual(telemetry.REQUESTS.value(mode='stream', cache='miss', **labels), 2)
+        self.assertEqual(telemetry.REQUESTS.value(mode='stream', cache='hit', **labels), 1)
+        self.assertEqual(telemetry.TOKENS.value(kind='prompt', **labels), 300)
+        self.assertEqual(telemetry.TOKENS.value(kind='completion', **labels), 80)
+        self.assertEqual(telemetry.ERRORS.value(mode='stream', error='TimeoutError', **labels), 1)
+        self.assertEqual(telemetry.TTFB.count(chemist=str(self.chemist.id), mode='stream'), ttfb_count + 1)
+
+    def test_upsert_accumulates_hourly_rollup(self):
+        counts = dict.fromkeys(telemetry._FIELDS, 0)
+        counts.update(requests=2, prompt_tokens=500, completion_tokens=120, latency_ms_total=1800)
+        telemetry._upsert(7200, self.chemist.id, 'gpt-test', 'complete', counts)
+        telemetry._upsert(7200, self.chemist.id, 'gpt-test', 'complete', {**counts, 'errors': 1})
+
+        rollup = LLMUsageRollup.objects.get()
+        self.assertEqual(rollup.requests, 4)
+        self.assertEqual(rollup.errors, 1)
+        self.assertEqual(rollup.prompt_tokens, 1000)
+        self.assertEqual(rollup.latency_ms_total, 3600)
+        self.assertEqual(rollup.period_start.timestamp(), 7200)
+
+    def test_deleted_chemist_is_rolled_up_without_reference(self):
+        counts = {**dict.fromkeys(telemetry._FIELDS, 0), 'requests': 1}
+        telemetry._upsert(0, 999, 'gpt-test', 'summary', counts)
+        self.assertIsNone(LLMUsageRollup.objects.get().chemist_id)
+
+    def test_unassigned_usage_has_one_row_per_period(self):
+        counts = {**dict.fromkeys(telemetry._FIELDS, 0), 'requests': 1}
+        telemetry._upsert(0, None, 'gpt-test', 'summary', counts)
+        telemetry._upsert(0, 999, 'gpt-test', 'summary', counts)
+        self.assertEqual(LLMUsageRollup.objects.get().requests, 2)
+
+    @skipUnless(connection.vendor == 'postgresql', '需要 PostgreSQL 15 以上的 NULLS NOT DISTINCT')
+    def test_unique_constraint_treats_null_chemists_as_equal(self):
+        rollup = LLMUsageRollup.objects.create(period_start=timezone.now(), model='gpt-test', mode='summary')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            LLMUsageRollup.objects.create(period_start=rollup.period_start, model='gpt-test', mode='summary')
+
+    def test_deleting_chemist_merges_usage_into_unassigned_rows(self):
+        counts = {**dict.fromkeys(telemetry._FIELDS, 0), 'requests': 3, 'prompt_tokens': 100}
+        telemetry._upsert(3600, None, 'gpt-test', 'complete', counts)
+        telemetry._upsert(3600, self.chemist.id, 'gpt-test', 'complete', counts)
+        telemetry._upsert(7200, self.chemist.id, 'gpt-test', 'complete', counts)
+
+        self.chemist.delete()
+        rows = list(LLMUsageRollup.objects.order_by('period_start').values_list('chemist_id', 'requests', 'prompt_tokens'))
+        self.assertEqual(rows, [(None, 6, 200), (None, 3, 100)])
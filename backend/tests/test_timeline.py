@@ -0,0 +1,78 @@
+from unittest import skipUnless
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from api.models import Chemist, HistoricalEvent
+from api.services import timeline
+
+
+class DecadeTest(SimpleTestCase):
+    def test_decade_of_rounds_down(self):
+        self.assertEqual(timeline.decade_of(1789), 1780)
+        self.assertEqual(timeline.decade_of(1780), 1780)
+        self.assertEqual(timeline.decade_of(-5), -10)
+
+
+@skipUnless(connection.vendor == 'postgresql', '需要 PostgreSQL 的 int4range')
+class TimelineAPITest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse('timeline')
+        self.lavoisier = Chemist.objects.create(name='拉瓦錫', birth_year=1743, death_year=1794)
+        self.dalton = Chemist.objects.create(name='道耳頓', birth_year=1766, death_year=1844)
+        self.curie = Chemist.objects.create(name='居禮夫人', birth_year=1867, death_year=1934)
+        # 卒年未知視為一直在世
+        self.unknown = Chemist.objects.create(name='無名氏', birth_year=1850, death_year=None)
+        self.combustion = HistoricalEvent.objects.create(chemist=self.lavoisier, title='燃燒理論', year=1777)
+        self.atoms = HistoricalEvent.objects.create(chemist=self.dalton, title='原子理論', year=1803)
+
+    def get(self, start, end):
+        response = self.client.get(self.url, {'from': start, 'to': end})
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return response.data['data']
+
+    def test_groups_overlapping_chemists_and_events_by_decade(self):
+        data = self.get(1795, 1810)
+        self.assertEqual([chemist['id'] for chemist in data['chemists']], [self.dalton.id])
+        self.assertEqual([decade['decade'] for decade in data['decades']], [1790, 1800, 1810])
+        self.assertEqual(data['decades'][1]['events'][0]['id'], self.atoms.id)
+        self.assertEqual(data['decades'][0]['chemist_ids'], [self.dalton.id])
+
+        data = self.get(1770, 1779)
+        self.assertEqual([chemist['id'] for chemist in data['chemists']], [self.lavoisier.id, self.dalton.id])
+        self.assertEqual([event['title'] for event in data['decades'][0]['events']], ['燃燒理論'])
+
+        self.assertEqual({chemist['id'] for chemist in self.get(1990, 2000)['chemists']}, {self.unknown.id})
+
+    def test_cached_decades_are_reused_and_writes_invalidate(self):
+        self.get(1770, 1810)
+        with CaptureQueriesContext(connection) as queries:
+            data = self.get(1775, 1805)
+        self.assertEqual(len(queries.captured_queries), 0)
+        self.assertEqual([event['id'] for decade in data['decades'] for event in decade['events']],
+                         [self.combustion.id, self.atoms.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            HistoricalEvent.objects.create(chemist=self.lavoisier, title='質量守恆', year=1789)
+        titles = [event['title'] for decade in self.get(1775, 1805)['decades'] for event in decade['events']]
+        self.assertEqual(titles, ['燃燒理論', '質量守恆', '原子理論'])
+
+    def test_deleted_chemists_disappear_immediately(self):
+        self.get(1770, 1779)
+        response = self.client.delete(reverse('scientist-detail', args=[self.lavoisier.id]))
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        data = self.get(1770, 1779)
+        self.assertEqual([chemist['id'] for chemist in data['chemists']], [self.dalton.id])
+        self.assertEqual([event for decade in data['decades'] for event in decade['events']], [])
+
+    def test_rejects_invalid_ranges(self):
+        for params in ({}, {'from': 1800}, {'from': 'x', 'to': 1900}, {'from': 1900, 'to': 1800},
+                       {'from': 0, 'to': 5000}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+            self.assertEqual(response.data['status'], 'error')